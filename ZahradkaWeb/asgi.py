@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ZahradkaWeb.settings')
+# Async views for the read-heavy pages, see ASGI in settings.py
+os.environ.setdefault('ZAHRADKA_ASGI', '1')
 
 application = get_asgi_application()
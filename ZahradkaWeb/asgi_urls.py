@@ -0,0 +1,14 @@
+"""
+URL configuration under ASGI (settings.ASGI).
+
+The same routes as ZahradkaWeb.urls, the read-heavy gardening pages are served
+by their async variants from gardening/async_views.py.
+"""
+from django.urls import include, path
+
+from ZahradkaWeb import urls
+
+urlpatterns = [
+    path('gardening/', include('gardening.async_urls')) if str(pattern.pattern) == 'gardening/' else pattern
+    for pattern in urls.urlpatterns
+]
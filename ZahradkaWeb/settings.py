@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 
@@ -45,7 +46,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its latency covers the rest of the middleware too
+    'gardening.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # Static files are answered before sessions and auth are loaded
+    'gardening.assets.StaticFilesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -54,11 +59,17 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'ZahradkaWeb.urls'
+# asgi.py sets ZAHRADKA_ASGI=1, the read-heavy pages are then served by async
+# views (gardening/async_views.py) and database connections are not kept between
+# requests, every ASGI request runs its queries on a thread of its own
+ASGI = os.environ.get('ZAHRADKA_ASGI') == '1'
+
+ROOT_URLCONF = 'ZahradkaWeb.asgi_urls' if ASGI else 'ZahradkaWeb.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates that reports render time to the request metrics
+        'BACKEND': 'gardening.template_backend.TimedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -77,10 +88,23 @@ WSGI_APPLICATION = 'ZahradkaWeb.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Production SQLite profile: django.db.backends.sqlite3 with write transactions
+# serialised per process (gardening/sqlite/base.py), WAL and other PRAGMAs from
+# SQLITE_PRAGMAS below. For plain SQLite use ENGINE 'django.db.backends.sqlite3'
+# and SQLITE_PRAGMAS = {}.
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'gardening.sqlite',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Connections are reused by the same worker thread instead of opened per request
+        'CONN_MAX_AGE': 0 if ASGI else 60,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Transactions take the write lock up front, a deferred transaction that
+            # reads first cannot upgrade to a writer once another one has committed
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
@@ -121,6 +145,148 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# collectstatic target, served by gardening.assets.StaticFilesMiddleware
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# Hashed file names for far-future caching, plus gzip (and brotli when the brotli
+# package is installed) variants written by collectstatic
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'gardening.assets.CompressedManifestStaticFilesStorage'},
+}
+
+# AI recommendations
+# Provider class used by the recommendation worker and the number of jobs it runs in parallel
+
+AI_RECOMMENDATION_PROVIDER = 'gardening.recommendations.StubProvider'
+
+AI_RECOMMENDATION_WORKERS = 2
+
+# Recommendations are reused while the plant state (type, planting date, newest notes) is unchanged
+AI_RECOMMENDATION_CACHE_TTL = 7 * 24 * 60 * 60
+
+AI_RECOMMENDATION_CACHE_SIZE = 1024
+
+
+# Image uploads
+# In the garden, plant and note forms (gardening.uploads.image_uploads) files are streamed
+# to a temporary file with a size limit, the image header is checked while uploading and
+# originals are rotated, stripped of EXIF and downscaled once at ingest
+
+IMAGE_UPLOAD_MAX_BYTES = 10 * 1024 * 1024
+
+# Per form field overrides of IMAGE_UPLOAD_MAX_BYTES, e.g. {'image': 5 * 1024 * 1024}
+IMAGE_UPLOAD_FIELD_MAX_BYTES = {}
+
+IMAGE_UPLOAD_MAX_PIXELS = 40_000_000
+
+IMAGE_UPLOAD_MAX_DIMENSION = 2560
+
+# Serving uploaded images (gardening/media.py). MEDIA_ACCEL hands the file to the
+# reverse proxy instead of streaming it from Python:
+#   'x-accel-redirect'  nginx, MEDIA_ACCEL_PREFIX is an internal location aliased to MEDIA_ROOT
+#   'x-sendfile'        Apache mod_xsendfile, lighttpd
+MEDIA_ACCEL = None
+
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+
+# Browsers reuse an image this long, then revalidate it with If-None-Match
+MEDIA_CACHE_MAX_AGE = 60 * 60
+
+# Image variants
+# Widths of the generated thumbnails (ascending), rendered by a background process pool
+
+IMAGE_VARIANT_WIDTHS = (200, 480, 960)
+
+IMAGE_VARIANT_QUALITY = 80
+
+IMAGE_VARIANT_WORKERS = 2
+
+IMAGE_VARIANTS_ASYNC = True
+
+# Deleted gardens and plants (gardening/deletion.py)
+# Rows deleted per transaction by the background purge; False purges right after the commit
+
+DELETION_BATCH_SIZE = 500
+
+DELETION_ASYNC = True
+
+
+# Request metrics (gardening/metrics.py), exposed at /metrics in Prometheus text format
+
+METRICS_ENABLED = True
+
+# Addresses allowed to read /metrics, None allows everyone
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
+# Requests slower than this many seconds are logged to gardening.slow_requests
+# together with their slowest SQL queries. None turns the log off.
+METRICS_SLOW_REQUEST_SECONDS = None
+
+METRICS_SLOW_REQUEST_QUERIES = 20
+
+
+# Cache of garden pages (gardening/caching.py). Local memory works for a single
+# process, with several worker processes use a shared backend, e.g.
+# 'django.core.cache.backends.filebased.FileBasedCache' with LOCATION BASE_DIR / 'cache'.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'zahradka',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+GARDEN_CACHE_ALIAS = 'default'
+
+# Entries are invalidated by version bumps, the timeout only bounds memory and stale reads
+GARDEN_CACHE_TIMEOUT = 10 * 60
+
+
+# Sessions and the logged-in user (gardening/auth.py)
+# ZAHRADKA_SESSIONS selects the session profile:
+#   cached_db       sessions are read from the cache and written through to the database,
+#                   a request with a warm cache runs no session query (needs a shared
+#                   cache with several worker processes, see CACHES)
+#   signed_cookies  the session lives in a signed cookie and never touches the database,
+#                   it is readable by the client and cannot be revoked on the server
+#   db              Django's default, one query per request
+
+SESSION_ENGINE = {
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+    'db': 'django.contrib.sessions.backends.db',
+}[os.environ.get('ZAHRADKA_SESSIONS', 'cached_db')]
+
+SESSION_CACHE_ALIAS = 'default'
+
+# The user row is kept in process memory and reloaded when the user, their groups or
+# permissions change. The timeout bounds how long a missed invalidation can last.
+AUTHENTICATION_BACKENDS = ['gardening.auth.CachedModelBackend']
+
+AUTH_USER_CACHE_SIZE = 1024
+
+AUTH_USER_CACHE_TIMEOUT = 60
+
+
+# SQLite tuning (gardening/sqlite/__init__.py), applied to every new connection.
+# An empty dict keeps SQLite defaults, e.g. for a development profile.
+
+SQLITE_PRAGMAS = {
+    # Readers do not block the writer and the writer does not block readers
+    'journal_mode': 'WAL',
+    # Durable with WAL, fsync happens at checkpoints instead of every commit
+    'synchronous': 'NORMAL',
+    # Milliseconds a writer waits for the lock before "database is locked"
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    # Negative is KiB, i.e. 64 MiB of page cache per connection
+    'cache_size': -64 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -18,14 +18,17 @@ from django.contrib import admin
 from django.shortcuts import redirect
 from django.urls import path, include
 from django.conf import settings
-from django.conf.urls.static import static
+
+from gardening.views import media_view, metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     # Include URLs from the gardening app
     path('gardening/', include('gardening.urls')),
+    # Versioned JSON API, a new version gets its own prefix
+    path('api/v1/', include('gardening.api_urls')),
+    path('metrics', metrics_view, name='metrics'),
+    # Uploaded images with access checks, also outside DEBUG
+    path(f"{settings.MEDIA_URL.strip('/')}/<path:name>", media_view, name='media'),
     path('', lambda request: redirect('gardening/', permanent=True)),
 ]
-
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
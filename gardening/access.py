@@ -0,0 +1,136 @@
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.contrib.auth.decorators import login_required
+from django.http import Http404
+from django.shortcuts import get_object_or_404, redirect
+
+from gardening import caching
+from gardening.models import Garden, Plant, garden_guest_exists
+
+OWNER = 'owner'
+GUEST = 'guest'
+NONE = None
+
+_CACHE_ATTR = '_garden_access_cache'
+
+
+# Vztah přihlášeného uživatele k jedné zahrádce (owner / guest / none)
+class GardenAccess:
+    __slots__ = ('garden', 'level')
+
+    def __init__(self, garden, level):
+        self.garden = garden
+        self.level = level
+
+    @property
+    def is_owner(self):
+        return self.level == OWNER
+
+    @property
+    def can_view(self):
+        return self.level is not NONE
+
+    # Guests may edit garden content, only the owner manages guests and deletion
+    @property
+    def can_edit(self):
+        return self.can_view
+
+
+def _access_cache(request):
+    cache = getattr(request, _CACHE_ATTR, None)
+    if cache is None:
+        cache = {}
+        setattr(request, _CACHE_ATTR, cache)
+    return cache
+
+
+# Garden must come from Garden.objects.with_access() so is_guest is annotated.
+# Async views pass the user, request.user cannot be loaded lazily there.
+def remember_garden_access(request, garden, user=None):
+    user = request.user if user is None else user
+    if garden.owner_id == user.pk:
+        level = OWNER
+    elif getattr(garden, 'is_guest', False):
+        level = GUEST
+    else:
+        level = NONE
+    access = GardenAccess(garden, level)
+    _access_cache(request)[garden.pk] = access
+    return access
+
+
+# One query per garden and request, later lookups are served from the request.
+# Across requests the garden is cached per user under the garden version, which
+# guest changes bump, so a revoked guest loses access immediately.
+def get_garden_access(request, garden_id):
+    garden_id = int(garden_id)
+    cache = _access_cache(request)
+    access = cache.get(garden_id)
+    if access is None:
+        garden = caching.cached(
+            'garden_access', caching.garden_version(garden_id), (garden_id, request.user.pk),
+            lambda: Garden.objects.with_access(request.user).filter(pk=garden_id).first(),
+        )
+        if garden is None:
+            raise Http404('No Garden matches the given query.')
+        access = remember_garden_access(request, garden)
+    return access
+
+
+async def aget_garden_access(request, garden_id):
+    garden_id = int(garden_id)
+    cache = _access_cache(request)
+    access = cache.get(garden_id)
+    if access is None:
+        user = await request.auser()
+        garden = await caching.acached(
+            'garden_access', await caching.aget_version(caching.GARDEN, garden_id), (garden_id, user.pk),
+            lambda: Garden.objects.with_access(user).filter(pk=garden_id).afirst(),
+        )
+        if garden is None:
+            raise Http404('No Garden matches the given query.')
+        access = remember_garden_access(request, garden, user)
+    return access
+
+
+def _plant_with_access(user):
+    return Plant.objects.select_related('garden').annotate(
+        garden_is_guest=garden_guest_exists(user, 'garden_id'),
+    )
+
+
+# Plant together with the access to its garden, still a single query
+def get_plant_access(request, plant_id):
+    plant = get_object_or_404(_plant_with_access(request.user), pk=plant_id)
+    plant.garden.is_guest = plant.garden_is_guest
+    return plant, remember_garden_access(request, plant.garden)
+
+
+async def aget_plant_access(request, plant_id):
+    user = await request.auser()
+    plant = await _plant_with_access(user).filter(pk=plant_id).afirst()
+    if plant is None:
+        raise Http404('No Plant matches the given query.')
+    plant.garden.is_guest = plant.garden_is_guest
+    return plant, remember_garden_access(request, plant.garden, user)
+
+
+# Users without access to the garden are redirected to the dashboard
+def garden_access_required(view_func):
+    if iscoroutinefunction(view_func):
+        @login_required
+        @wraps(view_func)
+        async def _awrapped(request, garden_id, *args, **kwargs):
+            if not (await aget_garden_access(request, garden_id)).can_view:
+                return redirect('dashboard')
+            return await view_func(request, garden_id, *args, **kwargs)
+        return _awrapped
+
+    @login_required
+    @wraps(view_func)
+    def _wrapped(request, garden_id, *args, **kwargs):
+        if not get_garden_access(request, garden_id).can_view:
+            return redirect('dashboard')
+        return view_func(request, garden_id, *args, **kwargs)
+    return _wrapped
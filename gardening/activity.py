@@ -0,0 +1,99 @@
+from django.db.models import CharField, Exists, F, IntegerField, OuterRef, Value
+
+from gardening.models import AIRecommendation, Note, Plant
+from gardening.pagination import keyset_union_page
+
+# Aktivita zahrádky: poznámky a AI doporučení všech jejích rostlin v jedné
+# časové ose. Obě tabulky se čtou jedním dotazem UNION ALL stránkovaným
+# kurzorem na (čas, id, druh). Malá zahrádka si své záznamy najde přes
+# rostliny a seřadí je, velká čte časový index od kurzoru a příslušnost
+# ověřuje přes EXISTS, takže stránka stojí stejně i u desítek tisíc poznámek.
+# Poznámka u více rostlin je v ose jen jednou.
+
+NOTE = 'note'
+RECOMMENDATION = 'recommendation'
+
+# Ids of the two tables overlap, the kind keeps the order total. It goes last so
+# every branch is ordered by its (created_at, id) index without sorting.
+FIELDS = ('timestamp', 'entry_id', 'kind')
+
+
+# Up to this many note links the garden's rows are collected through its plants and
+# sorted. A larger garden reads the newest rows of all gardens and keeps its own,
+# which stops after one page instead of reading every link first, but costs more
+# for a garden whose rows are rare among all of them.
+LARGE_GARDEN_LINKS = 5000
+
+
+def _is_large(garden_id):
+    links = Note.plant.through.objects.filter(plant__garden_id=garden_id)
+    return links[:LARGE_GARDEN_LINKS].count() == LARGE_GARDEN_LINKS
+
+
+# Both forms are semi-joins, a note of several plants is one row. Plants waiting for
+# the purge (gardening/deletion.py) are left out, here and below.
+def _notes(garden_id, large):
+    if large:
+        notes = Note.objects.filter(Exists(
+            Note.plant.through.objects.filter(note_id=OuterRef('pk'), plant__garden_id=garden_id, plant__deleted_at=None),
+        ))
+    else:
+        notes = Note.objects.filter(pk__in=Note.plant.through.objects.filter(
+            plant__garden_id=garden_id, plant__deleted_at=None,
+        ).values('note_id'))
+    return notes.values(
+        timestamp=F('created_at'),
+        kind=Value(NOTE, CharField()),
+        entry_id=F('id'),
+        text=F('content'),
+        image_name=F('image'),
+        entry_plant_id=Value(None, IntegerField()),
+        entry_plant_name=Value(None, CharField()),
+    )
+
+
+def _recommendations(garden_id, large):
+    if large:
+        recommendations = AIRecommendation.objects.filter(Exists(
+            Plant.objects.filter(pk=OuterRef('plant_id'), garden_id=garden_id),
+        ))
+    else:
+        recommendations = AIRecommendation.objects.filter(plant__garden_id=garden_id, plant__deleted_at=None)
+    return recommendations.values(
+        timestamp=F('created_at'),
+        kind=Value(RECOMMENDATION, CharField()),
+        entry_id=F('id'),
+        text=F('recommendation'),
+        image_name=Value('', CharField()),
+        entry_plant_id=F('plant_id'),
+        entry_plant_name=F('plant__name'),
+    )
+
+
+# Plants of the garden every note on the page belongs to, one query for the page
+def _attach_plants(garden_id, entries):
+    notes = {entry['entry_id']: entry for entry in entries if entry['kind'] == NOTE}
+    image_field = Note._meta.get_field('image')
+    for entry in entries:
+        if entry['kind'] == NOTE:
+            entry['plants'] = []
+            entry['image'] = image_field.attr_class(None, image_field, entry['image_name']) if entry['image_name'] else None
+        else:
+            entry['plants'] = [(entry['entry_plant_id'], entry['entry_plant_name'])]
+            entry['image'] = None
+    links = Note.plant.through.objects.filter(
+        note_id__in=list(notes), plant__garden_id=garden_id, plant__deleted_at=None,
+    ).order_by('plant__name', 'plant_id').values_list('note_id', 'plant_id', 'plant__name')
+    for note_id, plant_id, plant_name in links:
+        notes[note_id]['plants'].append((plant_id, plant_name))
+
+
+# One page of the timeline, newest first. Entries are dicts with timestamp, kind, text,
+# image (notes) and plants as (id, name) pairs.
+def garden_activity(garden_id, cursor, size):
+    large = _is_large(garden_id)
+    page = keyset_union_page(
+        [_notes(garden_id, large), _recommendations(garden_id, large)], FIELDS, cursor, size, descending=True,
+    )
+    _attach_plants(garden_id, page.items)
+    return page
@@ -1,5 +1,39 @@
+from functools import reduce
+from operator import or_
+
 from django.contrib import admin
-from .models import Garden, Plant, Note, AIRecommendation, PlantType
+from django.db.models import Q
+from django.utils.text import smart_split, unescape_string_literal
+
+from .models import Garden, Plant, Note, AIRecommendation, PlantType, RecommendationJob
+from . import search
+
+# Admin search uses the fulltext index instead of icontains scans when it is available.
+# search_fields the index does not cover are still searched with icontains.
+class FulltextSearchMixin:
+    search_kind = None
+    fulltext_fields = ()
+
+    def _other_fields_condition(self, request, search_term):
+        fields = [field for field in self.get_search_fields(request) if field not in self.fulltext_fields]
+        if not fields:
+            return None
+        condition = Q()
+        for bit in smart_split(search_term):
+            if bit.startswith(('"', "'")) and bit[0] == bit[-1]:
+                bit = unescape_string_literal(bit)
+            condition &= reduce(or_, (Q(**{f'{field}__icontains': bit}) for field in fields))
+        return condition
+
+    def get_search_results(self, request, queryset, search_term):
+        ids = search.matching_ids(self.search_kind, search_term)
+        if ids is None:
+            return super().get_search_results(request, queryset, search_term)
+        condition = Q(pk__in=ids)
+        other = self._other_fields_condition(request, search_term)
+        if other is not None:
+            condition |= other
+        return queryset.filter(condition), other is not None
 
 # # Register your models here.
 # admin.site.register(Garden)
@@ -10,10 +44,10 @@ from .models import Garden, Plant, Note, AIRecommendation, PlantType
 
 @admin.register(Garden)
 class GardenAdmin(admin.ModelAdmin):
-    list_display = ('id', 'name', 'description', 'owner', 'image')  # Display key fields
+    list_display = ('id', 'name', 'description', 'owner', 'plant_count', 'note_count', 'image')  # Display key fields
     search_fields = ('name', 'description', 'owner__username')  # Enable search by name, description, and owner
     list_filter = ('owner',)  # Filter by owner
-    filter_horizontal = ('users_with_access',)  # Add horizontal filter for ManyToManyField
+    autocomplete_fields = ('owner', 'users_with_access')  # Search users instead of listing all of them
 
 @admin.register(PlantType)
 class PlantTypeAdmin(admin.ModelAdmin):
@@ -21,13 +55,17 @@ class PlantTypeAdmin(admin.ModelAdmin):
     search_fields = ('name',)  # Enable search by name
 
 @admin.register(Plant)
-class PlantAdmin(admin.ModelAdmin):
-    list_display = ('id', 'name', 'plant_type', 'garden', 'planted_date', 'image')  # Display key fields
+class PlantAdmin(FulltextSearchMixin, admin.ModelAdmin):
+    search_kind = search.KIND_PLANT
+    fulltext_fields = ('name', 'plant_type__name')
+    list_display = ('id', 'name', 'plant_type', 'garden', 'planted_date', 'note_count', 'image')  # Display key fields
     search_fields = ('name', 'plant_type__name', 'garden__name')  # Enable search by name, plant type, and garden
     list_filter = ('plant_type', 'garden', 'planted_date')  # Filter by plant type, garden, and planted date
 
 @admin.register(Note)
-class NoteAdmin(admin.ModelAdmin):
+class NoteAdmin(FulltextSearchMixin, admin.ModelAdmin):
+    search_kind = search.KIND_NOTE
+    fulltext_fields = ('content', 'plant__name')
     list_display = ('id', 'get_plants', 'date', 'content', 'image')  # Display key fields
     search_fields = ('content', 'plant__name')  # Enable search by content and plant name
     list_filter = ('date',)  # Filter by date
@@ -40,4 +78,10 @@ class NoteAdmin(admin.ModelAdmin):
 class AIRecommendationAdmin(admin.ModelAdmin):
     list_display = ('id', 'plant', 'recommendation', 'created_at')  # Display key fields
     search_fields = ('recommendation', 'plant__name')  # Enable search by recommendation and plant name
-    list_filter = ('created_at',)  # Filter by creation date
\ No newline at end of file
+    list_filter = ('created_at',)  # Filter by creation date
+
+@admin.register(RecommendationJob)
+class RecommendationJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'plant', 'status', 'requested_by', 'created_at', 'finished_at')  # Display key fields
+    list_filter = ('status',)  # Filter by job status
+    raw_id_fields = ('plant', 'requested_by', 'recommendation')  # Avoid loading every row into select boxes
\ No newline at end of file
@@ -0,0 +1,409 @@
+import hashlib
+import json
+from functools import wraps
+from operator import attrgetter
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, OuterRef, Prefetch, Subquery, prefetch_related_objects
+from django.http import Http404, HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers, quote_etag
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import require_safe
+
+from gardening import caching, plant_types
+from gardening.access import get_garden_access, get_plant_access
+from gardening.models import AIRecommendation, Garden, Note, Plant, PlantType
+from gardening.pagination import keyset_page, page_url
+
+# JSON API pro mobilní a kioskové klienty (/api/v1/), jen pro čtení a se stejnými
+# přístupovými právy jako HTML stránky. fields= vybírá sloupce (.only()),
+# include= přibalí související objekty v jednom dotazu na typ, výpisy se stránkují
+# kurzorem. Hotové odpovědi se cachují pod verzí zahrádky, uživatele nebo typů
+# rostlin, ETag je otisk těla, takže opakovaný dotaz stojí jen kontrolu přístupu.
+
+API_VERSION = 1
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# Plants included with each listed garden
+INCLUDED_PLANTS_LIMIT = 20
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+# Model columns the value needs (loaded with .only()) and how it is read
+class Field:
+    __slots__ = ('columns', 'value')
+
+    def __init__(self, columns, value):
+        self.columns = columns
+        self.value = value
+
+
+def _column(name):
+    return Field((name,), attrgetter(name))
+
+
+def _image(name):
+    def value(obj):
+        image = getattr(obj, name)
+        return image.url if image else None
+    return Field((name,), value)
+
+
+class Resource:
+    def __init__(self, type_name, model, fields, ordering, descending=False):
+        self.type_name = type_name
+        self.model = model
+        self.fields = fields
+        self.ordering = ordering
+        self.descending = descending
+
+    # Requested field names, 'id' always, all of them when nothing is requested
+    def select(self, requested):
+        if not requested:
+            return list(self.fields)
+        unknown = [name for name in requested if name not in self.fields]
+        if unknown:
+            raise ApiError(f'Unknown {self.type_name} fields: {", ".join(unknown)}.')
+        return ['id', *(name for name in self.fields if name in requested and name != 'id')]
+
+    # Only the columns of the requested fields, the ordering (for cursors) and extra_columns
+    def queryset(self, names, extra_columns=(), queryset=None):
+        columns = {column for name in names for column in self.fields[name].columns}
+        columns.update(self.ordering, extra_columns)
+        queryset = self.model.objects.all() if queryset is None else queryset
+        return queryset.only(*sorted(columns))
+
+    def serialize(self, obj, names):
+        return {name: self.fields[name].value(obj) for name in names}
+
+
+GARDENS = Resource('gardens', Garden, {
+    'id': _column('id'),
+    'name': _column('name'),
+    'description': _column('description'),
+    'owner': _column('owner_id'),
+    'image': _image('image'),
+    'updated_at': _column('updated_at'),
+    'plant_count': _column('plant_count'),
+    'note_count': _column('note_count'),
+    'last_note_at': _column('last_note_at'),
+    'last_recommendation_at': _column('last_recommendation_at'),
+}, ordering=('name', 'id'))
+
+PLANTS = Resource('plants', Plant, {
+    'id': _column('id'),
+    'name': _column('name'),
+    'garden': _column('garden_id'),
+    'plant_type': _column('plant_type_id'),
+    'planted_date': _column('planted_date'),
+    'image': _image('image'),
+    'updated_at': _column('updated_at'),
+    'note_count': _column('note_count'),
+    'last_note_at': _column('last_note_at'),
+    'last_recommendation_at': _column('last_recommendation_at'),
+}, ordering=('name', 'id'))
+
+NOTES = Resource('notes', Note, {
+    'id': _column('id'),
+    'date': _column('date'),
+    'created_at': _column('created_at'),
+    'content': _column('content'),
+    'image': _image('image'),
+    'updated_at': _column('updated_at'),
+}, ordering=('date', 'id'), descending=True)
+
+RECOMMENDATIONS = Resource('recommendations', AIRecommendation, {
+    'id': _column('id'),
+    'plant': _column('plant_id'),
+    'recommendation': _column('recommendation'),
+    'created_at': _column('created_at'),
+}, ordering=('created_at', 'id'), descending=True)
+
+PLANT_TYPES = Resource('plant_types', PlantType, {
+    'id': _column('id'),
+    'name': _column('name'),
+}, ordering=('name', 'id'))
+
+
+# Related objects of a whole page loaded at once. load(objects, queryset, scope) yields
+# (object pk, related object) pairs, queryset is the related resource with its
+# requested fields plus related_columns. columns must be loaded on the objects
+# themselves, prepare may annotate their queryset.
+class Include:
+    def __init__(self, resource, load, many=False, columns=(), related_columns=(), prepare=None):
+        self.resource = resource
+        self.load = load
+        self.many = many
+        self.columns = columns
+        self.related_columns = related_columns
+        self.prepare = prepare
+
+
+def _to_one(attribute):
+    def load(objects, queryset, scope):
+        related = queryset.in_bulk({getattr(obj, attribute) for obj in objects} - {None})
+        for obj in objects:
+            if getattr(obj, attribute) in related:
+                yield obj.pk, related[getattr(obj, attribute)]
+    return load
+
+
+# The first plants of every garden on the page, the rest are paged through /gardens/<id>/plants/.
+# Sliced prefetch: one query with a window function, however many plants the gardens have.
+def _garden_plants(gardens, queryset, scope):
+    plants = queryset.order_by('name', 'id')[:INCLUDED_PLANTS_LIMIT]
+    prefetch_related_objects(gardens, Prefetch('plants', queryset=plants, to_attr='included_plants'))
+    return ((garden.pk, plant) for garden in gardens for plant in garden.included_plants)
+
+
+def _note_plants(notes, queryset, scope):
+    # Only plants of the garden being read, a note may be linked to plants elsewhere
+    plants = queryset.filter(notes__in=[note.pk for note in notes], garden=scope).annotate(note_id=F('notes'))
+    return ((plant.note_id, plant) for plant in plants.order_by('name', 'id'))
+
+
+def _with_latest_recommendation(queryset):
+    latest = AIRecommendation.objects.filter(plant=OuterRef('pk')).order_by('-created_at', '-id')
+    return queryset.annotate(latest_recommendation_id=Subquery(latest.values('pk')[:1]))
+
+
+GARDEN_INCLUDES = {
+    'plants': Include(PLANTS, _garden_plants, many=True, related_columns=('garden_id',)),
+}
+
+PLANT_INCLUDES = {
+    'garden': Include(GARDENS, _to_one('garden_id'), columns=('garden_id',)),
+    'plant_type': Include(PLANT_TYPES, _to_one('plant_type_id'), columns=('plant_type_id',)),
+    'latest_recommendation': Include(
+        RECOMMENDATIONS, _to_one('latest_recommendation_id'), prepare=_with_latest_recommendation,
+    ),
+}
+
+NOTE_INCLUDES = {
+    'plants': Include(PLANTS, _note_plants, many=True),
+}
+
+
+def _split(value):
+    return [part for part in (value or '').split(',') if part]
+
+
+# Parsed query string: fields per type, includes, page size and cursor
+class ApiQuery:
+    def __init__(self, request, resource, includes=None):
+        includes = includes or {}
+        self.resource = resource
+        self.include = sorted(set(_split(request.GET.get('include'))))
+        unknown = [name for name in self.include if name not in includes]
+        if unknown:
+            raise ApiError(f'Unknown include: {", ".join(unknown)}.')
+        self.includes = {name: includes[name] for name in self.include}
+        self.fields = {resource.type_name: resource.select(_split(request.GET.get('fields')))}
+        for include in self.includes.values():
+            related = include.resource
+            self.fields[related.type_name] = related.select(_split(request.GET.get(f'fields[{related.type_name}]')))
+        try:
+            self.limit = int(request.GET.get('limit', PAGE_SIZE))
+        except ValueError:
+            raise ApiError('limit must be a number.')
+        if not 1 <= self.limit <= MAX_PAGE_SIZE:
+            raise ApiError(f'limit must be between 1 and {MAX_PAGE_SIZE}.')
+        self.after = request.GET.get('after')
+
+    # Cache key parts, the same query written differently shares the entry
+    def key(self):
+        return (sorted(self.fields.items()), self.include, self.limit, self.after)
+
+    def queryset(self, queryset=None):
+        resource = self.resource
+        columns = [column for include in self.includes.values() for column in include.columns]
+        queryset = resource.queryset(self.fields[resource.type_name], columns, queryset)
+        for include in self.includes.values():
+            if include.prepare:
+                queryset = include.prepare(queryset)
+        return queryset
+
+    def document(self, objects, scope=None, many=True):
+        resource = self.resource
+        names = self.fields[resource.type_name]
+        data = [resource.serialize(obj, names) for obj in objects]
+        included = {}
+        for name, include in self.includes.items():
+            related = include.resource
+            related_names = self.fields[related.type_name]
+            queryset = related.queryset(related_names, include.related_columns)
+            links = {obj.pk: [] if include.many else None for obj in objects}
+            seen = included.setdefault(related.type_name, {})
+            for pk, related_obj in include.load(objects, queryset, scope):
+                if include.many:
+                    links[pk].append(related_obj.pk)
+                else:
+                    links[pk] = related_obj.pk
+                if related_obj.pk not in seen:
+                    seen[related_obj.pk] = related.serialize(related_obj, related_names)
+            for obj, item in zip(objects, data):
+                item[name] = links[obj.pk]
+        document = {'data': data if many else data[0]}
+        if included:
+            document['included'] = {type_name: list(items.values()) for type_name, items in included.items()}
+        return document
+
+    def page(self, request, queryset, scope=None):
+        resource = self.resource
+        page = keyset_page(
+            self.queryset(queryset), resource.ordering, self.after, self.limit, descending=resource.descending,
+        )
+        document = self.document(page.items, scope)
+        document['next'] = page_url(request, 'after', page.next_cursor) if page.has_next else None
+        return document, page
+
+
+# Compact body and its ETag, cached together
+def _encode(document):
+    body = json.dumps(document, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':')).encode()
+    return body, quote_etag(hashlib.md5(body, usedforsecurity=False).hexdigest())
+
+
+def _response(request, body, etag):
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(body, content_type='application/json')
+        response['ETag'] = etag
+    # Clients revalidate with If-None-Match, shared caches must not store the answer
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ['Cookie'])
+    return response
+
+
+def _error(message, status):
+    return JsonResponse({'error': message}, status=status)
+
+
+# Session authentication like the HTML pages, but errors are JSON instead of redirects.
+# A garden or plant the user cannot see is a 404, as if it did not exist.
+def api_view(view_func):
+    @gzip_page
+    @require_safe
+    @wraps(view_func)
+    def _wrapped(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return _error('Authentication required.', 401)
+        try:
+            return view_func(request, *args, **kwargs)
+        except Http404:
+            return _error('Not found.', 404)
+        except ApiError as error:
+            return _error(str(error), error.status)
+    return _wrapped
+
+
+def _cached_document(name, version, parts, build, depends_on=None):
+    body, etag, _ = caching.cached(f'api{API_VERSION}_{name}', version, parts, build, depends_on)
+    return body, etag
+
+
+def _visible_garden(request, garden_id):
+    access = get_garden_access(request, garden_id)
+    if not access.can_view:
+        raise Http404
+    return access.garden
+
+
+def _visible_plant(request, plant_id):
+    plant, access = get_plant_access(request, plant_id)
+    if not access.can_view:
+        raise Http404
+    return plant
+
+
+@api_view
+def gardens_view(request):
+    query = ApiQuery(request, GARDENS, GARDEN_INCLUDES)
+    user = request.user
+
+    def build():
+        document, page = query.page(request, Garden.objects.accessible_to(user))
+        return (*_encode(document), [garden.pk for garden in page])
+
+    # The list is per user, its entries stay valid while none of the listed gardens changes
+    return _response(request, *_cached_document(
+        'gardens', caching.user_version(user.pk), (user.pk, query.key()), build, depends_on=lambda value: value[2],
+    ))
+
+
+@api_view
+def garden_view(request, garden_id):
+    query = ApiQuery(request, GARDENS, GARDEN_INCLUDES)
+    garden = _visible_garden(request, garden_id)
+
+    def build():
+        return (*_encode(query.document(list(query.queryset().filter(pk=garden.pk)), many=False)), None)
+
+    return _response(request, *_cached_document('garden', caching.garden_version(garden.pk), (garden.pk, query.key()), build))
+
+
+@api_view
+def garden_plants_view(request, garden_id):
+    query = ApiQuery(request, PLANTS, PLANT_INCLUDES)
+    garden = _visible_garden(request, garden_id)
+
+    def build():
+        return (*_encode(query.page(request, Plant.objects.filter(garden=garden))[0]), None)
+
+    return _response(request, *_cached_document(
+        'garden_plants', caching.garden_version(garden.pk), (garden.pk, query.key()), build,
+    ))
+
+
+@api_view
+def plant_view(request, plant_id):
+    query = ApiQuery(request, PLANTS, PLANT_INCLUDES)
+    plant = _visible_plant(request, plant_id)
+
+    def build():
+        return (*_encode(query.document(list(query.queryset().filter(pk=plant.pk)), many=False)), None)
+
+    return _response(request, *_cached_document(
+        'plant', caching.garden_version(plant.garden_id), (plant.pk, query.key()), build,
+    ))
+
+
+@api_view
+def plant_notes_view(request, plant_id):
+    query = ApiQuery(request, NOTES, NOTE_INCLUDES)
+    plant = _visible_plant(request, plant_id)
+
+    def build():
+        return (*_encode(query.page(request, Note.objects.filter(plant=plant), scope=plant.garden_id)[0]), None)
+
+    return _response(request, *_cached_document(
+        'plant_notes', caching.garden_version(plant.garden_id), (plant.pk, query.key()), build,
+    ))
+
+
+@api_view
+def plant_recommendations_view(request, plant_id):
+    query = ApiQuery(request, RECOMMENDATIONS)
+    plant = _visible_plant(request, plant_id)
+
+    def build():
+        return (*_encode(query.page(request, AIRecommendation.objects.filter(plant=plant))[0]), None)
+
+    return _response(request, *_cached_document(
+        'plant_recommendations', caching.garden_version(plant.garden_id), (plant.pk, query.key()), build,
+    ))
+
+
+@api_view
+def plant_types_view(request):
+    query = ApiQuery(request, PLANT_TYPES)
+
+    def build():
+        return (*_encode(query.page(request, PlantType.objects.all())[0]), None)
+
+    return _response(request, *_cached_document('plant_types', plant_types.current_version(), (query.key(),), build))
@@ -0,0 +1,13 @@
+from django.urls import path
+
+from gardening import api
+
+urlpatterns = [
+    path('gardens/', api.gardens_view, name='api_gardens'),
+    path('gardens/<int:garden_id>/', api.garden_view, name='api_garden'),
+    path('gardens/<int:garden_id>/plants/', api.garden_plants_view, name='api_garden_plants'),
+    path('plants/<int:plant_id>/', api.plant_view, name='api_plant'),
+    path('plants/<int:plant_id>/notes/', api.plant_notes_view, name='api_plant_notes'),
+    path('plants/<int:plant_id>/recommendations/', api.plant_recommendations_view, name='api_plant_recommendations'),
+    path('plant-types/', api.plant_types_view, name='api_plant_types'),
+]
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class GardeningConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'gardening'
+
+    def ready(self):
+        from gardening import assets, metrics, signals, sqlite  # noqa: F401
@@ -0,0 +1,190 @@
+import gzip
+import mimetypes
+import os
+import stat
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.checks import Error, Tags, register
+from django.core.exceptions import MiddlewareNotUsed, SuspiciousFileOperation
+from django.http import FileResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Statické soubory bez CDN. Bootstrap a ikony jsou přibalené v gardening/static/vendor,
+# collectstatic jim dá do názvu hash obsahu a vedle uloží gzip (a brotli, je-li
+# nainstalované) varianty. StaticFilesMiddleware je servíruje ze STATIC_ROOT
+# s neomezenou platností v cache prohlížeče a vybírá variantu podle Accept-Encoding.
+
+VENDOR_ROOT = Path(__file__).resolve().parent / 'static' / 'vendor'
+
+# (pinned source URL, path under VENDOR_ROOT). The source maps are listed because
+# the manifest storage follows sourceMappingURL comments and fails on missing files.
+VENDOR_ASSETS = (
+    ('https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css', 'bootstrap/css/bootstrap.min.css'),
+    ('https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css.map',
+     'bootstrap/css/bootstrap.min.css.map'),
+    ('https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js',
+     'bootstrap/js/bootstrap.bundle.min.js'),
+    ('https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js.map',
+     'bootstrap/js/bootstrap.bundle.min.js.map'),
+    ('https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.3/font/bootstrap-icons.min.css',
+     'bootstrap-icons/bootstrap-icons.min.css'),
+    ('https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.3/font/fonts/bootstrap-icons.woff2',
+     'bootstrap-icons/fonts/bootstrap-icons.woff2'),
+    ('https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.3/font/fonts/bootstrap-icons.woff',
+     'bootstrap-icons/fonts/bootstrap-icons.woff'),
+)
+
+# Text formats, fonts and images are compressed already
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.map', '.svg', '.json', '.txt', '.xml', '.html')
+
+# (Content-Encoding, file suffix) in order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+# Hashed names change with their content, anything else may change under the same URL
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+MUTABLE_MAX_AGE = 60
+
+
+# Pages link only the local copies, without them they would render unstyled
+@register(Tags.staticfiles)
+def check_vendor_assets(app_configs, **kwargs):
+    missing = [name for _, name in VENDOR_ASSETS if not (VENDOR_ROOT / name).is_file()]
+    if not missing:
+        return []
+    return [Error(
+        f'Vendored static assets are missing: {", ".join(missing)}',
+        hint='Run "python manage.py vendor_static" and commit gardening/static/vendor.',
+        id='gardening.E001',
+    )]
+
+
+def _compressors():
+    yield '.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0)
+    if brotli is not None:
+        yield '.br', lambda data: brotli.compress(data, mode=brotli.MODE_TEXT, quality=11)
+
+
+# Writes the compressed variants of a file next to it, skipping those that save less than 5 %
+def compress_file(path):
+    if not path.endswith(COMPRESSIBLE_EXTENSIONS):
+        return []
+    with open(path, 'rb') as source:
+        data = source.read()
+    written = []
+    for suffix, compress in _compressors():
+        compressed = compress(data)
+        if len(compressed) < len(data) * 0.95:
+            with open(path + suffix, 'wb') as target:
+                target.write(compressed)
+            written.append(path + suffix)
+    return written
+
+
+# ManifestStaticFilesStorage that also writes pre-compressed variants at collectstatic
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    # Without a manifest, i.e. before collectstatic in development and tests, URLs
+    # keep the plain names instead of failing on every page
+    def stored_name(self, name):
+        if not self.hashed_files:
+            return name
+        return super().stored_name(name)
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+        for name in {*paths, *self.hashed_files.values()}:
+            if self.exists(name):
+                compress_file(self.path(name))
+
+
+def _accepted_encodings(request):
+    accepted = set()
+    for part in request.headers.get('Accept-Encoding', '').split(','):
+        coding, _, params = part.partition(';')
+        name, _, quality = params.partition('=')
+        try:
+            if name.strip() == 'q' and float(quality) == 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+# Serves files collected to STATIC_ROOT before the session and auth middleware run.
+# Requests for anything not found there go on to the rest of the stack, e.g. to the
+# staticfiles finders of runserver in development.
+class StaticFilesMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.STATIC_ROOT:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.root = str(settings.STATIC_ROOT)
+        self.prefix = urlsplit(settings.STATIC_URL).path
+        self.immutable = set(getattr(staticfiles_storage, 'hashed_files', {}).values())
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.serve(request) or self.get_response(request)
+
+    async def __acall__(self, request):
+        return self.serve(request) or await self.get_response(request)
+
+    def serve(self, request):
+        if request.method not in ('GET', 'HEAD') or not request.path.startswith(self.prefix):
+            return None
+        name = request.path[len(self.prefix):]
+        try:
+            path = safe_join(self.root, name)
+            info = os.stat(path)
+        except (SuspiciousFileOperation, OSError, ValueError):
+            return None
+        if not stat.S_ISREG(info.st_mode):
+            return None
+
+        if name in self.immutable:
+            cache_control = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+        else:
+            cache_control = f'public, max-age={MUTABLE_MAX_AGE}'
+        etag = f'"{info.st_mtime_ns:x}-{info.st_size:x}"'
+        compressible = name.endswith(COMPRESSIBLE_EXTENSIONS)
+
+        response = get_conditional_response(request, etag=etag, last_modified=int(info.st_mtime))
+        if response is None:
+            encoding, served = None, path
+            if compressible:
+                accepted = _accepted_encodings(request)
+                for coding, suffix in ENCODINGS:
+                    if coding in accepted and os.path.isfile(path + suffix):
+                        encoding, served = coding, path + suffix
+                        break
+            # The type of the original file, FileResponse would make a .gz application/gzip
+            content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+            response = FileResponse(open(served, 'rb'), content_type=content_type)
+            response.headers.pop('Content-Disposition', None)
+            if encoding:
+                response['Content-Encoding'] = encoding
+            response['Last-Modified'] = http_date(info.st_mtime)
+        response['ETag'] = etag
+        response['Cache-Control'] = cache_control
+        if compressible:
+            patch_vary_headers(response, ['Accept-Encoding'])
+        return response
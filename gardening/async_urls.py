@@ -0,0 +1,16 @@
+from django.urls import path
+
+from gardening import async_views
+from gardening.urls import urlpatterns as sync_urlpatterns
+
+ASYNC_VIEWS = {
+    'dashboard': async_views.dashboard_view,
+    'gardens': async_views.gardens_view,
+    'garden_detail': async_views.garden_detail_view,
+    'plant_recommendations': async_views.plant_recommendations_view,
+}
+
+urlpatterns = [
+    path(str(pattern.pattern), ASYNC_VIEWS[pattern.name], name=pattern.name) if pattern.name in ASYNC_VIEWS else pattern
+    for pattern in sync_urlpatterns
+]
@@ -0,0 +1,189 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.shortcuts import redirect, render
+from django.views.decorators.csrf import csrf_exempt
+
+from gardening import caching, views
+from gardening.access import aget_garden_access, aget_plant_access, garden_access_required
+from gardening.conditional import agarden_last_modified, aplant_last_modified, conditional_page
+from gardening.forms import NoteForm
+from gardening.models import AIRecommendation, Garden, Note, Plant, RecommendationJob, PLANT_PREVIEW_SIZE
+from gardening.pagination import akeyset_page, page_url
+from gardening.views import GARDENS_PAGE_SIZE, NOTES_PAGE_SIZE, PLANTS_PAGE_SIZE
+
+# Asynchronní varianty stránek, které se jen čtou. Pod ASGI (ZahradkaWeb/asgi_urls.py)
+# nahrazují stejnojmenné pohledy z views.py, vracejí stejné stránky a sdílí s nimi
+# cache. Nezávislé dotazy běží souběžně přes asyncio.gather(), šablony se vykreslují
+# mimo event loop, aby nezdržovaly ostatní spojení.
+
+async def _render(request, template_name, context):
+    # Templates read request.user, it is loaded already through request.auser()
+    request.user = await request.auser()
+    return await sync_to_async(render)(request, template_name, context)
+
+
+async def _garden_listing(request, preview_size=PLANT_PREVIEW_SIZE):
+    user = await request.auser()
+    version = await caching.aget_version(caching.USER, user.pk)
+
+    async def listing(key, queryset):
+        cursor = request.GET.get(f'{key}_after')
+        return await caching.acached(
+            f'{key}_gardens', version, (user.pk, preview_size, cursor),
+            lambda: akeyset_page(queryset.for_listing(preview_size), ('name', 'id'), cursor, GARDENS_PAGE_SIZE),
+            depends_on=lambda page: [garden.pk for garden in page],
+        )
+
+    # Owned and shared gardens are independent queries
+    my_page, shared_page = await asyncio.gather(
+        listing('my', Garden.objects.owned_by(user)),
+        listing('shared', Garden.objects.shared_with(user)),
+    )
+    listings = {}
+    for key, page in (('my', my_page), ('shared', shared_page)):
+        listings[f'{key}_gardens'] = page
+        listings[f'{key}_next_url'] = page_url(request, f'{key}_after', page.next_cursor) if page.has_next else None
+    garden_versions = await caching.aget_versions(caching.GARDEN, [garden.pk for garden in (*my_page, *shared_page)])
+    listings.update(caching.fragment_context(caching.versions_token(version, sorted(garden_versions.items()))))
+    return listings
+
+
+@login_required
+async def dashboard_view(request):
+    return await _render(request, 'auth/dashboard.html', await _garden_listing(request, preview_size=0))
+
+
+@login_required
+async def gardens_view(request):
+    return await _render(request, 'gardens/gardens.html', await _garden_listing(request))
+
+
+def _selected_plant_id(request):
+    try:
+        return int(request.GET['plant'])
+    except (KeyError, ValueError):
+        return None
+
+
+def _latest_recommendation(plant_id):
+    return AIRecommendation.objects.filter(plant=plant_id).order_by('-created_at', '-id').afirst()
+
+
+def _has_pending_job(plant_id):
+    return RecommendationJob.objects.filter(
+        plant=plant_id, status__in=[RecommendationJob.PENDING, RecommendationJob.RUNNING],
+    ).aexists()
+
+
+# The plant annotated like Plant.objects.with_latest_recommendation(), so the cache entry
+# is shared with the synchronous view. Its recommendation and job are separate queries here.
+async def _load_selected_plant(plants, plant_id):
+    if plant_id is None:
+        plant = await plants.order_by('name', 'id').afirst()
+        if plant is None:
+            return None
+        latest, has_pending_job = await asyncio.gather(
+            _latest_recommendation(plant.pk), _has_pending_job(plant.pk),
+        )
+    else:
+        plant, latest, has_pending_job = await asyncio.gather(
+            plants.filter(pk=plant_id).afirst(), _latest_recommendation(plant_id), _has_pending_job(plant_id),
+        )
+        if plant is None:
+            return None
+    plant.latest_recommendation_pk = latest.pk if latest else None
+    plant.latest_recommendation_text = latest.recommendation if latest else None
+    plant.latest_recommendation_at = latest.created_at if latest else None
+    plant.has_pending_job = has_pending_job
+    return plant
+
+
+# Exempt here because the middleware would read the POST body before the synchronous
+# view installs its upload handler. That view checks the token itself (uploads.image_uploads).
+@csrf_exempt
+@garden_access_required
+@conditional_page(agarden_last_modified)
+async def garden_detail_view(request, garden_id):
+    if request.method == 'POST':
+        # Writes (notes, AI requests) stay on the synchronous view
+        return await sync_to_async(views.garden_detail_view)(request, garden_id)
+    access = await aget_garden_access(request, garden_id)
+    garden = access.garden
+    plants = Plant.objects.filter(garden=garden)
+    version = await caching.aget_version(caching.GARDEN, garden.pk)
+
+    plants_after = request.GET.get('plants_after')
+    notes_after = request.GET.get('notes_after')
+    selected_plant_id = _selected_plant_id(request)
+
+    def plant_page():
+        return caching.acached('plants', version, (garden.pk, plants_after), lambda: akeyset_page(
+            plants.only('id', 'name', 'garden_id'), ('name', 'id'), plants_after, PLANTS_PAGE_SIZE,
+        ))
+
+    def selected_plant():
+        return caching.acached(
+            'selected_plant', version, (garden.pk, request.GET.get('plant')),
+            lambda: _load_selected_plant(plants, selected_plant_id),
+        )
+
+    def notes(plant_id):
+        # Restricted to the garden, so it can run before the plant is known to belong to it
+        return caching.acached('notes', version, (plant_id, notes_after), lambda: akeyset_page(
+            Note.objects.filter(plant__id=plant_id, plant__garden=garden), ('date', 'id'), notes_after,
+            NOTES_PAGE_SIZE, descending=True,
+        ))
+
+    if selected_plant_id is not None:
+        plant_page, selected, note_page = await asyncio.gather(
+            plant_page(), selected_plant(), notes(selected_plant_id),
+        )
+    else:
+        plant_page, selected = await asyncio.gather(plant_page(), selected_plant())
+        note_page = await notes(selected.pk) if selected else None
+    if selected is None:
+        note_page = None
+
+    notes_next_url = None
+    if note_page is not None and note_page.has_next:
+        notes_next_url = page_url(request, 'notes_after', note_page.next_cursor)
+    note_form = NoteForm()
+    note_form.fields['plant'].widget.choices = [(plant.pk, plant.name) for plant in plant_page]
+    return await _render(request, 'gardens/garden_detail.html', {
+        'garden': garden,
+        'plants': plant_page,
+        'plants_next_url': page_url(request, 'plants_after', plant_page.next_cursor) if plant_page.has_next else None,
+        'notes_next_url': notes_next_url,
+        'can_edit': access.can_edit,
+        'can_edit_users': access.is_owner,
+        'notes': note_page or [],
+        'note_form': note_form,
+        'selected_plant': selected,
+        'ai_recommendation': selected.latest_recommendation if selected else None,
+        'recommendation_pending': selected is not None and selected.has_pending_job,
+        **caching.fragment_context(version),
+    })
+
+
+@login_required
+@conditional_page(aplant_last_modified)
+async def plant_recommendations_view(request, plant_id):
+    # The access check and the list are independent, the list is dropped without access
+    (plant, access), recommendations = await asyncio.gather(
+        aget_plant_access(request, plant_id),
+        _recommendations(plant_id),
+    )
+    if not access.can_view:
+        return redirect('dashboard')
+    return await _render(request, 'plants/plant_recommendations.html', {
+        'plant': plant,
+        'recommendations': recommendations,
+    })
+
+
+async def _recommendations(plant_id):
+    return [recommendation async for recommendation in AIRecommendation.objects.filter(
+        plant=plant_id,
+    ).order_by('-created_at')]
@@ -0,0 +1,105 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.sessions.models import Session
+from django.db import transaction
+from django.utils import timezone
+
+from gardening import caching
+
+# Levné ověření přihlášení. ModelBackend načítá řádek auth_user při každém
+# požadavku, CachedModelBackend ho drží v paměti procesu pod verzí uživatele
+# (caching.AUTH). Signály (gardening/signals.py) verzi přepíšou při změně
+# uživatele, jeho skupin nebo oprávnění, takže změna hesla nebo odebrání práv
+# platí hned i v ostatních procesech. Vypršené session maže purge_sessions.
+
+
+# In-process LRU of users keyed by id. An entry is only returned while the user's
+# version in the shared cache is the one it was loaded under and it is younger than
+# the TTL. Callers get a copy, a request may change its user without affecting others.
+class UserCache:
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id, version):
+        key = str(user_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                user, entry_version, stored_at = entry
+                if entry_version == version and time.monotonic() - stored_at <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return copy.copy(user)
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, user_id, version, user):
+        key = str(user_id)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (copy.copy(user), version, time.monotonic())
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+user_cache = UserCache(
+    max_size=settings.AUTH_USER_CACHE_SIZE,
+    ttl=settings.AUTH_USER_CACHE_TIMEOUT,
+)
+
+
+# ModelBackend whose get_user() is served from user_cache. Inactive users are not
+# cached, ModelBackend returns None for them and the lookup is repeated next time.
+class CachedModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        version = caching.get_version(caching.AUTH, user_id)
+        user = user_cache.get(user_id, version)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                user_cache.put(user_id, version, user)
+        return user
+
+    async def aget_user(self, user_id):
+        version = await caching.aget_version(caching.AUTH, user_id)
+        user = user_cache.get(user_id, version)
+        if user is None:
+            user = await super().aget_user(user_id)
+            if user is not None:
+                user_cache.put(user_id, version, user)
+        return user
+
+
+# Deletes expired database sessions in batches of batch_size, each in its own short
+# write transaction, so other writers are not blocked for the whole purge like with
+# clearsessions. Yields the number of sessions deleted per batch.
+def purge_expired_sessions(batch_size=1000):
+    now = timezone.now()
+    while True:
+        expired = Session.objects.filter(expire_date__lt=now).order_by().values('session_key')[:batch_size]
+        with transaction.atomic():
+            deleted, _ = Session.objects.filter(session_key__in=expired).delete()
+        if not deleted:
+            return
+        yield deleted
@@ -0,0 +1,472 @@
+import asyncio
+import queue
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import Future
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.asgi import get_asgi_application
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.servers.basehttp import get_internal_wsgi_application
+from django.db import OperationalError, connection, connections, transaction
+from django.db.models import Min
+from django.middleware.csrf import CSRF_ALLOWED_CHARS, CSRF_SECRET_LENGTH
+from django.test import Client, RequestFactory
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+
+from gardening import counters, metrics, plant_types
+from gardening.models import AIRecommendation, Garden, Note, Plant, PlantType
+
+# Syntetická data a zátěžový test přes WSGI aplikaci. Používají je příkazy
+# seed_gardens, benchmark_site a benchmark_search, výsledky jsou JSON, který
+# se dá porovnávat mezi verzemi.
+
+WORDS = (
+    'rajčata mrkev okurky paprika cibule česnek salát špenát ředkvičky dýně cuketa jahody maliny '
+    'zalévání hnojení plevel mšice slimáci sucho mráz kompost mulč výsev sklizeň přesazení řez '
+    'listy květy plody kořeny semínka skleník záhon truhlík balkon stín slunce déšť vítr'
+).split()
+
+PLANT_TYPES = ['Rajčata', 'Mrkev', 'Okurky', 'Paprika', 'Cibule', 'Česnek', 'Salát', 'Jahody', 'Maliny', 'Dýně']
+
+
+def sentence(rng, low=8, high=40):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+
+# One prepared UPDATE run with executemany, bulk_update builds a CASE expression per row
+def _overwrite(model, field_name, values):
+    field = model._meta.get_field(field_name)
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'UPDATE {quote(model._meta.db_table)} SET {quote(field.column)} = %s WHERE {quote(model._meta.pk.column)} = %s',
+            [(field.get_db_prep_save(value, connection), pk) for pk, value in values],
+        )
+
+
+# Bulk generator of the production data shape, users are processed in chunks so memory stays flat
+class Seeder:
+    def __init__(self, users=100, gardens=2, guests=2, plants=20, notes=10, multi_plant=0.2,
+                 recommendations=3, prefix='seed', password='seed', seed=42, chunk_size=50):
+        self.users = users
+        self.gardens = gardens
+        self.guests = guests
+        self.plants = plants
+        self.notes = notes
+        self.multi_plant = multi_plant
+        self.recommendations = recommendations
+        self.prefix = prefix
+        self.password = password
+        self.rng = random.Random(seed)
+        self.chunk_size = chunk_size
+        self.now = timezone.now()
+        self.counts = {'user': 0, 'garden': 0, 'guest': 0, 'plant': 0, 'note': 0, 'recommendation': 0}
+
+    def run(self):
+        PlantType.objects.bulk_create([PlantType(name=name) for name in PLANT_TYPES], ignore_conflicts=True)
+        plant_types.invalidate()
+        self.plant_types = list(PlantType.objects.filter(name__in=PLANT_TYPES))
+        # Hashing is slow on purpose, every seeded user shares one hash
+        password = make_password(self.password)
+        with transaction.atomic():
+            users = User.objects.bulk_create([
+                User(username=f'{self.prefix}{i:06}', password=password) for i in range(self.users)
+            ])
+        self.counts['user'] = len(users)
+        self.user_ids = [user.pk for user in users]
+        for start in range(0, len(users), self.chunk_size):
+            with transaction.atomic():
+                self._seed_chunk(users[start:start + self.chunk_size])
+        return self.counts
+
+    def _days_ago(self, days):
+        return self.now - timedelta(days=self.rng.randint(0, days), seconds=self.rng.randint(0, 86399))
+
+    def _seed_chunk(self, users):
+        gardens = Garden.objects.bulk_create([
+            Garden(owner=user, name=f'Zahrádka {user.username} {i + 1}', description=sentence(self.rng, 4, 12))
+            for user in users for i in range(self.gardens)
+        ])
+        self.counts['garden'] += len(gardens)
+
+        Guest = Garden.users_with_access.through
+        guests = []
+        for garden in gardens:
+            candidates = self.rng.sample(self.user_ids, min(self.guests + 1, len(self.user_ids)))
+            guests.extend(
+                Guest(garden_id=garden.pk, user_id=user_id)
+                for user_id in [c for c in candidates if c != garden.owner_id][:self.guests]
+            )
+        Guest.objects.bulk_create(guests, ignore_conflicts=True)
+        self.counts['guest'] += len(guests)
+
+        plants = Plant.objects.bulk_create([
+            Plant(
+                garden=garden,
+                name=f'{self.rng.choice(WORDS).capitalize()} {i + 1}',
+                plant_type=self.rng.choice(self.plant_types),
+                planted_date=self._days_ago(700).date(),
+            )
+            for garden in gardens for i in range(self.plants)
+        ])
+        self.counts['plant'] += len(plants)
+        by_garden = {}
+        for plant in plants:
+            by_garden.setdefault(plant.garden_id, []).append(plant)
+
+        # Some notes are shared with one or two other plants of the same garden
+        notes, note_plants = [], []
+        for plant in plants:
+            siblings = by_garden[plant.garden_id]
+            for _ in range(self.notes):
+                notes.append(Note(content=sentence(self.rng)))
+                linked = {plant.pk}
+                if len(siblings) > 1 and self.rng.random() < self.multi_plant:
+                    linked.update(p.pk for p in self.rng.sample(siblings, min(2, len(siblings))))
+                note_plants.append(linked)
+        Note.objects.bulk_create(notes)
+        # bulk_create fills auto_now_add fields with the current date, spread them over a year
+        created = [(note.pk, self._days_ago(365)) for note in notes]
+        _overwrite(Note, 'created_at', created)
+        _overwrite(Note, 'date', [(pk, moment.date()) for pk, moment in created])
+        Link = Note.plant.through
+        Link.objects.bulk_create([
+            Link(note_id=note.pk, plant_id=plant_id) for note, linked in zip(notes, note_plants) for plant_id in linked
+        ])
+        self.counts['note'] += len(notes)
+
+        recommendations = AIRecommendation.objects.bulk_create([
+            AIRecommendation(plant=plant, recommendation=sentence(self.rng, 20, 60))
+            for plant in plants for _ in range(self.recommendations)
+        ])
+        _overwrite(AIRecommendation, 'created_at', [(rec.pk, self._days_ago(365)) for rec in recommendations])
+        self.counts['recommendation'] += len(recommendations)
+        counters.recount_plants([plant.pk for plant in plants])
+        counters.recount_gardens([garden.pk for garden in gardens])
+
+
+# Each scenario maps a target (user, garden id, plant id) and request index to (method, path, data)
+SCENARIOS = {
+    'dashboard': lambda user, garden_id, plant_id, i: ('get', reverse('dashboard'), None),
+    'gardens': lambda user, garden_id, plant_id, i: ('get', reverse('gardens'), None),
+    'garden_detail': lambda user, garden_id, plant_id, i: (
+        'get', reverse('garden_detail', args=[garden_id]), {'plant': plant_id},
+    ),
+    'recommendations': lambda user, garden_id, plant_id, i: (
+        'get', reverse('plant_recommendations', args=[plant_id]), None,
+    ),
+    'note_post': lambda user, garden_id, plant_id, i: (
+        'post', f"{reverse('garden_detail', args=[garden_id])}?plant={plant_id}",
+        {'add_note': '1', 'content': f'Benchmark note {i}', 'plant': [plant_id]},
+    ),
+}
+
+
+# (owner, garden id, first plant id) of up to count gardens that have plants
+def benchmark_targets(count, prefix=None):
+    plants = Plant.objects.order_by('garden_id').values('garden_id', 'garden__owner_id').annotate(plant_id=Min('pk'))
+    if prefix:
+        plants = plants.filter(garden__owner__username__startswith=prefix)
+    rows = list(plants[:count])
+    users = User.objects.in_bulk({row['garden__owner_id'] for row in rows})
+    return [(users[row['garden__owner_id']], row['garden_id'], row['plant_id']) for row in rows]
+
+
+# Nearest-rank percentile of already sorted values
+def percentile(values, pct):
+    if not values:
+        return None
+    index = max(0, min(len(values) - 1, round(pct / 100 * len(values) + 0.5) - 1))
+    return values[index]
+
+
+class _QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def record(self, seconds, sql):
+        self.count += 1
+
+
+# Drives the project's WSGI application from a pool of threads, like a threaded server would.
+# With workers set, concurrency is the number of clients queueing for that many worker
+# threads, latency then includes the wait in the queue. client_delay is the time a slow
+# client needs to receive the response, a WSGI worker stays busy meanwhile.
+class LoadRunner:
+    def __init__(self, concurrency=4, host='localhost', workers=None, client_delay=0.0):
+        self.app = self.load_application()
+        self.concurrency = concurrency
+        self.workers = workers
+        self.client_delay = client_delay
+        self.factory = RequestFactory(HTTP_HOST=host)
+        self.csrf_secret = get_random_string(CSRF_SECRET_LENGTH, CSRF_ALLOWED_CHARS)
+        self.cookies = {}
+
+    def load_application(self):
+        return get_internal_wsgi_application()
+
+    # Session cookie header for the user, the session is created once through the session engine
+    def cookie(self, user):
+        if user.pk not in self.cookies:
+            client = Client()
+            client.force_login(user)
+            session = client.cookies[settings.SESSION_COOKIE_NAME].value
+            self.cookies[user.pk] = (
+                f'{settings.SESSION_COOKIE_NAME}={session}; {settings.CSRF_COOKIE_NAME}={self.csrf_secret}'
+            )
+        return self.cookies[user.pk]
+
+    def environ(self, user, method, path, data=None):
+        extra = {'HTTP_COOKIE': self.cookie(user)}
+        if method == 'post':
+            extra['HTTP_X_CSRFTOKEN'] = self.csrf_secret
+            return self.factory.post(path, data or {}, **extra).environ
+        return self.factory.get(path, data or {}, **extra).environ
+
+    # Returns (status code, seconds, number of SQL queries, response bytes)
+    def call(self, environ):
+        counter = _QueryCounter()
+        status = []
+        size = 0
+        started = time.perf_counter()
+        with metrics.collect(counter):
+            response = self.app(environ, lambda s, headers, exc_info=None: status.append(s))
+            try:
+                for chunk in response:
+                    size += len(chunk)
+                if self.client_delay:
+                    time.sleep(self.client_delay)
+            finally:
+                # Fires request_finished, which closes or recycles the connection as a server would
+                response.close()
+        elapsed = time.perf_counter() - started
+        return int(status[0].split()[0]), elapsed, counter.count, size
+
+    # make_environ(i) builds the i-th request, every thread keeps its own DB connection
+    def run(self, make_environ, requests, warmup=0):
+        for i in range(warmup):
+            self.call(make_environ(i))
+        results = []
+        lock = threading.Lock()
+        next_index = iter(range(requests))
+        # FIFO like a server's accept queue
+        jobs = queue.SimpleQueue()
+
+        def serve(environ):
+            if not self.workers:
+                return self.call(environ)
+            future = Future()
+            jobs.put((environ, future))
+            return future.result()
+
+        def server_worker():
+            try:
+                while (job := jobs.get()) is not None:
+                    environ, future = job
+                    future.set_result(self.call(environ))
+            finally:
+                connections.close_all()
+
+        def client():
+            try:
+                while True:
+                    with lock:
+                        i = next(next_index, None)
+                    if i is None:
+                        return
+                    environ = make_environ(i)
+                    started = time.perf_counter()
+                    status, _, queries, size = serve(environ)
+                    with lock:
+                        results.append((status, time.perf_counter() - started, queries, size))
+            finally:
+                connections.close_all()
+
+        servers = [threading.Thread(target=server_worker) for _ in range(self.workers or 0)]
+        for thread in servers:
+            thread.start()
+        started = time.perf_counter()
+        clients = [threading.Thread(target=client) for _ in range(max(1, self.concurrency))]
+        for thread in clients:
+            thread.start()
+        for thread in clients:
+            thread.join()
+        wall_time = time.perf_counter() - started
+        for _ in servers:
+            jobs.put(None)
+        for thread in servers:
+            thread.join()
+        return summarize(results, wall_time)
+
+
+# Loads its own handler instead of the project's application, so the middleware
+# reads settings overridden around the runner, e.g. SESSION_ENGINE
+class FreshLoadRunner(LoadRunner):
+    def load_application(self):
+        return WSGIHandler()
+
+
+# The same load against the ASGI application, every client is a task on one event loop.
+# A slow client only delays its own task, no worker is held while it receives.
+class AsgiLoadRunner(LoadRunner):
+    def load_application(self):
+        return get_asgi_application()
+
+    # (scope, body) built from the WSGI environ of the same request
+    def environ(self, user, method, path, data=None):
+        environ = super().environ(user, method, path, data)
+        headers = [
+            (key[5:].lower().replace('_', '-').encode('latin-1'), value.encode('latin-1'))
+            for key, value in environ.items() if key.startswith('HTTP_')
+        ]
+        for key, name in (('CONTENT_TYPE', b'content-type'), ('CONTENT_LENGTH', b'content-length')):
+            if environ.get(key):
+                headers.append((name, str(environ[key]).encode('latin-1')))
+        body = environ['wsgi.input'].read(int(environ.get('CONTENT_LENGTH') or 0))
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': environ['REQUEST_METHOD'],
+            'scheme': 'http',
+            'path': environ['PATH_INFO'],
+            'raw_path': environ['PATH_INFO'].encode(),
+            'query_string': environ.get('QUERY_STRING', '').encode('latin-1'),
+            'root_path': '',
+            'headers': headers,
+            'client': ('127.0.0.1', 0),
+            'server': (environ['SERVER_NAME'], int(environ['SERVER_PORT'])),
+        }
+        return scope, body
+
+    async def acall(self, request):
+        scope, body = request
+        counter = _QueryCounter()
+        status = []
+        size = 0
+        messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            # The client stays connected, Django cancels this once the response is sent
+            await asyncio.Event().wait()
+
+        async def send(message):
+            nonlocal size
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+            elif message['type'] == 'http.response.body':
+                size += len(message.get('body', b''))
+                if not message.get('more_body') and self.client_delay:
+                    await asyncio.sleep(self.client_delay)
+
+        started = time.perf_counter()
+        with metrics.collect(counter):
+            await self.app(scope, receive, send)
+        return status[0], time.perf_counter() - started, counter.count, size
+
+    def run(self, make_environ, requests, warmup=0):
+        # Built up front, the first request of a user creates its session synchronously
+        warmups = [make_environ(i) for i in range(warmup)]
+        measured = [make_environ(i) for i in range(requests)]
+        return asyncio.run(self._run(warmups, measured))
+
+    async def _run(self, warmups, measured):
+        for request in warmups:
+            await self.acall(request)
+        results = []
+        pending = iter(measured)
+
+        async def client():
+            for request in pending:
+                results.append(await self.acall(request))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(max(1, self.concurrency))))
+        return summarize(results, time.perf_counter() - started)
+
+
+def summarize(results, wall_time):
+    latencies = sorted(elapsed * 1000 for _, elapsed, _, _ in results)
+    queries = [count for _, _, count, _ in results]
+    statuses = {}
+    for status, _, _, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        'requests': len(results),
+        'errors': sum(1 for status, _, _, _ in results if status >= 400),
+        'status': statuses,
+        'requests_per_second': round(len(results) / wall_time, 2) if wall_time else None,
+        'latency_ms': {
+            'mean': round(statistics.fmean(latencies), 3) if latencies else None,
+            'p50': round(percentile(latencies, 50), 3) if latencies else None,
+            'p95': round(percentile(latencies, 95), 3) if latencies else None,
+            'p99': round(percentile(latencies, 99), 3) if latencies else None,
+            'max': round(latencies[-1], 3) if latencies else None,
+        },
+        'queries_per_request': {
+            'mean': round(statistics.fmean(queries), 2) if queries else None,
+            'max': max(queries) if queries else None,
+        },
+        'bytes_per_request': round(statistics.fmean(size for _, _, _, size in results)) if results else None,
+    }
+
+
+# Concurrent writers doing what a note post does: read the plant, insert a note and link it.
+# Every thread has its own connection, so the database settings decide whether they collide.
+def stress_writes(plant_ids, threads=8, transactions=400):
+    results = []
+    errors = {'locked': 0, 'other': 0}
+    lock = threading.Lock()
+    next_index = iter(range(transactions))
+
+    def worker():
+        try:
+            while True:
+                with lock:
+                    i = next(next_index, None)
+                if i is None:
+                    return
+                started = time.perf_counter()
+                try:
+                    with transaction.atomic():
+                        plant = Plant.objects.get(pk=plant_ids[i % len(plant_ids)])
+                        Note.objects.create(content=f'Stress note {i}').plant.add(plant)
+                except OperationalError as error:
+                    with lock:
+                        errors['locked' if 'locked' in str(error) else 'other'] += 1
+                    continue
+                with lock:
+                    results.append(time.perf_counter() - started)
+        finally:
+            connections.close_all()
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker) for _ in range(max(1, threads))]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    wall_time = time.perf_counter() - started
+    latencies = sorted(elapsed * 1000 for elapsed in results)
+    return {
+        'transactions': transactions,
+        'committed': len(results),
+        'lock_errors': errors['locked'],
+        'other_errors': errors['other'],
+        'transactions_per_second': round(len(results) / wall_time, 2) if wall_time else None,
+        'latency_ms': {
+            'p50': round(percentile(latencies, 50), 3) if latencies else None,
+            'p95': round(percentile(latencies, 95), 3) if latencies else None,
+            'max': round(latencies[-1], 3) if latencies else None,
+        },
+    }
@@ -0,0 +1,177 @@
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection, transaction
+
+# Cache dat a fragmentů stránek se zahrádkami. Klíče obsahují verzi zahrádky
+# nebo uživatele, signály (gardening/signals.py) při změně verzi přepíšou
+# a staré záznamy tak přestanou být dosažitelné, není potřeba je mazat.
+# Funguje s každým backendem, který umí get/set/add/get_many/set_many
+# (locmem, file, memcached, redis).
+
+PREFIX = 'gardening'
+
+GARDEN = 'garden'
+USER = 'user'
+PLANT_TYPES = 'plant_types'
+# Logged-in users held by gardening.auth.CachedModelBackend
+AUTH = 'auth'
+
+
+def get_cache():
+    return caches[settings.GARDEN_CACHE_ALIAS]
+
+
+def _version_key(scope, pk):
+    return f'{PREFIX}:version:{scope}:{pk}'
+
+
+def _new_version():
+    return uuid.uuid4().hex[:12]
+
+
+def get_versions(scope, ids):
+    ids = list(ids)
+    if not ids:
+        return {}
+    cache = get_cache()
+    keys = {_version_key(scope, pk): pk for pk in ids}
+    found = cache.get_many(keys)
+    versions = {keys[key]: version for key, version in found.items()}
+    for key, pk in keys.items():
+        if key not in found:
+            version = _new_version()
+            # Another process may have created it meanwhile, its version wins
+            if not cache.add(key, version, None):
+                version = cache.get(key) or version
+            versions[pk] = version
+    return versions
+
+
+def get_version(scope, pk):
+    return get_versions(scope, [pk])[pk]
+
+
+# In-process backends answer without I/O, their async methods would only move each
+# call to a thread. Other backends are used through the async API.
+def _is_local(cache):
+    return isinstance(cache, (LocMemCache, DummyCache))
+
+
+async def aget_versions(scope, ids):
+    ids = list(ids)
+    if not ids:
+        return {}
+    cache = get_cache()
+    if _is_local(cache):
+        return get_versions(scope, ids)
+    keys = {_version_key(scope, pk): pk for pk in ids}
+    found = await cache.aget_many(keys)
+    versions = {keys[key]: version for key, version in found.items()}
+    for key, pk in keys.items():
+        if key not in found:
+            version = _new_version()
+            if not await cache.aadd(key, version, None):
+                version = await cache.aget(key) or version
+            versions[pk] = version
+    return versions
+
+
+async def aget_version(scope, pk):
+    return (await aget_versions(scope, [pk]))[pk]
+
+
+def garden_version(garden_id):
+    return get_version(GARDEN, garden_id)
+
+
+def user_version(user_id):
+    return get_version(USER, user_id)
+
+
+def _bump(scope, ids):
+    get_cache().set_many({_version_key(scope, pk): _new_version() for pk in ids}, None)
+
+
+# Bumped right away and once more after commit, so a request that read the old
+# rows before the commit cannot keep them cached under the new version
+def bump(scope, ids):
+    ids = {pk for pk in ids if pk is not None}
+    if not ids:
+        return
+    _bump(scope, ids)
+    if connection.in_atomic_block:
+        transaction.on_commit(lambda: _bump(scope, ids))
+
+
+def bump_gardens(garden_ids):
+    bump(GARDEN, garden_ids)
+
+
+def bump_users(user_ids):
+    bump(USER, user_ids)
+
+
+def bump_auth(user_ids):
+    bump(AUTH, user_ids)
+
+
+# Short token for several versions, e.g. a user and the gardens shown on a page
+def versions_token(*versions):
+    return hashlib.md5(repr(versions).encode(), usedforsecurity=False).hexdigest()[:12]
+
+
+# Context for {% cache cache_timeout name cache_version ... using=cache_alias %} in templates
+def fragment_context(version):
+    return {
+        'cache_alias': settings.GARDEN_CACHE_ALIAS,
+        'cache_timeout': settings.GARDEN_CACHE_TIMEOUT,
+        'cache_version': version,
+    }
+
+
+def cache_key(name, version, parts):
+    digest = hashlib.md5(repr(parts).encode(), usedforsecurity=False).hexdigest()
+    return f'{PREFIX}:{name}:{version}:{digest}'
+
+
+# Value of build() cached under the version. depends_on(value) may list gardens the
+# value was built from, the entry is then only valid while none of them has changed.
+# A value for which keep(value) is false is returned without being cached.
+def cached(name, version, parts, build, depends_on=None, keep=None):
+    cache = get_cache()
+    key = cache_key(name, version, parts)
+    entry = cache.get(key)
+    if entry is not None:
+        value, gardens = entry
+        if not gardens or get_versions(GARDEN, gardens) == gardens:
+            return value
+    value = build()
+    if keep is not None and not keep(value):
+        return value
+    gardens = get_versions(GARDEN, depends_on(value)) if depends_on else {}
+    cache.set(key, (value, gardens), settings.GARDEN_CACHE_TIMEOUT)
+    return value
+
+
+# cached() for async views, build is a coroutine function. Entries are shared with cached().
+async def acached(name, version, parts, build, depends_on=None):
+    cache = get_cache()
+    key = cache_key(name, version, parts)
+    local = _is_local(cache)
+    entry = cache.get(key) if local else await cache.aget(key)
+    if entry is not None:
+        value, gardens = entry
+        if not gardens or await aget_versions(GARDEN, gardens) == gardens:
+            return value
+    value = await build()
+    gardens = await aget_versions(GARDEN, depends_on(value)) if depends_on else {}
+    if local:
+        cache.set(key, (value, gardens), settings.GARDEN_CACHE_TIMEOUT)
+    else:
+        await cache.aset(key, (value, gardens), settings.GARDEN_CACHE_TIMEOUT)
+    return value
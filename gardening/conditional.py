@@ -0,0 +1,110 @@
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.db.models import Q
+from django.middleware.csrf import get_token
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.timezone import now
+from django.views.decorators.http import condition
+
+from gardening.models import Garden, Plant
+
+# Podmíněné GET (ETag / Last-Modified) pro stránky zahrádky a rostliny.
+# Změna rostliny, poznámky nebo doporučení posune updated_at rodičů
+# (signály v gardening/signals.py), takže stačí jeden dotaz na jeden řádek
+# a prohlížeč dostane 304 bez načítání dat stránky.
+
+
+# Plant rows and the gardens they belong to, plant_ids may be a values() subquery
+def touch_plants(plant_ids):
+    timestamp = now()
+    Plant.objects.filter(pk__in=plant_ids).update(updated_at=timestamp)
+    Garden.objects.filter(plants__in=plant_ids).update(updated_at=timestamp)
+
+
+def touch_gardens(garden_ids):
+    Garden.objects.filter(pk__in=garden_ids).update(updated_at=now())
+
+
+# Access is checked by garden_access_required before this runs
+def _garden_modified(garden_id):
+    return Garden.objects.filter(pk=garden_id).values_list('updated_at', flat=True)
+
+
+def garden_last_modified(request, garden_id):
+    return _garden_modified(garden_id).first()
+
+
+async def agarden_last_modified(request, garden_id):
+    return await _garden_modified(garden_id).afirst()
+
+
+# Nothing for users without access, the view then answers with its usual redirect
+def _plant_modified(user, plant_id):
+    guest_of = Garden.users_with_access.through.objects.filter(user_id=user.pk).values('garden_id')
+    return Plant.objects.filter(
+        Q(garden__owner=user) | Q(garden_id__in=guest_of), pk=plant_id,
+    ).values_list('updated_at', flat=True)
+
+
+def plant_last_modified(request, plant_id):
+    return _plant_modified(request.user, plant_id).first()
+
+
+async def aplant_last_modified(request, plant_id):
+    return await _plant_modified(await request.auser(), plant_id).afirst()
+
+
+# Pages differ per user, URL (selected plant, cursors) and CSRF secret embedded in forms
+def _page_etag(request, user, last_modified):
+    # Creates the CSRF secret on a first visit, otherwise the page would set it
+    # while rendering and the next visit could never match
+    get_token(request)
+    parts = (
+        request.get_full_path(), user.pk, request.META.get('CSRF_COOKIE'), last_modified.isoformat(),
+    )
+    return hashlib.md5(repr(parts).encode(), usedforsecurity=False).hexdigest()
+
+
+def _conditional_view(view_func, etag, modified):
+    return condition(
+        etag_func=lambda *args, **kwargs: etag,
+        last_modified_func=lambda *args, **kwargs: modified,
+    )(view_func)
+
+
+def _private(response):
+    # Browsers revalidate on every visit, shared caches must not store the page
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ['Cookie'])
+    return response
+
+
+# condition() for a page whose content changes only when last_modified(request, ...) moves.
+# Async views take a coroutine function, e.g. agarden_last_modified.
+def conditional_page(last_modified):
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def _awrapped(request, *args, **kwargs):
+                if request.method not in ('GET', 'HEAD'):
+                    return await view_func(request, *args, **kwargs)
+                modified = await last_modified(request, *args, **kwargs)
+                if modified is None:
+                    return await view_func(request, *args, **kwargs)
+                etag = _page_etag(request, await request.auser(), modified)
+                return _private(await _conditional_view(view_func, etag, modified)(request, *args, **kwargs))
+            return _awrapped
+
+        @wraps(view_func)
+        def _wrapped(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view_func(request, *args, **kwargs)
+            modified = last_modified(request, *args, **kwargs)
+            if modified is None:
+                return view_func(request, *args, **kwargs)
+            etag = _page_etag(request, request.user, modified)
+            return _private(_conditional_view(view_func, etag, modified)(request, *args, **kwargs))
+        return _wrapped
+    return decorator
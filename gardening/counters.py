@@ -0,0 +1,162 @@
+from django.db import transaction
+from django.db.models import Case, Count, Exists, F, Max, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce, Greatest
+
+from gardening.models import AIRecommendation, Garden, Note, Plant
+
+# Denormalizované počty u zahrádek a rostlin (počet rostlin a poznámek, čas
+# poslední poznámky a doporučení), aby přehledy nemusely počítat COUNT pro
+# každou zahrádku. Signály (gardening/signals.py) je posouvají výrazy s F()
+# přímo v UPDATE, hromadné zápisy (import, seed) přepočítají dotčené řádky
+# a příkaz repair_counters opraví případný rozjezd po dávkách.
+
+def _total(queryset, group, aggregate):
+    return Subquery(queryset.order_by().values(group).annotate(total=aggregate).values('total'))
+
+
+# Exact values as correlated subqueries, usable in update() and annotate()
+def _plant_totals():
+    links = Note.plant.through.objects.filter(plant_id=OuterRef('pk'))
+    return {
+        'note_count': Coalesce(_total(links, 'plant_id', Count('pk')), 0),
+        'last_note_at': _total(links, 'plant_id', Max('note__created_at')),
+        'last_recommendation_at': _total(
+            AIRecommendation.objects.filter(plant_id=OuterRef('pk')), 'plant_id', Max('created_at'),
+        ),
+    }
+
+
+# Soft-deleted plants (gardening/deletion.py) no longer count, their rows wait for the purge
+def _garden_totals():
+    links = Note.plant.through.objects.filter(plant__garden_id=OuterRef('pk'), plant__deleted_at=None)
+    return {
+        'plant_count': Coalesce(_total(Plant.objects.filter(garden_id=OuterRef('pk')), 'garden_id', Count('pk')), 0),
+        'note_count': Coalesce(_total(links, 'plant__garden_id', Count('note_id', distinct=True)), 0),
+        'last_note_at': _total(links, 'plant__garden_id', Max('note__created_at')),
+        'last_recommendation_at': _total(
+            AIRecommendation.objects.filter(plant__garden_id=OuterRef('pk'), plant__deleted_at=None),
+            'plant__garden_id', Max('created_at'),
+        ),
+    }
+
+
+def recount_plants(plant_ids):
+    Plant.objects.filter(pk__in=plant_ids).update(**_plant_totals())
+
+
+def recount_gardens(garden_ids):
+    Garden.objects.filter(pk__in=garden_ids).update(**_garden_totals())
+
+
+def _newer(field, timestamp):
+    return Greatest(Coalesce(F(field), Value(timestamp)), Value(timestamp))
+
+
+# The subquery only runs for rows whose newest entry may be among the removed ones
+def _after_removal(field, removed_latest, total):
+    if removed_latest is None:
+        return F(field)
+    return Case(When(**{f'{field}__gt': removed_latest}, then=F(field)), default=total)
+
+
+# How many of note_ids each garden of plant_ids has through these plants only, so
+# linking or unlinking them changes the garden's note count. Note rows may be gone.
+def _garden_note_deltas(note_ids, plant_ids):
+    note_ids, plant_ids = list(note_ids), list(plant_ids)
+    elsewhere = Note.plant.through.objects.filter(
+        note_id__in=note_ids, plant__garden_id=OuterRef('garden_id'), plant__deleted_at=None,
+    ).exclude(plant_id__in=plant_ids)
+    gardens = Plant.objects.filter(pk__in=plant_ids).order_by().annotate(
+        elsewhere=Coalesce(_total(elsewhere, 'plant__garden_id', Count('note_id', distinct=True)), 0),
+    ).values_list('garden_id', 'elsewhere').distinct()
+    return {garden_id: len(note_ids) - count for garden_id, count in gardens if count < len(note_ids)}
+
+
+# Every note of note_ids was linked to every plant of plant_ids, one side is a single row
+def notes_linked(note_ids, plant_ids, latest):
+    Plant.objects.filter(pk__in=plant_ids).update(
+        note_count=F('note_count') + len(note_ids), last_note_at=_newer('last_note_at', latest),
+    )
+    for garden_id, delta in _garden_note_deltas(note_ids, plant_ids).items():
+        Garden.objects.filter(pk=garden_id).update(
+            note_count=F('note_count') + delta, last_note_at=_newer('last_note_at', latest),
+        )
+
+
+# The reverse of notes_linked, called once the links are gone
+def notes_unlinked(note_ids, plant_ids, latest):
+    Plant.objects.filter(pk__in=plant_ids).update(
+        note_count=F('note_count') - len(note_ids),
+        last_note_at=_after_removal('last_note_at', latest, _plant_totals()['last_note_at']),
+    )
+    for garden_id, delta in _garden_note_deltas(note_ids, plant_ids).items():
+        Garden.objects.filter(pk=garden_id).update(
+            note_count=F('note_count') - delta,
+            last_note_at=_after_removal('last_note_at', latest, _garden_totals()['last_note_at']),
+        )
+
+
+def plant_added(garden_id):
+    Garden.objects.filter(pk=garden_id).update(plant_count=F('plant_count') + 1)
+
+
+# Read before a plant is deleted: the notes its garden has only through this plant
+# and the plant's newest entries as stored, the instance may be older than the row
+def plant_removal(plant):
+    elsewhere = Note.plant.through.objects.filter(
+        note_id=OuterRef('note_id'), plant__garden_id=plant.garden_id, plant__deleted_at=None,
+    ).exclude(plant_id=plant.pk)
+    only_here = Note.plant.through.objects.filter(plant_id=OuterRef('pk')).exclude(Exists(elsewhere))
+    return Plant.objects.filter(pk=plant.pk).annotate(
+        notes_only_here=Coalesce(_total(only_here, 'plant_id', Count('pk')), 0),
+    ).values('garden_id', 'notes_only_here', 'last_note_at', 'last_recommendation_at').first()
+
+
+def plant_removed(removal):
+    totals = _garden_totals()
+    Garden.objects.filter(pk=removal['garden_id']).update(
+        plant_count=F('plant_count') - 1,
+        note_count=F('note_count') - removal['notes_only_here'],
+        last_note_at=_after_removal('last_note_at', removal['last_note_at'], totals['last_note_at']),
+        last_recommendation_at=_after_removal(
+            'last_recommendation_at', removal['last_recommendation_at'], totals['last_recommendation_at'],
+        ),
+    )
+
+
+def recommendation_added(plant_id, created_at):
+    Plant.objects.filter(pk=plant_id).update(last_recommendation_at=_newer('last_recommendation_at', created_at))
+    Garden.objects.filter(plants=plant_id).update(last_recommendation_at=_newer('last_recommendation_at', created_at))
+
+
+def _repair_batch(model, totals, names, pks):
+    expected = {f'expected_{name}': expression for name, expression in totals.items()}
+    drifted = []
+    for obj in model.objects.filter(pk__in=pks).only(*names).annotate(**expected):
+        if any(getattr(obj, name) != getattr(obj, f'expected_{name}') for name in names):
+            for name in names:
+                setattr(obj, name, getattr(obj, f'expected_{name}'))
+            drifted.append(obj)
+    if drifted:
+        model.objects.bulk_update(drifted, names)
+    return len(drifted)
+
+
+# Recomputes the counters of all rows in pk order, each batch in its own transaction.
+# Yields (model, rows checked, rows repaired) per batch.
+def repair(batch_size=500, dry_run=False):
+    for model, totals, names in (
+        (Plant, _plant_totals, Plant.counter_fields),
+        (Garden, _garden_totals, Garden.counter_fields),
+    ):
+        last_pk = 0
+        while True:
+            pks = list(model.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                break
+            last_pk = pks[-1]
+            with transaction.atomic():
+                repaired = _repair_batch(model, totals(), names, pks)
+                if dry_run:
+                    transaction.set_rollback(True)
+            yield model, len(pks), repaired
@@ -0,0 +1,190 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from gardening import caching, conditional, counters, search
+from gardening.images import delete_variants
+from gardening.models import AIRecommendation, Garden, Note, Plant, RecommendationJob
+from gardening.recommendations import recommendation_cache
+
+# Mazání velkých zahrádek a rostlin. Collector Djanga by načetl všechny rostliny,
+# doporučení a vazby poznámek do paměti a po celou dobu držel zámek zápisu SQLite.
+# Požadavek proto řádek jen označí jako smazaný (deleted_at), výchozí managery ho
+# skryjí a obsah po dávkách maže vlákno na pozadí přímými DELETE, každou dávku
+# v samostatné transakci. Poznámky, které nezůstanou u žádné rostliny, se smažou
+# i se svými obrázky.
+
+logger = logging.getLogger('gardening.deletion')
+
+Link = Note.plant.through
+Guest = Garden.users_with_access.through
+
+
+# Hides the garden and its plants right away, one UPDATE per table
+def delete_garden(garden):
+    timestamp = timezone.now()
+    with transaction.atomic():
+        member_ids = [garden.owner_id, *Guest.objects.filter(garden_id=garden.pk).values_list('user_id', flat=True)]
+        Garden.objects.filter(pk=garden.pk).update(deleted_at=timestamp)
+        Plant.objects.filter(garden_id=garden.pk).update(deleted_at=timestamp)
+        search.remove_garden(garden.pk)
+        caching.bump_gardens([garden.pk])
+        caching.bump_users(member_ids)
+        schedule_purge_on_commit()
+
+
+# The garden's counters drop at once, like for a deleted plant (gardening/signals.py)
+def delete_plant(plant):
+    with transaction.atomic():
+        removal = counters.plant_removal(plant)
+        Plant.objects.filter(pk=plant.pk).update(deleted_at=timezone.now())
+        if removal:
+            counters.plant_removed(removal)
+        search.remove(search.KIND_PLANT, [plant.pk])
+        recommendation_cache.invalidate_plant(plant.pk)
+        caching.bump_gardens([plant.garden_id])
+        conditional.touch_gardens([plant.garden_id])
+        schedule_purge_on_commit()
+
+
+# A single DELETE without the collector, signals or cascades. Callers delete the
+# children before their parents.
+def _raw_delete(model, pks):
+    return model._base_manager.filter(pk__in=pks)._raw_delete(connection.alias)
+
+
+def _delete_files(names):
+    for name in names:
+        default_storage.delete(name)
+        delete_variants(name)
+
+
+def _delete_files_on_commit(names):
+    names = [name for name in names if name]
+    if names:
+        transaction.on_commit(lambda: _delete_files(names))
+
+
+# Rows of queryset batch_size at a time, each batch in its own transaction
+def _delete_batched(queryset, batch_size):
+    pks = queryset.order_by().values_list('pk', flat=True)
+    while True:
+        with transaction.atomic():
+            batch = list(pks[:batch_size])
+            if batch:
+                _raw_delete(queryset.model, batch)
+        if len(batch) < batch_size:
+            return
+
+
+# Deletes those of note_ids that are linked to no plant, with their images
+def _delete_orphan_notes(note_ids):
+    orphans = list(Note.objects.filter(pk__in=note_ids).exclude(
+        Exists(Link.objects.filter(note_id=OuterRef('pk'))),
+    ).order_by().values_list('pk', 'image'))
+    if orphans:
+        _delete_files_on_commit([image for _, image in orphans])
+        _raw_delete(Note, [pk for pk, _ in orphans])
+        search.remove(search.KIND_NOTE, [pk for pk, _ in orphans])
+    return len(orphans)
+
+
+# Plant rows last, once nothing refers to them. Jobs go before the recommendations
+# they point to.
+def _purge_plants(plant_ids, batch_size):
+    _delete_batched(RecommendationJob.objects.filter(plant_id__in=plant_ids), batch_size)
+    _delete_batched(AIRecommendation.objects.filter(plant_id__in=plant_ids), batch_size)
+    links = Link.objects.filter(plant_id__in=plant_ids).order_by().values_list('pk', 'note_id')
+    while True:
+        with transaction.atomic():
+            batch = list(links[:batch_size])
+            if batch:
+                note_ids = {note_id for _, note_id in batch}
+                _raw_delete(Link, [pk for pk, _ in batch])
+                _delete_orphan_notes(note_ids)
+                # Notes kept by other plants lose the search rows of the deleted ones
+                search.index_notes(Note.objects.filter(pk__in=note_ids).values_list('pk', flat=True))
+        if len(batch) < batch_size:
+            break
+    with transaction.atomic():
+        _delete_files_on_commit(Plant.all_objects.filter(pk__in=plant_ids).values_list('image', flat=True))
+        _raw_delete(Plant, plant_ids)
+        search.remove(search.KIND_PLANT, plant_ids)
+
+
+def _purge_garden(garden_id, batch_size):
+    # Plants added while the garden was being deleted
+    plants = Plant.all_objects.filter(garden_id=garden_id).order_by().values_list('pk', flat=True)
+    while plant_ids := list(plants[:batch_size]):
+        _purge_plants(plant_ids, batch_size)
+    with transaction.atomic():
+        Guest.objects.filter(garden_id=garden_id)._raw_delete(connection.alias)
+        _delete_files_on_commit(Garden.all_objects.filter(pk=garden_id).values_list('image', flat=True))
+        _raw_delete(Garden, [garden_id])
+        search.remove_garden(garden_id)
+
+
+# Deletes soft-deleted plants, then soft-deleted gardens, with everything below them.
+# Yields (model, rows purged) per batch.
+def purge(batch_size=None):
+    batch_size = batch_size or settings.DELETION_BATCH_SIZE
+    plants = Plant.all_objects.filter(deleted_at__isnull=False).order_by().values_list('pk', flat=True)
+    while plant_ids := list(plants[:batch_size]):
+        _purge_plants(plant_ids, batch_size)
+        yield Plant, len(plant_ids)
+    for garden_id in list(Garden.all_objects.filter(deleted_at__isnull=False).values_list('pk', flat=True)):
+        _purge_garden(garden_id, batch_size)
+        yield Garden, 1
+
+
+# Notes linked to no plant, left behind by deletions before the purge existed or
+# by raw SQL. Walks all notes in pk order, yields the number deleted per batch.
+def purge_orphan_notes(batch_size=None):
+    batch_size = batch_size or settings.DELETION_BATCH_SIZE
+    last_pk = 0
+    while True:
+        note_ids = list(Note.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not note_ids:
+            return
+        last_pk = note_ids[-1]
+        with transaction.atomic():
+            yield _delete_orphan_notes(note_ids)
+
+
+_executor = None
+
+
+# One thread: SQLite has a single writer anyway and purges never overlap in a process
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='gardening-purge')
+    return _executor
+
+
+def _purge_in_background():
+    try:
+        for _ in purge():
+            pass
+    except Exception:
+        # Rows stay soft-deleted, the next purge or purge_deleted picks them up
+        logger.exception('Purging deleted gardens and plants failed')
+    finally:
+        connection.close()
+
+
+def schedule_purge():
+    if not settings.DELETION_ASYNC:
+        for _ in purge():
+            pass
+        return None
+    return get_executor().submit(_purge_in_background)
+
+
+def schedule_purge_on_commit():
+    transaction.on_commit(schedule_purge)
@@ -1,7 +1,9 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
+from django.urls import reverse_lazy
 from django.utils import timezone
+from gardening import plant_types
 from gardening.models import Garden, Plant, PlantType, Note
 
 class RegisterForm(UserCreationForm):
@@ -15,12 +17,52 @@ class RegisterForm(UserCreationForm):
         model = User
         fields = ['username', 'email', 'password1', 'password2']
 
-class GardenForm(forms.ModelForm):
+# Chyby zachycené upload handlerem (příliš velký nebo neplatný obrázek) se zobrazí u pole
+class UploadErrorsMixin:
+    def __init__(self, *args, upload_errors=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.upload_errors = upload_errors or {}
+
+    def clean(self):
+        cleaned_data = super().clean()
+        for field_name, message in self.upload_errors.items():
+            if field_name in self.fields:
+                self.add_error(field_name, message)
+        return cleaned_data
+
+# Výběr hostů bez načítání všech uživatelů: vykreslí jen ty vybrané a pole pro
+# hledání, další se přidávají přes user_autocomplete. Formulář odešle jen id
+# vybraných a ModelMultipleChoiceField ověří jen je.
+class GuestPickerWidget(forms.SelectMultiple):
+    template_name = 'widgets/guest_picker.html'
+
+    def __init__(self, attrs=None, autocomplete_url=reverse_lazy('user_autocomplete')):
+        super().__init__(attrs)
+        self.autocomplete_url = autocomplete_url
+
+    # Options for the selected users only, looked up by id
+    def optgroups(self, name, value, attrs=None):
+        selected = [pk for pk in value if str(pk).isdigit()]
+        if not selected:
+            return []
+        users = self.choices.queryset.filter(pk__in=selected).order_by('username')
+        return [
+            (None, [self.create_option(name, user.pk, str(user), True, index, attrs=attrs)], index)
+            for index, user in enumerate(users)
+        ]
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context['widget']['autocomplete_url'] = self.autocomplete_url
+        return context
+
+
+class GardenForm(UploadErrorsMixin, forms.ModelForm):
     class Meta:
         model = Garden
         fields = ['name', 'description', 'image', 'users_with_access']
         widgets = {
-            'users_with_access': forms.CheckboxSelectMultiple,
+            'users_with_access': GuestPickerWidget,
         }
 
     def __init__(self, *args, **kwargs):
@@ -29,12 +71,17 @@ class GardenForm(forms.ModelForm):
         if user:
             self.fields['users_with_access'].queryset = User.objects.exclude(id=user.id)
 
-class PlantForm(forms.ModelForm):
+class PlantForm(UploadErrorsMixin, forms.ModelForm):
     plant_type_name = forms.CharField(
         max_length=100,
         required=True,
         label="Plant Type",
-        widget=forms.TextInput(attrs={'class': 'form-control'})
+        widget=forms.TextInput(attrs={
+            'class': 'form-control',
+            'autocomplete': 'off',
+            'list': 'plant-type-suggestions',
+            'data-autocomplete-url': reverse_lazy('plant_type_autocomplete'),
+        })
     )
 
     class Meta:
@@ -57,23 +104,20 @@ class PlantForm(forms.ModelForm):
         elif planted_date > timezone.now().date():
             self.add_error('planted_date', "Planted date cannot be in the future.")
 
-        # Handle plant type creation or reuse
-        if plant_type_name:
-            plant_type_obj, created = PlantType.objects.get_or_create(name=plant_type_name)
-            cleaned_data['plant_type'] = plant_type_obj
-        else:
+        # The type is only resolved here, a new row is created by save() of a valid form
+        if not plant_type_name:
             self.add_error('plant_type_name', "Please enter a plant type.")
 
         return cleaned_data
 
     def save(self, commit=True):
         instance = super().save(commit=False)
-        instance.plant_type = self.cleaned_data['plant_type']
+        instance.plant_type = plant_types.get_or_create(self.cleaned_data['plant_type_name'])
         if commit:
             instance.save()
         return instance
     
-class NoteForm(forms.ModelForm):
+class NoteForm(UploadErrorsMixin, forms.ModelForm):
     class Meta:
         model = Note
         fields = ['content', 'image', 'plant']
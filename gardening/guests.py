@@ -0,0 +1,34 @@
+from django.contrib.auth.models import User
+from django.db.models.functions import Collate
+
+# Vyhledávání uživatelů pro výběr hostů zahrádky. Hledá se začátek
+# uživatelského jména bez ohledu na velikost písmen, e-mail jen celý, aby
+# se nedalo po částech zjišťovat, které adresy jsou registrované. Indexy
+# s COLLATE NOCASE (migrace 0013) z LIKE 'abc%' udělají rozsah v indexu,
+# takže dotaz čte jen odpovídající řádky, ne celou tabulku uživatelů.
+
+SUGGESTION_LIMIT = 10
+MIN_QUERY_LENGTH = 2
+
+
+def _active_users(owner, **lookup):
+    return User.objects.filter(**lookup, is_active=True).exclude(pk=owner.pk)
+
+
+def _prefix_matches(field, query, owner, limit):
+    # Read in the order of the NOCASE index, so the first rows end the query
+    matches = _active_users(owner, **{f'{field}__istartswith': query})
+    return matches.order_by(Collate(field, 'NOCASE')).values_list('pk', 'username')[:limit]
+
+
+# Active users other than the garden owner whose username starts with query, or whose
+# e-mail is query. Each column is one short index range, an OR of both would sort every
+# match first.
+def suggest(query, owner, limit=SUGGESTION_LIMIT):
+    query = query.strip()
+    if len(query) < MIN_QUERY_LENGTH:
+        return []
+    found = dict(_prefix_matches('username', query, owner, limit))
+    if '@' in query:
+        found.update(_active_users(owner, email__iexact=query).values_list('pk', 'username')[:limit])
+    return sorted(found.items(), key=lambda user: (user[1].casefold(), user[0]))[:limit]
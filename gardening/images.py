@@ -0,0 +1,124 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from gardening import caching
+
+# Zmenšené varianty nahraných obrázků. Vznikají po nahrání v samostatném
+# process poolu, šablony pak přes tag {% responsive_image %} posílají
+# prohlížeči srcset místo originálu v plném rozlišení.
+
+VARIANT_FORMATS = (
+    ('webp', 'WEBP', 'image/webp'),
+    ('jpg', 'JPEG', 'image/jpeg'),
+)
+
+
+def variant_name(name, width, ext):
+    base, _ = os.path.splitext(name)
+    return f'variants/{base}-{width}.{ext}'
+
+
+def variant_names(name):
+    return [
+        variant_name(name, width, ext)
+        for width in settings.IMAGE_VARIANT_WIDTHS
+        for ext, _, _ in VARIANT_FORMATS
+    ]
+
+
+# Runs inside the pool process: only file paths go in, no Django models or connections
+def render_variants(source_path, targets, quality):
+    with Image.open(source_path) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+        for target_path, width, pil_format in targets:
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            variant = image.copy()
+            variant.thumbnail((width, width * 4), Image.Resampling.LANCZOS)
+            if pil_format == 'JPEG' and variant.mode != 'RGB':
+                variant = variant.convert('RGB')
+            tmp_path = f'{target_path}.tmp'
+            variant.save(tmp_path, pil_format, quality=quality, optimize=True)
+            # Readers never see a half written variant
+            os.replace(tmp_path, target_path)
+    return len(targets)
+
+
+def _variant_targets(name, force=False):
+    targets = []
+    for width in settings.IMAGE_VARIANT_WIDTHS:
+        for ext, pil_format, _ in VARIANT_FORMATS:
+            target = variant_name(name, width, ext)
+            if force or not default_storage.exists(target):
+                targets.append((default_storage.path(target), width, pil_format))
+    return targets
+
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=settings.IMAGE_VARIANT_WORKERS)
+    return _executor
+
+
+# Cached pages of the gardens showing the image keep the original until their version changes
+def _bump_when_done(garden_ids):
+    def done(future):
+        if not future.cancelled() and future.exception() is None:
+            caching.bump_gardens(garden_ids)
+    return done
+
+
+# Schedules variant rendering for a stored image, returns the future or None when there is nothing
+# to do. garden_ids are the gardens showing the image, bumped once the variants are written.
+def schedule_variants(name, force=False, executor=None, garden_ids=()):
+    if not name:
+        return None
+    targets = _variant_targets(name, force)
+    if not targets:
+        return None
+    source = default_storage.path(name)
+    if not settings.IMAGE_VARIANTS_ASYNC and executor is None:
+        render_variants(source, targets, settings.IMAGE_VARIANT_QUALITY)
+        caching.bump_gardens(garden_ids)
+        return None
+    future = (executor or get_executor()).submit(render_variants, source, targets, settings.IMAGE_VARIANT_QUALITY)
+    future.add_done_callback(_bump_when_done(garden_ids))
+    return future
+
+
+# garden_ids may be a lazy queryset, it is read after commit when the links are saved
+def schedule_variants_on_commit(name, garden_ids=()):
+    transaction.on_commit(lambda: schedule_variants(name, garden_ids=list(garden_ids)))
+
+
+def delete_variants(name):
+    for variant in variant_names(name):
+        if default_storage.exists(variant):
+            default_storage.delete(variant)
+
+
+# (srcset, mime type) pairs for the variants that already exist, empty until the pool has
+# written some. Variants of widths added to IMAGE_VARIANT_WIDTHS later are left out until
+# generate_image_variants has rendered them.
+def variant_sources(name):
+    if not name:
+        return []
+    sources = []
+    for ext, _, mime in VARIANT_FORMATS:
+        names = [(variant_name(name, width, ext), width) for width in settings.IMAGE_VARIANT_WIDTHS]
+        srcset = ', '.join(
+            f'{default_storage.url(variant)} {width}w' for variant, width in names if default_storage.exists(variant)
+        )
+        if srcset:
+            sources.append((srcset, mime))
+    return sources
@@ -0,0 +1,77 @@
+from datetime import timedelta
+
+from django.db import close_old_connections
+from django.utils import timezone
+
+from gardening.models import RecommendationJob
+from gardening.recommendations import cached_recommendation, generate_recommendation
+
+ACTIVE_STATUSES = (RecommendationJob.PENDING, RecommendationJob.RUNNING)
+
+
+# Called from the web request, only inserts a row so the worker never blocks on inference.
+# Returns None when the current plant state is already answered by the recommendation cache.
+def enqueue_recommendation(plant, user=None):
+    if cached_recommendation(plant) is not None:
+        return None
+    job = RecommendationJob.objects.filter(plant=plant, status__in=ACTIVE_STATUSES).first()
+    if job is None:
+        job = RecommendationJob.objects.create(plant=plant, requested_by=user)
+    return job
+
+
+# Pending jobs are claimed with a conditional UPDATE, so several workers never run the same job
+def claim_jobs(limit):
+    claimed = []
+    candidates = RecommendationJob.objects.filter(status=RecommendationJob.PENDING).order_by('created_at', 'id')
+    for job_id in candidates.values_list('id', flat=True)[:limit]:
+        updated = RecommendationJob.objects.filter(id=job_id, status=RecommendationJob.PENDING).update(
+            status=RecommendationJob.RUNNING,
+            started_at=timezone.now(),
+        )
+        if updated:
+            claimed.append(job_id)
+    return claimed
+
+
+# Running jobs left behind by a crashed worker go back to the queue
+def requeue_stale_jobs(older_than):
+    return RecommendationJob.objects.filter(
+        status=RecommendationJob.RUNNING,
+        started_at__lt=timezone.now() - timedelta(seconds=older_than),
+    ).update(status=RecommendationJob.PENDING, started_at=None)
+
+
+def _run(job_id):
+    job = RecommendationJob.objects.select_related('plant__plant_type').filter(id=job_id).first()
+    if job is None:
+        # Plant was deleted while the job was waiting
+        return None
+    try:
+        job.recommendation = generate_recommendation(job.plant)
+    except Exception as exc:
+        job.status = RecommendationJob.FAILED
+        job.error = f'{type(exc).__name__}: {exc}'
+    else:
+        job.status = RecommendationJob.DONE
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error', 'recommendation', 'finished_at'])
+    return job.status
+
+
+def run_job(job_id):
+    close_old_connections()
+    try:
+        return _run(job_id)
+    except Exception as exc:
+        # The result or the status could not be saved, e.g. the database was locked.
+        # The job must not stay RUNNING; if even this fails, requeue_stale_jobs takes it.
+        close_old_connections()
+        RecommendationJob.objects.filter(id=job_id, status=RecommendationJob.RUNNING).update(
+            status=RecommendationJob.FAILED,
+            error=f'{type(exc).__name__}: {exc}',
+            finished_at=timezone.now(),
+        )
+        return RecommendationJob.FAILED
+    finally:
+        close_old_connections()
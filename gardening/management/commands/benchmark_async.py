@@ -0,0 +1,81 @@
+import json
+import logging
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from gardening.benchmark import SCENARIOS, AsgiLoadRunner, LoadRunner, benchmark_targets
+
+READ_SCENARIOS = ['dashboard', 'gardens', 'garden_detail', 'recommendations']
+
+
+class Command(BaseCommand):
+    help = (
+        'Porovnání synchronních pohledů přes WSGI s asynchronními přes ASGI při mnoha pomalých '
+        'klientech, výsledek je JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenarios', nargs='+', choices=READ_SCENARIOS, default=READ_SCENARIOS)
+        parser.add_argument('--requests', type=int, default=400, help='Measured requests per scenario and server.')
+        parser.add_argument('--warmup', type=int, default=20, help='Unmeasured requests per scenario and server.')
+        parser.add_argument('--clients', type=int, default=100, help='Concurrent clients.')
+        parser.add_argument('--workers', type=int, default=8, help='Worker threads of the WSGI server.')
+        parser.add_argument('--client-delay', type=float, default=50,
+                            help='Milliseconds each client needs to receive a response.')
+        parser.add_argument('--users', type=int, default=20, help='Number of garden owners to spread requests over.')
+        parser.add_argument('--prefix', help='Only use users with this username prefix, e.g. the one of seed_gardens.')
+        parser.add_argument('--host', default='localhost')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout.')
+
+    def handle(self, *args, **options):
+        targets = benchmark_targets(options['users'], options['prefix'])
+        if not targets:
+            raise CommandError('No garden with plants found, run seed_gardens first.')
+        client_delay = options['client_delay'] / 1000
+        runners = {
+            'wsgi': (LoadRunner(
+                concurrency=options['clients'], host=options['host'], workers=options['workers'],
+                client_delay=client_delay,
+            ), settings.ROOT_URLCONF),
+            'asgi': (AsgiLoadRunner(
+                concurrency=options['clients'], host=options['host'], client_delay=client_delay,
+            ), 'ZahradkaWeb.asgi_urls'),
+        }
+        # Set after the applications are loaded, django.setup() configures logging again
+        if options['verbosity'] < 2:
+            logging.getLogger('django.request').setLevel(logging.CRITICAL)
+
+        report = {
+            'debug': settings.DEBUG,
+            'clients': options['clients'],
+            'wsgi_workers': options['workers'],
+            'client_delay_ms': options['client_delay'],
+            'requests': options['requests'],
+            'targets': len(targets),
+            'scenarios': {},
+        }
+        for name in options['scenarios']:
+            scenario = SCENARIOS[name]
+            report['scenarios'][name] = {}
+            for server, (runner, urlconf) in runners.items():
+
+                def make_environ(i, scenario=scenario, runner=runner):
+                    user, garden_id, plant_id = targets[i % len(targets)]
+                    method, path, data = scenario(user, garden_id, plant_id, i)
+                    return runner.environ(user, method, path, data)
+
+                self.stderr.write(f'Running {name} ({server})...')
+                # Both servers run in this process, the ASGI one with the async views
+                with override_settings(ROOT_URLCONF=urlconf):
+                    report['scenarios'][name][server] = runner.run(
+                        make_environ, options['requests'], warmup=options['warmup'],
+                    )
+
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as report_file:
+                report_file.write(output + '\n')
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,78 @@
+import json
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from gardening.benchmark import WORDS
+from gardening.search import build_match_query
+
+SCHEMA = [
+    'CREATE TABLE note (id INTEGER PRIMARY KEY, content TEXT NOT NULL)',
+    "CREATE VIRTUAL TABLE note_fts USING fts5(content, tokenize = 'unicode61 remove_diacritics 2')",
+]
+
+
+class Command(BaseCommand):
+    help = 'Porovná fulltext FTS5 s LIKE skenem (jako admin icontains) na syntetických poznámkách.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--notes', type=int, default=1_000_000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--terms', nargs='+', default=['mšice', 'sklizeň', 'skleník rajčata', 'xylofon'])
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with tempfile.TemporaryDirectory() as tmp:
+            db = sqlite3.connect(os.path.join(tmp, 'bench.sqlite3'))
+            for statement in SCHEMA:
+                db.execute(statement)
+            self.stderr.write(f"Generating {options['notes']} notes...")
+            batch = []
+            for note_id in range(1, options['notes'] + 1):
+                batch.append((note_id, ' '.join(rng.choice(WORDS) for _ in range(rng.randint(8, 40)))))
+                if len(batch) == 10_000:
+                    self._insert(db, batch)
+                    batch = []
+            self._insert(db, batch)
+            db.execute("INSERT INTO note_fts(note_fts) VALUES ('optimize')")
+            db.commit()
+
+            report = {'notes': options['notes'], 'repeat': options['repeat'], 'queries': []}
+            for term in options['terms']:
+                words = term.split()
+                # The admin paginator counts the LIKE matches, which always scans the whole table
+                like_sql = 'SELECT COUNT(*) FROM note WHERE ' + ' AND '.join(['content LIKE ?'] * len(words))
+                like_params = [f'%{word}%' for word in words]
+                match = [build_match_query(term)]
+                report['queries'].append({
+                    'term': term,
+                    'like_count_ms': self._time(db, like_sql, like_params, options['repeat']),
+                    'fts_count_ms': self._time(
+                        db, 'SELECT COUNT(*) FROM note_fts WHERE note_fts MATCH ?', match, options['repeat'],
+                    ),
+                    'fts_ranked_top20_ms': self._time(
+                        db, 'SELECT rowid FROM note_fts WHERE note_fts MATCH ? ORDER BY bm25(note_fts) LIMIT 20',
+                        match, options['repeat'],
+                    ),
+                })
+            db.close()
+        self.stdout.write(json.dumps(report, indent=2, ensure_ascii=False))
+
+    def _insert(self, db, batch):
+        db.executemany('INSERT INTO note (id, content) VALUES (?, ?)', batch)
+        db.executemany('INSERT INTO note_fts (rowid, content) VALUES (?, ?)', batch)
+
+    # Median wall time in milliseconds
+    def _time(self, db, sql, params, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            db.execute(sql, params).fetchall()
+            timings.append((time.perf_counter() - started) * 1000)
+        return round(statistics.median(timings), 3)
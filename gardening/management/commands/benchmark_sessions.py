@@ -0,0 +1,78 @@
+import json
+import logging
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from gardening.auth import user_cache
+from gardening.benchmark import SCENARIOS, FreshLoadRunner, benchmark_targets
+
+READ_SCENARIOS = ['dashboard', 'gardens', 'garden_detail', 'recommendations']
+
+# (session engine, authentication backend), db is the setup before the session profiles
+PROFILES = {
+    'db': ('django.contrib.sessions.backends.db', 'django.contrib.auth.backends.ModelBackend'),
+    'cached_db': ('django.contrib.sessions.backends.cached_db', 'gardening.auth.CachedModelBackend'),
+    'signed_cookies': ('django.contrib.sessions.backends.signed_cookies', 'gardening.auth.CachedModelBackend'),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Porovnání počtu SQL dotazů a rychlosti přihlášených požadavků s různým ukládáním '
+        'session a s cache uživatele, výsledek je JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', nargs='+', choices=list(PROFILES), default=list(PROFILES))
+        parser.add_argument('--scenarios', nargs='+', choices=READ_SCENARIOS, default=READ_SCENARIOS)
+        parser.add_argument('--requests', type=int, default=200, help='Measured requests per scenario and profile.')
+        parser.add_argument('--warmup', type=int, default=20, help='Unmeasured requests per scenario and profile.')
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--users', type=int, default=20, help='Number of garden owners to spread requests over.')
+        parser.add_argument('--prefix', help='Only use users with this username prefix, e.g. the one of seed_gardens.')
+        parser.add_argument('--host', default='localhost')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout.')
+
+    def handle(self, *args, **options):
+        targets = benchmark_targets(options['users'], options['prefix'])
+        if not targets:
+            raise CommandError('No garden with plants found, run seed_gardens first.')
+
+        report = {
+            'debug': settings.DEBUG,
+            'cache': settings.CACHES[settings.SESSION_CACHE_ALIAS]['BACKEND'],
+            'concurrency': options['concurrency'],
+            'requests': options['requests'],
+            'targets': len(targets),
+            'profiles': {},
+        }
+        for profile in options['profiles']:
+            engine, backend = PROFILES[profile]
+            report['profiles'][profile] = {'session_engine': engine, 'backend': backend, 'scenarios': {}}
+            # Sessions are created and the middleware is loaded with the profile's settings
+            with override_settings(SESSION_ENGINE=engine, AUTHENTICATION_BACKENDS=[backend]):
+                user_cache.clear()
+                runner = FreshLoadRunner(concurrency=options['concurrency'], host=options['host'])
+                if options['verbosity'] < 2:
+                    logging.getLogger('django.request').setLevel(logging.CRITICAL)
+                for name in options['scenarios']:
+                    scenario = SCENARIOS[name]
+
+                    def make_environ(i, scenario=scenario):
+                        user, garden_id, plant_id = targets[i % len(targets)]
+                        method, path, data = scenario(user, garden_id, plant_id, i)
+                        return runner.environ(user, method, path, data)
+
+                    self.stderr.write(f'Running {name} ({profile})...')
+                    report['profiles'][profile]['scenarios'][name] = runner.run(
+                        make_environ, options['requests'], warmup=options['warmup'],
+                    )
+
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as report_file:
+                report_file.write(output + '\n')
+        else:
+            self.stdout.write(output)
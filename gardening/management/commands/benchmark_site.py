@@ -0,0 +1,64 @@
+import json
+import logging
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from gardening.benchmark import SCENARIOS, LoadRunner, benchmark_targets
+
+
+class Command(BaseCommand):
+    help = 'Zátěžový test hlavních stránek přes WSGI aplikaci, výsledek je JSON pro porovnání verzí.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS),
+                            help='note_post writes notes into the database.')
+        parser.add_argument('--requests', type=int, default=200, help='Measured requests per scenario.')
+        parser.add_argument('--warmup', type=int, default=10, help='Unmeasured requests per scenario.')
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--users', type=int, default=20, help='Number of garden owners to spread requests over.')
+        parser.add_argument('--prefix', help='Only use users with this username prefix, e.g. the one of seed_gardens.')
+        parser.add_argument('--host', default='localhost')
+        parser.add_argument('--label', default='', help='Free text stored in the report, e.g. a release.')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout.')
+
+    def handle(self, *args, **options):
+        targets = benchmark_targets(options['users'], options['prefix'])
+        if not targets:
+            raise CommandError('No garden with plants found, run seed_gardens first.')
+        if settings.DEBUG:
+            self.stderr.write('DEBUG is on, numbers include its per-query bookkeeping.')
+
+        runner = LoadRunner(concurrency=options['concurrency'], host=options['host'])
+        # Failed requests are counted in the report, tracebacks only with -v 2.
+        # Set after the WSGI application is loaded, django.setup() configures logging again.
+        if options['verbosity'] < 2:
+            logging.getLogger('django.request').setLevel(logging.CRITICAL)
+
+        report = {
+            'label': options['label'],
+            'database': connection.vendor,
+            'debug': settings.DEBUG,
+            'concurrency': options['concurrency'],
+            'requests': options['requests'],
+            'targets': len(targets),
+            'scenarios': {},
+        }
+        for name in options['scenarios']:
+            scenario = SCENARIOS[name]
+
+            def make_environ(i, scenario=scenario):
+                user, garden_id, plant_id = targets[i % len(targets)]
+                method, path, data = scenario(user, garden_id, plant_id, i)
+                return runner.environ(user, method, path, data)
+
+            self.stderr.write(f'Running {name}...')
+            report['scenarios'][name] = runner.run(make_environ, options['requests'], warmup=options['warmup'])
+
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as report_file:
+                report_file.write(output + '\n')
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,44 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from gardening import transfer
+from gardening.models import Garden
+
+
+class Command(BaseCommand):
+    help = 'Streamuje export zahrádek, rostlin, poznámek a doporučení do JSONL, CSV nebo taru s médii.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help="Output file, '-' for stdout.")
+        parser.add_argument('--format', choices=['jsonl', 'csv', 'tar'],
+                            help='Defaults to the extension of the output file.')
+        parser.add_argument('--owner', help='Only export gardens owned by this username.')
+        parser.add_argument('--garden', type=int, action='append', dest='gardens',
+                            help='Only export this garden id (repeatable).')
+
+    def handle(self, *args, **options):
+        gardens = Garden.objects.all()
+        if options['owner']:
+            gardens = gardens.filter(owner__username=options['owner'])
+        if options['gardens']:
+            gardens = gardens.filter(pk__in=options['gardens'])
+        output_format = options['format'] or transfer.detect_format(options['output'])
+        if output_format == 'tar':
+            if options['output'] == '-':
+                raise CommandError('A tar export needs an output file.')
+            with open(options['output'], 'wb') as out:
+                for chunk in transfer.iter_tar(gardens):
+                    out.write(chunk)
+            return
+        chunks = transfer.iter_csv if output_format == 'csv' else transfer.iter_jsonl
+        if options['output'] == '-':
+            out = sys.stdout
+        else:
+            out = open(options['output'], 'w', encoding='utf-8', newline='')
+        try:
+            for chunk in chunks(transfer.iter_records(gardens)):
+                out.write(chunk)
+        finally:
+            if out is not sys.stdout:
+                out.close()
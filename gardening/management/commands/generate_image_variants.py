@@ -0,0 +1,40 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from gardening.images import schedule_variants
+from gardening.models import Garden, Note, Plant
+
+
+class Command(BaseCommand):
+    help = 'Vygeneruje chybějící varianty obrázků zahrádek, rostlin a poznámek.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.IMAGE_VARIANT_WORKERS,
+                            help='Number of processes rendering variants.')
+        parser.add_argument('--force', action='store_true',
+                            help='Render variants again even if they already exist.')
+
+    def handle(self, *args, **options):
+        scheduled = failed = 0
+        with ProcessPoolExecutor(max_workers=max(1, options['workers'])) as executor:
+            futures = {}
+            # Gardens showing each image, their cached pages are refreshed once its variants exist
+            images = {}
+            for model, garden in ((Garden, 'pk'), (Plant, 'garden_id'), (Note, 'plant__garden_id')):
+                rows = model.objects.exclude(image='').exclude(image__isnull=True).values_list('image', garden)
+                for name, garden_id in rows.iterator(chunk_size=2000):
+                    images.setdefault(name, set()).add(garden_id)
+            for name, garden_ids in images.items():
+                future = schedule_variants(name, force=options['force'], executor=executor, garden_ids=garden_ids)
+                if future is not None:
+                    futures[future] = name
+            for future in as_completed(futures):
+                exc = future.exception()
+                if exc is None:
+                    scheduled += 1
+                else:
+                    failed += 1
+                    self.stderr.write(f'{futures[future]}: {exc}')
+        self.stdout.write(self.style.SUCCESS(f'Rendered variants for {scheduled} image(s), {failed} failed.'))
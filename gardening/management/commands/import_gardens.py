@@ -0,0 +1,46 @@
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from gardening import transfer
+
+
+class Command(BaseCommand):
+    help = 'Dávkově naimportuje export vytvořený příkazem export_gardens.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help="Input file, '-' for stdin (JSONL or CSV).")
+        parser.add_argument('--format', choices=['jsonl', 'csv', 'tar'],
+                            help='Defaults to the extension of the input file.')
+        parser.add_argument('--owner', help='Assign all imported gardens to this username.')
+        parser.add_argument('--create-users', action='store_true',
+                            help='Create missing owners and guests as users without a usable password.')
+        parser.add_argument('--batch-size', type=int, default=transfer.CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        owner = None
+        if options['owner']:
+            owner = User.objects.filter(username=options['owner']).first()
+            if owner is None:
+                raise CommandError(f"User {options['owner']!r} does not exist.")
+        importer = transfer.Importer(
+            owner=owner, create_users=options['create_users'], batch_size=options['batch_size'],
+        )
+        input_format = options['format'] or transfer.detect_format(options['input'])
+        try:
+            if input_format == 'tar':
+                with open(options['input'], 'rb') as archive:
+                    counts = importer.run_tar(archive)
+            else:
+                reader = transfer.read_csv if input_format == 'csv' else transfer.read_jsonl
+                if options['input'] == '-':
+                    counts = importer.run(reader(sys.stdin))
+                else:
+                    with open(options['input'], encoding='utf-8', newline='') as lines:
+                        counts = importer.run(reader(lines))
+        except (KeyError, ValueError) as exc:
+            raise CommandError(f'Import failed: {exc}')
+        self.stdout.write(self.style.SUCCESS(
+            ', '.join(f'{count} {record_type}(s)' for record_type, count in counts.items()) + ' imported.'
+        ))
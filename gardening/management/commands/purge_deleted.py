@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from gardening import deletion
+
+
+class Command(BaseCommand):
+    help = 'Po dávkách smaže obsah smazaných zahrádek a rostlin a poznámky, které nepatří k žádné rostlině.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--orphans', action='store_true',
+                            help='Also look through all notes for ones linked to no plant.')
+
+    def handle(self, *args, **options):
+        purged = {}
+        for model, rows in deletion.purge(batch_size=options['batch_size']):
+            name = model._meta.verbose_name_plural
+            purged[name] = purged.get(name, 0) + rows
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{name}: {rows} row(s) purged')
+        for name, rows in purged.items():
+            self.stdout.write(self.style.SUCCESS(f'{name}: {rows} row(s) purged.'))
+        if options['orphans']:
+            orphans = sum(deletion.purge_orphan_notes(batch_size=options['batch_size']))
+            self.stdout.write(self.style.SUCCESS(f'{orphans} orphaned note(s) deleted.'))
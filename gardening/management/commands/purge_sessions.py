@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from gardening.auth import purge_expired_sessions
+
+
+class Command(BaseCommand):
+    help = 'Smaže vypršené session z databáze po dávkách, každou dávku v samostatné transakci.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        total = 0
+        for deleted in purge_expired_sessions(batch_size=options['batch_size']):
+            total += deleted
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{deleted} session(s) deleted')
+        self.stdout.write(self.style.SUCCESS(f'{total} expired session(s) deleted.'))
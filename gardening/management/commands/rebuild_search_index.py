@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from gardening import search
+
+
+class Command(BaseCommand):
+    help = 'Znovu sestaví fulltextový index poznámek, rostlin a zahrádek.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        if not search.is_available():
+            raise CommandError('Fulltext search requires SQLite with FTS5.')
+        search.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS('Search index rebuilt.'))
@@ -0,0 +1,60 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from gardening.jobs import claim_jobs, requeue_stale_jobs, run_job
+
+
+# Forked processes must not reuse (or close) the parent's database connection
+def _discard_inherited_connections():
+    for conn in connections.all(initialized_only=True):
+        conn.connection = None
+
+
+class Command(BaseCommand):
+    help = 'Zpracovává frontu požadavků na AI doporučení.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.AI_RECOMMENDATION_WORKERS,
+                            help='Number of jobs processed in parallel.')
+        parser.add_argument('--pool', choices=['thread', 'process'], default='thread',
+                            help='Use threads (I/O bound providers) or processes (CPU bound providers).')
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help='Seconds to sleep when the queue is empty.')
+        parser.add_argument('--stale-after', type=int, default=600,
+                            help='Requeue running jobs that started more than this many seconds ago.')
+        parser.add_argument('--once', action='store_true',
+                            help='Process the jobs currently in the queue and exit.')
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        if options['pool'] == 'process':
+            connections.close_all()
+            executor = ProcessPoolExecutor(max_workers=workers, initializer=_discard_inherited_connections)
+        else:
+            executor = ThreadPoolExecutor(max_workers=workers)
+
+        processed = 0
+        with executor:
+            while True:
+                # Every round, a job another worker left RUNNING is not stuck until a restart
+                requeued = requeue_stale_jobs(options['stale_after'])
+                if requeued:
+                    self.stdout.write(f'Requeued {requeued} stale job(s).')
+                job_ids = claim_jobs(workers)
+                if not job_ids:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+                futures = [executor.submit(run_job, job_id) for job_id in job_ids]
+                wait(futures)
+                for future in futures:
+                    exc = future.exception()
+                    if exc is not None:
+                        self.stderr.write(f'Job crashed: {exc!r}')
+                processed += len(job_ids)
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} job(s).'))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from gardening import counters
+
+
+class Command(BaseCommand):
+    help = 'Přepočítá počty rostlin a poznámek a časy poslední aktivity zahrádek a rostlin a opraví rozdíly.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report rows with wrong counters, change nothing.')
+
+    def handle(self, *args, **options):
+        checked, repaired = {}, {}
+        for model, rows, drifted in counters.repair(batch_size=options['batch_size'], dry_run=options['dry_run']):
+            name = model._meta.verbose_name_plural
+            checked[name] = checked.get(name, 0) + rows
+            repaired[name] = repaired.get(name, 0) + drifted
+            if drifted and options['verbosity'] > 1:
+                self.stdout.write(f'{name}: {drifted} of {rows} row(s) in batch drifted')
+        verb = 'would be repaired' if options['dry_run'] else 'repaired'
+        for name in checked:
+            self.stdout.write(self.style.SUCCESS(f'{name}: {repaired[name]} of {checked[name]} row(s) {verb}.'))
@@ -0,0 +1,46 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from gardening import search
+from gardening.benchmark import Seeder
+
+
+class Command(BaseCommand):
+    help = 'Vygeneruje syntetické uživatele, zahrádky, rostliny, poznámky a doporučení hromadnými inserty.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--gardens', type=int, default=2, help='Gardens per user.')
+        parser.add_argument('--guests', type=int, default=2, help='Users every garden is shared with.')
+        parser.add_argument('--plants', type=int, default=20, help='Plants per garden.')
+        parser.add_argument('--notes', type=int, default=10, help='Notes per plant.')
+        parser.add_argument('--multi-plant', type=float, default=0.2,
+                            help='Share of notes that also belong to other plants of the garden.')
+        parser.add_argument('--recommendations', type=int, default=3, help='Recommendation history per plant.')
+        parser.add_argument('--prefix', default='seed', help='Username prefix of the generated users.')
+        parser.add_argument('--password', default='seed', help='Password of every generated user.')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--no-index', action='store_true', help='Skip rebuilding the search index.')
+
+    def handle(self, *args, **options):
+        if User.objects.filter(username__startswith=options['prefix']).exists():
+            raise CommandError(f"Users with prefix {options['prefix']!r} already exist, choose another --prefix.")
+        seeder = Seeder(
+            users=options['users'],
+            gardens=options['gardens'],
+            guests=options['guests'],
+            plants=options['plants'],
+            notes=options['notes'],
+            multi_plant=options['multi_plant'],
+            recommendations=options['recommendations'],
+            prefix=options['prefix'],
+            password=options['password'],
+            seed=options['seed'],
+        )
+        counts = seeder.run()
+        # Bulk inserts bypass the signals that keep the search index in sync
+        if not options['no_index'] and search.is_available():
+            search.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            ', '.join(f'{count} {record_type}(s)' for record_type, count in counts.items()) + ' created.'
+        ))
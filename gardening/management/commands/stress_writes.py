@@ -0,0 +1,39 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from gardening.benchmark import stress_writes
+from gardening.models import Plant
+from gardening.sqlite import pragma_values
+
+
+class Command(BaseCommand):
+    help = 'Souběžné zápisy poznámek z více vláken, selže při chybě "database is locked".'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--transactions', type=int, default=400, help='Notes written in total, they are kept.')
+        parser.add_argument('--plants', type=int, default=20, help='Number of plants to spread the notes over.')
+        parser.add_argument('--prefix', help='Only use plants of users with this username prefix.')
+
+    def handle(self, *args, **options):
+        plants = Plant.objects.order_by('pk')
+        if options['prefix']:
+            plants = plants.filter(garden__owner__username__startswith=options['prefix'])
+        plant_ids = list(plants.values_list('pk', flat=True)[:options['plants']])
+        if not plant_ids:
+            raise CommandError('No plants found, run seed_gardens first.')
+
+        report = {
+            'database': connection.vendor,
+            'threads': options['threads'],
+            'conn_max_age': connection.settings_dict['CONN_MAX_AGE'],
+            'transaction_mode': connection.settings_dict['OPTIONS'].get('transaction_mode'),
+        }
+        if connection.vendor == 'sqlite':
+            report['pragmas'] = pragma_values(connection)
+        report.update(stress_writes(plant_ids, options['threads'], options['transactions']))
+        self.stdout.write(json.dumps(report, indent=2, sort_keys=True))
+        if report['lock_errors'] or report['other_errors']:
+            raise CommandError(f"{report['lock_errors'] + report['other_errors']} transactions failed.")
@@ -0,0 +1,27 @@
+from urllib.request import urlopen
+
+from django.core.management.base import BaseCommand, CommandError
+
+from gardening.assets import VENDOR_ASSETS, VENDOR_ROOT
+
+
+class Command(BaseCommand):
+    help = 'Stáhne připnuté verze Bootstrapu a Bootstrap Icons do gardening/static/vendor.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Download files that exist already again.')
+
+    def handle(self, *args, **options):
+        for url, name in VENDOR_ASSETS:
+            path = VENDOR_ROOT / name
+            if path.exists() and not options['force']:
+                continue
+            try:
+                with urlopen(url, timeout=30) as response:
+                    content = response.read()
+            except OSError as exc:
+                raise CommandError(f'Cannot download {url}: {exc}')
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(content)
+            self.stdout.write(f'{name} ({len(content)} bytes)')
+        self.stdout.write(self.style.SUCCESS(f'Vendored assets are in {VENDOR_ROOT}.'))
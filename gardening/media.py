@@ -0,0 +1,170 @@
+import mimetypes
+import os
+import re
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from gardening import caching
+from gardening.images import VARIANT_FORMATS
+from gardening.models import Garden, Note, Plant
+
+# Nahrané obrázky zahrádek, rostlin a poznámek mimo DEBUG. Obrázek vidí jen ten,
+# kdo vidí některou zahrádku, ke které patří (zmenšené varianty patří ke svému
+# originálu). Soubor se posílá přes FileResponse s podporou Range a ETag, nebo
+# ho podle MEDIA_ACCEL doručí reverzní proxy (X-Accel-Redirect / X-Sendfile).
+
+# Upload directory of each model's image field, e.g. 'plants'
+UPLOAD_DIRS = {model._meta.get_field('image').upload_to.strip('/'): model for model in (Garden, Plant, Note)}
+
+_VARIANT = re.compile(
+    r'^variants/(?P<base>.+)-\d+\.(?:%s)$' % '|'.join(re.escape(ext) for ext, _, _ in VARIANT_FORMATS)
+)
+
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+# Gardens the user can view that reference the image. A variant name stands for
+# its original, whose extension is unknown: every original with the same base
+# name is read through the index and compared here.
+def _image_garden_ids(user, name):
+    variant = _VARIANT.match(name)
+    base = variant['base'] if variant else None
+    model = UPLOAD_DIRS.get((base or name).split('/', 1)[0])
+    if model is None:
+        return []
+    guest_of = Garden.users_with_access.through.objects.filter(user_id=user.pk).values('garden_id')
+    if model is Garden:
+        rows, image, garden = Garden.objects.all(), 'image', 'pk'
+        visible = Q(owner=user) | Q(pk__in=guest_of)
+    elif model is Plant:
+        rows, image, garden = Plant.objects.all(), 'image', 'garden_id'
+        visible = Q(garden__owner=user) | Q(garden_id__in=guest_of)
+    else:
+        rows, image, garden = Note.plant.through.objects.all(), 'note__image', 'plant__garden_id'
+        visible = Q(plant__garden__owner=user) | Q(plant__garden_id__in=guest_of)
+    if base is None:
+        rows = rows.filter(visible, **{image: name})
+    else:
+        rows = rows.filter(visible, **{f'{image}__gte': f'{base}.', f'{image}__lt': f'{base}/'})
+    pairs = rows.order_by().values_list(garden, image).distinct()
+    return sorted({
+        garden_id for garden_id, stored in pairs
+        if base is None or os.path.splitext(stored)[0] == base
+    })
+
+
+# Cached per user and image. Guest changes bump the user version, other changes
+# of the gardens found bump theirs. Denials are not cached: they depend on no garden,
+# and an image added to a garden the user can see must be served at once.
+def can_view(user, name):
+    if not user.is_authenticated:
+        return False
+    if user.is_superuser:
+        return True
+    return bool(caching.cached(
+        'media_access', caching.user_version(user.pk), (name,),
+        lambda: _image_garden_ids(user, name), depends_on=lambda garden_ids: garden_ids, keep=bool,
+    ))
+
+
+# (first, last) byte of a single satisfiable range, None to send the whole file and
+# False when the range cannot be satisfied. Several ranges get the whole file.
+def parse_range(header, size):
+    match = _RANGE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        if int(last) == 0:
+            return False
+        return max(0, size - int(last)), size - 1
+    if last and int(last) < int(first):
+        return None
+    if int(first) >= size:
+        return False
+    return int(first), min(int(last), size - 1) if last else size - 1
+
+
+# Reads at most length bytes. Without fileno() a server's wsgi.file_wrapper cannot
+# sendfile() past the range and iterates read() instead.
+class _FileRange:
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def _file_response(request, name, path, info, etag):
+    content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    # The proxy sends the file itself, including ranges
+    if settings.MEDIA_ACCEL == 'x-accel-redirect':
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX + quote(name)
+        return response
+    if settings.MEDIA_ACCEL == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = path
+        return response
+
+    byte_range = None
+    if 'Range' in request.headers:
+        # A range of another version of the file would be mixed with the cached rest
+        if_range = request.headers.get('If-Range')
+        if if_range is None or if_range in (etag, http_date(info.st_mtime)):
+            byte_range = parse_range(request.headers['Range'], info.st_size)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{info.st_size}'
+        return response
+
+    file = open(path, 'rb')
+    if byte_range is None:
+        # Whole files go to wsgi.file_wrapper, i.e. sendfile() where the server has it
+        response = FileResponse(file, content_type=content_type)
+    else:
+        first, last = byte_range
+        file.seek(first)
+        response = FileResponse(_FileRange(file, last - first + 1), content_type=content_type, status=206)
+        response['Content-Range'] = f'bytes {first}-{last}/{info.st_size}'
+        response['Content-Length'] = last - first + 1
+    response.headers.pop('Content-Disposition', None)
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+# Response for a stored file, the caller checks access first
+def serve(request, name):
+    try:
+        path = default_storage.path(name)
+        info = os.stat(path)
+    except (SuspiciousFileOperation, OSError, ValueError):
+        raise Http404('No image matches the given query.')
+    if not stat.S_ISREG(info.st_mode):
+        raise Http404('No image matches the given query.')
+
+    etag = f'"{info.st_mtime_ns:x}-{info.st_size:x}"'
+    response = get_conditional_response(request, etag=etag, last_modified=int(info.st_mtime))
+    if response is None:
+        response = _file_response(request, name, path, info, etag)
+        response['Last-Modified'] = http_date(info.st_mtime)
+    response['ETag'] = etag
+    # Private, the image is only for users with access to its garden
+    response['Cache-Control'] = f'private, max-age={settings.MEDIA_CACHE_MAX_AGE}'
+    return response
@@ -0,0 +1,258 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+# Měření každého požadavku (SQL, šablony, velikost odpovědi, celková doba)
+# agregované do histogramů v paměti procesu. Endpoint /metrics je vypisuje
+# v textovém formátu Prometheus, každý proces aplikace má vlastní čísla.
+
+logger = logging.getLogger('gardening.slow_requests')
+
+_REQUEST_ATTR = '_request_metrics'
+
+# Collectors of the current request or benchmark call. A context variable instead of
+# connection.execute_wrapper(), the async ORM runs queries on another thread's connection.
+_collectors = ContextVar('gardening_sql_collectors', default=())
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            values = dict(self.values)
+        for labels, value in sorted(values.items()):
+            yield f'{self.name}{_labels(self.labelnames, labels)} {_number(value)}'
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # labels -> [count per bucket..., +Inf count, sum]
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self.lock:
+            state = self.values.get(labels)
+            if state is None:
+                state = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += 1
+            state[-1] += value
+
+    def samples(self):
+        with self.lock:
+            values = {labels: list(state) for labels, state in self.values.items()}
+        for labels, state in sorted(values.items()):
+            for bound, count in zip(self.buckets, state):
+                yield f'{self.name}_bucket{_labels(self.labelnames, labels, [("le", _number(bound))])} {count}'
+            yield f'{self.name}_bucket{_labels(self.labelnames, labels, [("le", "+Inf")])} {state[-2]}'
+            yield f'{self.name}_sum{_labels(self.labelnames, labels)} {_number(state[-1])}'
+            yield f'{self.name}_count{_labels(self.labelnames, labels)} {state[-2]}'
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        for metric in self.metrics:
+            with metric.lock:
+                metric.values.clear()
+
+
+registry = Registry()
+
+requests_total = registry.register(Counter(
+    'zahradka_requests_total', 'Finished requests.', ('view', 'method', 'status'),
+))
+request_duration = registry.register(Histogram(
+    'zahradka_request_duration_seconds', 'Time spent in Django per request.', ('view',), LATENCY_BUCKETS,
+))
+sql_queries = registry.register(Histogram(
+    'zahradka_request_sql_queries', 'SQL queries per request.', ('view',), QUERY_BUCKETS,
+))
+sql_duration = registry.register(Histogram(
+    'zahradka_request_sql_seconds', 'Time spent executing SQL per request.', ('view',), LATENCY_BUCKETS,
+))
+template_duration = registry.register(Histogram(
+    'zahradka_request_template_seconds', 'Time spent rendering templates per request.', ('view',), LATENCY_BUCKETS,
+))
+response_size = registry.register(Histogram(
+    'zahradka_response_size_bytes', 'Response body size, streamed responses are not included.', ('view',),
+    SIZE_BUCKETS,
+))
+
+
+# Collector.record(seconds, sql) is called for every query run within the block,
+# also on threads the block hands work to through sync_to_async()
+@contextmanager
+def collect(collector):
+    token = _collectors.set((*_collectors.get(), collector))
+    try:
+        yield collector
+    finally:
+        _collectors.reset(token)
+
+
+def _execute_wrapper(execute, sql, params, many, context):
+    collectors = _collectors.get()
+    if not collectors:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        for collector in collectors:
+            collector.record(elapsed, sql)
+
+
+@receiver(connection_created)
+def install_execute_wrapper(sender, connection, **kwargs):
+    # Wrappers survive reconnects of the same connection object
+    if _execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_execute_wrapper)
+
+
+# Collected for one request
+class RequestMetrics:
+    __slots__ = ('sql_count', 'sql_seconds', 'template_seconds', 'queries')
+
+    def __init__(self, keep_queries=False):
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+        self.queries = [] if keep_queries else None
+
+    def record(self, seconds, sql):
+        self.sql_count += 1
+        self.sql_seconds += seconds
+        if self.queries is not None:
+            self.queries.append((seconds, sql))
+
+
+def add_template_time(request, seconds):
+    collector = getattr(request, _REQUEST_ATTR, None)
+    if collector is not None:
+        collector.template_seconds += seconds
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None and match.view_name else 'unresolved'
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.slow_seconds = settings.METRICS_SLOW_REQUEST_SECONDS
+        # Under ASGI the middleware stays async, async views then run without a thread switch
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        collector = RequestMetrics(keep_queries=self.slow_seconds is not None)
+        setattr(request, _REQUEST_ATTR, collector)
+        started = time.perf_counter()
+        with collect(collector):
+            response = self.get_response(request)
+        return self.finish(request, response, collector, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        collector = RequestMetrics(keep_queries=self.slow_seconds is not None)
+        setattr(request, _REQUEST_ATTR, collector)
+        started = time.perf_counter()
+        with collect(collector):
+            response = await self.get_response(request)
+        return self.finish(request, response, collector, time.perf_counter() - started)
+
+    def finish(self, request, response, collector, elapsed):
+        view = view_name(request)
+        labels = (view,)
+        requests_total.inc((view, request.method, str(response.status_code)))
+        request_duration.observe(labels, elapsed)
+        sql_queries.observe(labels, collector.sql_count)
+        sql_duration.observe(labels, collector.sql_seconds)
+        template_duration.observe(labels, collector.template_seconds)
+        if not response.streaming:
+            response_size.observe(labels, len(response.content))
+
+        if self.slow_seconds is not None and elapsed >= self.slow_seconds:
+            self.log_slow_request(request, view, elapsed, collector)
+        return response
+
+    def log_slow_request(self, request, view, elapsed, collector):
+        slowest = sorted(collector.queries, key=lambda query: query[0], reverse=True)
+        slowest = slowest[:settings.METRICS_SLOW_REQUEST_QUERIES]
+        logger.warning(
+            'Slow request %s %s (%s): %.1f ms total, %d queries in %.1f ms, templates %.1f ms\n%s',
+            request.method, request.get_full_path(), view, elapsed * 1000,
+            collector.sql_count, collector.sql_seconds * 1000, collector.template_seconds * 1000,
+            '\n'.join(f'  {seconds * 1000:8.1f} ms  {sql}' for seconds, sql in slowest),
+        )
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.3 on 2026-10-18 14:52
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gardening', '0005_planttype_plant_plant_type'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecommendationJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Čeká'), ('running', 'Zpracovává se'), ('done', 'Hotovo'), ('failed', 'Chyba')], default='pending', max_length=10, verbose_name='Stav')),
+                ('error', models.TextField(blank=True, verbose_name='Chyba')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Vytvořeno')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Zahájeno')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Dokončeno')),
+                ('plant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendation_jobs', to='gardening.plant', verbose_name='Rostlina')),
+                ('recommendation', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='gardening.airecommendation', verbose_name='Výsledné doporučení')),
+                ('requested_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Zadal')),
+            ],
+            options={
+                'verbose_name': 'Úloha AI doporučení',
+                'verbose_name_plural': 'Úlohy AI doporučení',
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='gardening_job_status_idx')],
+            },
+        ),
+    ]
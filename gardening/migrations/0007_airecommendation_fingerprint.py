@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 14:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gardening', '0006_recommendationjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='airecommendation',
+            name='fingerprint',
+            field=models.CharField(blank=True, db_index=True, help_text='SHA-256 ze stavu rostliny, ze kterého bylo doporučení vygenerováno', max_length=64, verbose_name='Otisk vstupů'),
+        ),
+    ]
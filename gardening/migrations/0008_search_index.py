@@ -0,0 +1,52 @@
+from django.db import migrations
+
+# FTS5 tabulky existují jen na SQLite, na jiných databázích migrace nic nedělá
+
+CREATE_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS gardening_search_doc (
+        id INTEGER PRIMARY KEY,
+        kind TEXT NOT NULL,
+        object_id INTEGER NOT NULL,
+        garden_id INTEGER NOT NULL,
+        plant_id INTEGER
+    )
+    """,
+    'CREATE INDEX IF NOT EXISTS gardening_search_doc_object_idx ON gardening_search_doc (kind, object_id)',
+    'CREATE INDEX IF NOT EXISTS gardening_search_doc_garden_idx ON gardening_search_doc (garden_id)',
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS gardening_search USING fts5(
+        title,
+        body,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+]
+
+DROP_SQL = [
+    'DROP TABLE IF EXISTS gardening_search',
+    'DROP TABLE IF EXISTS gardening_search_doc',
+]
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in CREATE_SQL:
+            schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in DROP_SQL:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gardening', '0007_airecommendation_fingerprint'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.3 on 2026-10-18 15:02
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gardening', '0008_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='airecommendation',
+            index=models.Index(fields=['plant', 'created_at', 'id'], name='gardening_rec_plant_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='garden',
+            index=models.Index(fields=['owner', 'name', 'id'], name='gardening_garden_owner_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='plant',
+            index=models.Index(fields=['garden', 'name', 'id'], name='gardening_plant_garden_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.3 on 2026-10-18 18:20
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gardening', '0009_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='garden',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, help_text='Čas poslední změny zahrádky nebo jejího obsahu', verbose_name='Naposledy změněno'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='note',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, help_text='Čas poslední změny poznámky', verbose_name='Naposledy změněno'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='plant',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, help_text='Čas poslední změny rostliny, jejích poznámek nebo doporučení', verbose_name='Naposledy změněno'),
+            preserve_default=False,
+        ),
+    ]
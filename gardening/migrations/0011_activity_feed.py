@@ -0,0 +1,40 @@
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models.functions import Cast
+
+
+# Existing notes only know their date, they are placed at its midnight
+def backfill_created_at(apps, schema_editor):
+    Note = apps.get_model('gardening', 'Note')
+    Note.objects.update(created_at=Cast('date', models.DateTimeField()))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gardening', '0010_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='note',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, help_text='Čas vytvoření poznámky, podle něj se řadí aktivita zahrádky', verbose_name='Vytvořeno'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_created_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='note',
+            index=models.Index(fields=['created_at', 'id'], name='gardening_note_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='airecommendation',
+            index=models.Index(fields=['created_at', 'id', 'plant'], name='gardening_rec_created_idx'),
+        ),
+        # Notes of a plant are read through the link table. The automatic index on
+        # plant_id alone needs a table lookup for every note_id, this one covers them.
+        migrations.RunSQL(
+            'CREATE INDEX gardening_note_plant_plant_note_idx ON gardening_note_plant (plant_id, note_id)',
+            'DROP INDEX gardening_note_plant_plant_note_idx',
+        ),
+    ]
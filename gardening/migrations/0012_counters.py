@@ -0,0 +1,77 @@
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def _total(queryset, group, aggregate):
+    return Subquery(queryset.order_by().values(group).annotate(total=aggregate).values('total'))
+
+
+# The same subqueries as gardening.counters, on the historical models
+def backfill_counters(apps, schema_editor):
+    Garden = apps.get_model('gardening', 'Garden')
+    Plant = apps.get_model('gardening', 'Plant')
+    AIRecommendation = apps.get_model('gardening', 'AIRecommendation')
+    Link = apps.get_model('gardening', 'Note').plant.through
+    Plant.objects.update(
+        note_count=Coalesce(_total(Link.objects.filter(plant_id=OuterRef('pk')), 'plant_id', Count('pk')), 0),
+        last_note_at=_total(Link.objects.filter(plant_id=OuterRef('pk')), 'plant_id', Max('note__created_at')),
+        last_recommendation_at=_total(
+            AIRecommendation.objects.filter(plant_id=OuterRef('pk')), 'plant_id', Max('created_at'),
+        ),
+    )
+    links = Link.objects.filter(plant__garden_id=OuterRef('pk'))
+    Garden.objects.update(
+        plant_count=Coalesce(_total(Plant.objects.filter(garden_id=OuterRef('pk')), 'garden_id', Count('pk')), 0),
+        note_count=Coalesce(_total(links, 'plant__garden_id', Count('note_id', distinct=True)), 0),
+        last_note_at=_total(links, 'plant__garden_id', Max('note__created_at')),
+        last_recommendation_at=_total(
+            AIRecommendation.objects.filter(plant__garden_id=OuterRef('pk')), 'plant__garden_id', Max('created_at'),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gardening', '0011_activity_feed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='garden',
+            name='last_note_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Poslední poznámka'),
+        ),
+        migrations.AddField(
+            model_name='garden',
+            name='last_recommendation_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Poslední doporučení'),
+        ),
+        migrations.AddField(
+            model_name='garden',
+            name='note_count',
+            field=models.IntegerField(default=0, editable=False, help_text='Poznámka u více rostlin zahrádky se počítá jednou', verbose_name='Počet poznámek'),
+        ),
+        migrations.AddField(
+            model_name='garden',
+            name='plant_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Počet rostlin'),
+        ),
+        migrations.AddField(
+            model_name='plant',
+            name='last_note_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Poslední poznámka'),
+        ),
+        migrations.AddField(
+            model_name='plant',
+            name='last_recommendation_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Poslední doporučení'),
+        ),
+        migrations.AddField(
+            model_name='plant',
+            name='note_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Počet poznámek'),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
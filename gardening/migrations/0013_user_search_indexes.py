@@ -0,0 +1,22 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('gardening', '0012_counters'),
+    ]
+
+    # Guest picker search (gardening/guests.py). istartswith is a case-insensitive LIKE
+    # on SQLite, it can only seek in an index with the same NOCASE collation.
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX gardening_user_username_nocase_idx ON auth_user (username COLLATE NOCASE)',
+            'DROP INDEX gardening_user_username_nocase_idx',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX gardening_user_email_nocase_idx ON auth_user (email COLLATE NOCASE)',
+            'DROP INDEX gardening_user_email_nocase_idx',
+        ),
+    ]
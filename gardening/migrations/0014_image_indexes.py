@@ -0,0 +1,27 @@
+# Generated by Django 5.2.3 on 2026-10-18 16:11
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gardening', '0013_user_search_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='garden',
+            index=models.Index(fields=['image'], name='gardening_garden_image_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='note',
+            index=models.Index(fields=['image'], name='gardening_note_image_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='plant',
+            index=models.Index(fields=['image'], name='gardening_plant_image_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.3 on 2026-10-18 16:14
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gardening', '0014_image_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='garden',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, editable=False, help_text='Zahrádka je skrytá a její obsah se maže na pozadí', null=True, verbose_name='Smazáno'),
+        ),
+        migrations.AddField(
+            model_name='plant',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, editable=False, help_text='Rostlina je skrytá a její poznámky a doporučení se mažou na pozadí', null=True, verbose_name='Smazáno'),
+        ),
+        migrations.AddIndex(
+            model_name='garden',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', False)), fields=['deleted_at'], name='gardening_garden_deleted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='plant',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', False)), fields=['deleted_at'], name='gardening_plant_deleted_idx'),
+        ),
+    ]
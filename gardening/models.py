@@ -1,5 +1,6 @@
 from django.contrib.auth.models import User
 from django.db import models
+from django.db.models import Exists, OuterRef, Prefetch, Q, Subquery
 from django.core.exceptions import ValidationError
 from django.utils.timezone import now
 
@@ -8,8 +9,77 @@ def validate_not_future_date(value):
     if value > now().date():
         raise ValidationError('Datum nemůže být v budoucnosti.')
 
+# EXISTS podmínka, zda má uživatel ke zahrádce přístup jako host
+def garden_guest_exists(user, garden_ref='pk'):
+    # Guest membership is resolved in SQL instead of loading the whole
+    # users_with_access list into Python.
+    return Exists(Garden.users_with_access.through.objects.filter(
+        garden_id=OuterRef(garden_ref),
+        user_id=user.pk,
+    ))
+
+
+# Kolik rostlin se ukazuje na kartě zahrádky v přehledech
+PLANT_PREVIEW_SIZE = 5
+
+
+# Počty a časy aktivity zapisuje jen gardening/counters.py, deleted_at jen
+# gardening/deletion.py. save() načteného řádku je vynechá, jinak by přepsal
+# novější hodnoty těmi, které se s ním načetly.
+class CounterFieldsMixin:
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in (*self.counter_fields, 'deleted_at')
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
+
+# Dotazy nad zahrádkami s ohledem na přístup uživatele
+class GardenQuerySet(models.QuerySet):
+    def with_access(self, user):
+        return self.annotate(is_guest=garden_guest_exists(user))
+
+    # IN over the guest table is driven by its user_id index, a correlated
+    # EXISTS in WHERE would make SQLite scan every garden
+    def _guest_of(self, user):
+        return Q(pk__in=Garden.users_with_access.through.objects.filter(user_id=user.pk).values('garden_id'))
+
+    def accessible_to(self, user):
+        # OR of two index lookups, no join so no DISTINCT needed
+        return self.with_access(user).filter(Q(owner=user) | self._guest_of(user))
+
+    def owned_by(self, user):
+        return self.filter(owner=user)
+
+    def shared_with(self, user):
+        return self.filter(self._guest_of(user)).exclude(owner=user)
+
+    # Counts come from the counter columns (gardening/counters.py), no aggregate per garden
+    def for_listing(self, preview_size=PLANT_PREVIEW_SIZE):
+        queryset = self.select_related('owner')
+        if preview_size:
+            # Sliced prefetch: one query with a window function for all gardens on the page
+            preview = Plant.objects.only('id', 'name', 'garden_id').order_by('name', 'id')[:preview_size]
+            queryset = queryset.prefetch_related(
+                Prefetch('plants', queryset=preview, to_attr='preview_plants'),
+            )
+        return queryset
+
+
+# Soft-deleted rows wait for the purge of gardening/deletion.py, only all_objects sees them
+class GardenManager(models.Manager.from_queryset(GardenQuerySet)):
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
 # Tabulka pro jednotlivé zahrádky
-class Garden(models.Model):
+class Garden(CounterFieldsMixin, models.Model):
     name = models.CharField(
         max_length=100,
         verbose_name='Název zahrádky',
@@ -42,15 +112,68 @@ class Garden(models.Model):
         verbose_name='Obrázek zahrádky',
         help_text='Nahrajte obrázek zahrádky (volitelné)'
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Naposledy změněno',
+        help_text='Čas poslední změny zahrádky nebo jejího obsahu'
+    )
+    plant_count = models.IntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Počet rostlin'
+    )
+    note_count = models.IntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Počet poznámek',
+        help_text='Poznámka u více rostlin zahrádky se počítá jednou'
+    )
+    last_note_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Poslední poznámka'
+    )
+    last_recommendation_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Poslední doporučení'
+    )
+    deleted_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Smazáno',
+        help_text='Zahrádka je skrytá a její obsah se maže na pozadí'
+    )
+
+    objects = GardenManager()
+    all_objects = models.Manager()
+
+    counter_fields = ('plant_count', 'note_count', 'last_note_at', 'last_recommendation_at')
 
     class Meta:
         ordering = ['name']
         verbose_name = 'Zahrádka'
         verbose_name_plural = 'Zahrádky'
+        indexes = [
+            # Listing of owned gardens, keyset ordered by (name, id)
+            models.Index(fields=['owner', 'name', 'id'], name='gardening_garden_owner_idx'),
+            # Access check of the media view, file name to its garden
+            models.Index(fields=['image'], name='gardening_garden_image_idx'),
+            # Only the few soft-deleted rows, found by the purge
+            models.Index(fields=['deleted_at'], name='gardening_garden_deleted_idx',
+                         condition=Q(deleted_at__isnull=False)),
+        ]
 
     def __str__(self):
         return self.name
 
+    @property
+    def last_activity_at(self):
+        return max(filter(None, (self.last_note_at, self.last_recommendation_at)), default=None)
+
 # Tabulka pro typy rostlin
 class PlantType(models.Model):
     name = models.CharField(
@@ -60,6 +183,13 @@ class PlantType(models.Model):
         help_text='Zadejte typ rostliny (např. Rajčata, Mrkev)'
     )
 
+    # The name the row was loaded with, only a rename reindexes the plants of the type
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_name = instance.__dict__.get('name')
+        return instance
+
     class Meta:
         ordering = ['name']
         verbose_name = 'Typ rostliny'
@@ -69,8 +199,29 @@ class PlantType(models.Model):
         return self.name
 
 
+# Dotazy nad rostlinami
+class PlantQuerySet(models.QuerySet):
+    def with_latest_recommendation(self):
+        # Latest AIRecommendation as correlated subqueries, no extra round-trip
+        latest = AIRecommendation.objects.filter(plant=OuterRef('pk')).order_by('-created_at', '-id')
+        return self.annotate(
+            latest_recommendation_pk=Subquery(latest.values('pk')[:1]),
+            latest_recommendation_text=Subquery(latest.values('recommendation')[:1]),
+            latest_recommendation_at=Subquery(latest.values('created_at')[:1]),
+            has_pending_job=Exists(RecommendationJob.objects.filter(
+                plant=OuterRef('pk'),
+                status__in=[RecommendationJob.PENDING, RecommendationJob.RUNNING],
+            )),
+        )
+
+
+class PlantManager(models.Manager.from_queryset(PlantQuerySet)):
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
 # Tabulky pro jednotlivé rostliny
-class Plant(models.Model):
+class Plant(CounterFieldsMixin, models.Model):
     name = models.CharField(
         max_length=100,
         verbose_name='Název rostliny',
@@ -106,6 +257,49 @@ class Plant(models.Model):
         verbose_name='Obrázek rostliny',
         help_text='Nahrajte obrázek rostliny (volitelné)'
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Naposledy změněno',
+        help_text='Čas poslední změny rostliny, jejích poznámek nebo doporučení'
+    )
+    note_count = models.IntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Počet poznámek'
+    )
+    last_note_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Poslední poznámka'
+    )
+    last_recommendation_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Poslední doporučení'
+    )
+    deleted_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Smazáno',
+        help_text='Rostlina je skrytá a její poznámky a doporučení se mažou na pozadí'
+    )
+
+    objects = PlantManager()
+    all_objects = models.Manager()
+
+    counter_fields = ('note_count', 'last_note_at', 'last_recommendation_at')
+
+    # The garden the row was loaded with, a plant moved to another garden is recounted in both.
+    # The name too, its notes are indexed under it and only a rename reindexes them.
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_garden_id = instance.__dict__.get('garden_id')
+        instance._loaded_name = instance.__dict__.get('name')
+        return instance
 
     class Meta:
         ordering = ['name']
@@ -115,10 +309,29 @@ class Plant(models.Model):
     def __str__(self):
         return self.name
 
+    # Available on plants loaded with Plant.objects.with_latest_recommendation()
+    @property
+    def latest_recommendation(self):
+        if getattr(self, 'latest_recommendation_pk', None) is None:
+            return None
+        return AIRecommendation(
+            pk=self.latest_recommendation_pk,
+            plant=self,
+            recommendation=self.latest_recommendation_text,
+            created_at=self.latest_recommendation_at,
+        )
+
     class Meta:
         ordering = ['name']
         verbose_name = 'Rostlina'
         verbose_name_plural = 'Rostliny'
+        indexes = [
+            # Plant list of a garden, keyset ordered by (name, id)
+            models.Index(fields=['garden', 'name', 'id'], name='gardening_plant_garden_idx'),
+            models.Index(fields=['image'], name='gardening_plant_image_idx'),
+            models.Index(fields=['deleted_at'], name='gardening_plant_deleted_idx',
+                         condition=Q(deleted_at__isnull=False)),
+        ]
 
     def __str__(self):
         return self.name
@@ -147,11 +360,26 @@ class Note(models.Model):
         verbose_name='Obrázek poznámky',
         help_text='Nahrajte obrázek k poznámce (volitelné)'
     )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Vytvořeno',
+        help_text='Čas vytvoření poznámky, podle něj se řadí aktivita zahrádky'
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Naposledy změněno',
+        help_text='Čas poslední změny poznámky'
+    )
 
     class Meta:
         ordering = ['-date']
         verbose_name = 'Poznámka'
         verbose_name_plural = 'Poznámky'
+        indexes = [
+            # Garden activity feed, keyset ordered by (created_at, id)
+            models.Index(fields=['created_at', 'id'], name='gardening_note_created_idx'),
+            models.Index(fields=['image'], name='gardening_note_image_idx'),
+        ]
 
     def __str__(self):
         return f"Note for {', '.join([p.name for p in self.plant.all()])} on {self.date}"
@@ -175,11 +403,95 @@ class AIRecommendation(models.Model):
         verbose_name='Datum vytvoření',
         help_text='Datum, kdy bylo doporučení vytvořeno'
     )
+    fingerprint = models.CharField(
+        max_length=64,
+        blank=True,
+        db_index=True,
+        verbose_name='Otisk vstupů',
+        help_text='SHA-256 ze stavu rostliny, ze kterého bylo doporučení vygenerováno'
+    )
 
     class Meta:
         ordering = ['-created_at']
         verbose_name = 'AI Doporučení'
         verbose_name_plural = 'AI Doporučení'
+        indexes = [
+            # Latest recommendation of a plant without sorting
+            models.Index(fields=['plant', 'created_at', 'id'], name='gardening_rec_plant_idx'),
+            # Garden activity feed newest first, the plant is checked without reading the row
+            models.Index(fields=['created_at', 'id', 'plant'], name='gardening_rec_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"Doporučení pro {self.plant.name} z {self.created_at}"
+
+# Fronta požadavků na vygenerování AI doporučení, zpracovává ji příkaz recommendation_worker
+class RecommendationJob(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Čeká'),
+        (RUNNING, 'Zpracovává se'),
+        (DONE, 'Hotovo'),
+        (FAILED, 'Chyba'),
+    ]
+
+    plant = models.ForeignKey(
+        Plant,
+        on_delete=models.CASCADE,
+        related_name='recommendation_jobs',
+        verbose_name='Rostlina'
+    )
+    requested_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name='Zadal'
+    )
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=PENDING,
+        verbose_name='Stav'
+    )
+    recommendation = models.ForeignKey(
+        AIRecommendation,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name='Výsledné doporučení'
+    )
+    error = models.TextField(
+        blank=True,
+        verbose_name='Chyba'
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Vytvořeno'
+    )
+    started_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Zahájeno'
+    )
+    finished_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Dokončeno'
+    )
+
+    class Meta:
+        ordering = ['created_at']
+        verbose_name = 'Úloha AI doporučení'
+        verbose_name_plural = 'Úlohy AI doporučení'
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='gardening_job_status_idx'),
+        ]
 
     def __str__(self):
-        return f"Doporučení pro {self.plant.name} z {self.created_at}"
\ No newline at end of file
+        return f"Úloha {self.pk} pro {self.plant_id} ({self.status})"
@@ -0,0 +1,131 @@
+import base64
+import json
+from operator import getitem
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+# Keyset (seek) stránkování - místo OFFSET se pokračuje od posledního řádku,
+# takže další stránka stojí stejně bez ohledu na to, jak daleko uživatel je.
+
+
+def encode_cursor(values):
+    raw = json.dumps([str(v) if not isinstance(v, (int, float)) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or not all(isinstance(v, (str, int, float)) for v in values):
+        return None
+    return values
+
+
+def _after_filter(fields, values, descending):
+    # (a, b) > (x, y)  ==  a > x OR (a = x AND b > y)
+    lookup = 'lt' if descending else 'gt'
+    condition = Q()
+    for i, field in enumerate(fields):
+        step = Q(**{f'{field}__{lookup}': values[i]})
+        for prev, value in zip(fields[:i], values[:i]):
+            step &= Q(**{prev: value})
+        condition |= step
+    # Redundant a >= x, SQLite cannot start an index range scan from the OR alone
+    return Q(**{f'{fields[0]}__{lookup}e': values[0]}) & condition
+
+
+class KeysetPage:
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+# Model field or annotation (values() aliases of a union branch) behind an ordering field
+def _output_field(queryset, name):
+    annotation = queryset.query.annotations.get(name)
+    if annotation is not None:
+        return annotation.output_field
+    model, field = queryset.model, None
+    for part in name.split('__'):
+        field = model._meta.pk if part == 'pk' else model._meta.get_field(part)
+        model = field.related_model
+    return field
+
+
+# The cursor's values as the types of their fields. A hand-edited cursor with values
+# that do not fit is ignored like an undecodable one instead of failing in the query.
+def _cursor_values(queryset, fields, cursor):
+    values = decode_cursor(cursor)
+    if values is None or len(values) != len(fields):
+        return None
+    try:
+        values = [_output_field(queryset, field).to_python(value) for field, value in zip(fields, values)]
+    except (ValueError, TypeError, ValidationError):
+        return None
+    return None if None in values else values
+
+
+def _cursor_filter(queryset, fields, cursor, descending):
+    values = _cursor_values(queryset, fields, cursor)
+    if values is None:
+        return Q()
+    return _after_filter(fields, values, descending)
+
+
+def _ordering(fields, descending):
+    return [f'-{f}' if descending else f for f in fields]
+
+
+def _page_queryset(queryset, fields, cursor, size, descending):
+    queryset = queryset.order_by(*_ordering(fields, descending))
+    return queryset.filter(_cursor_filter(queryset, fields, cursor, descending))[:size + 1]
+
+
+def _page(items, fields, size, value=getattr):
+    next_cursor = None
+    if len(items) > size:
+        items = items[:size]
+        last = items[-1]
+        next_cursor = encode_cursor([value(last, f) for f in fields])
+    return KeysetPage(items, next_cursor)
+
+
+# One page of queryset ordered by fields, starting right after the cursor row
+def keyset_page(queryset, fields, cursor, size, descending=False):
+    return _page(list(_page_queryset(queryset, fields, cursor, size, descending)), fields, size)
+
+
+# One page of the UNION ALL of values() querysets, e.g. over different models. A union
+# cannot be filtered, so the cursor condition goes into every branch. Items are dicts.
+def keyset_union_page(querysets, fields, cursor, size, descending=False):
+    condition = _cursor_filter(querysets[0], fields, cursor, descending)
+    first, *rest = [queryset.order_by().filter(condition) for queryset in querysets]
+    union = first.union(*rest, all=True).order_by(*_ordering(fields, descending))
+    return _page(list(union[:size + 1]), fields, size, value=getitem)
+
+
+async def akeyset_page(queryset, fields, cursor, size, descending=False):
+    queryset = _page_queryset(queryset, fields, cursor, size, descending)
+    return _page([item async for item in queryset], fields, size)
+
+
+def page_url(request, param, cursor):
+    query = request.GET.copy()
+    query[param] = cursor
+    return f'{request.path}?{query.urlencode()}'
@@ -0,0 +1,125 @@
+import bisect
+import threading
+import unicodedata
+
+from django.db import IntegrityError, connection, transaction
+
+from gardening import caching
+from gardening.models import PlantType
+
+# Index typů rostlin v paměti procesu pro našeptávač a pro PlantForm.
+# Názvy se porovnávají normalizované (casefold, bez diakritiky), takže
+# "Rajčata", "rajcata" i " RAJČATA " jsou jeden typ. Index se přestaví
+# líně po změně verze v cache, kterou po commitu změny PlantType zvedne signál.
+
+SUGGESTION_LIMIT = 10
+
+_VERSION_ID = 0
+
+
+def normalize(name):
+    decomposed = unicodedata.normalize('NFKD', name or '')
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return ' '.join(stripped.casefold().split())
+
+
+class _IndexState:
+    __slots__ = ('version', 'keys', 'entries', 'exact')
+
+    def __init__(self, version, rows):
+        self.version = version
+        self.exact = {}
+        entries = []
+        for pk, name in rows:
+            normalized = normalize(name)
+            # Duplicates from before normalisation resolve to the oldest row
+            self.exact.setdefault(normalized, (pk, name))
+            words = normalized.split()
+            # Every word is a prefix entry point, "cherry rajcata" is found by "raj" too
+            for position in range(len(words)):
+                entries.append((' '.join(words[position:]), position, name, pk))
+        entries.sort()
+        self.entries = entries
+        self.keys = [entry[0] for entry in entries]
+
+
+class PlantTypeIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.state = None
+
+    def _current(self):
+        if _has_pending_changes():
+            # Built from rows of this transaction, kept only for the call in case it is rolled back
+            return _IndexState(None, list(PlantType.objects.order_by('pk').values_list('pk', 'name')))
+        version = current_version()
+        state = self.state
+        if state is None or state.version != version:
+            with self.lock:
+                state = self.state
+                if state is None or state.version != version:
+                    rows = PlantType.objects.order_by('pk').values_list('pk', 'name')
+                    state = self.state = _IndexState(version, list(rows))
+        return state
+
+    # (pk, name) of the existing type with the same normalised name, or None
+    def resolve(self, name):
+        normalized = normalize(name)
+        if not normalized:
+            return None
+        return self._current().exact.get(normalized)
+
+    # Types whose name or one of its words starts with the text, whole-name matches first
+    def suggest(self, text, limit=SUGGESTION_LIMIT):
+        prefix = normalize(text)
+        if not prefix:
+            return []
+        state = self._current()
+        leading, inner, seen = [], [], set()
+        start = bisect.bisect_left(state.keys, prefix)
+        for key, position, name, pk in state.entries[start:]:
+            if not key.startswith(prefix) or len(leading) >= limit:
+                break
+            if pk in seen:
+                continue
+            seen.add(pk)
+            (leading if position == 0 else inner).append((pk, name))
+        return (leading + inner)[:limit]
+
+
+index = PlantTypeIndex()
+
+
+# Changes with every PlantType change, also keys other caches built from plant types
+def current_version():
+    return caching.get_version(caching.PLANT_TYPES, _VERSION_ID)
+
+
+def _bump_version():
+    caching.bump(caching.PLANT_TYPES, [_VERSION_ID])
+
+
+# The version changes only after commit. Until then the changed rows are visible to this
+# connection alone, an index built from them must not be shared under any version.
+def invalidate():
+    transaction.on_commit(_bump_version)
+
+
+# The transaction changed plant types and has not committed yet. Callbacks of rolled back
+# savepoints are dropped by Django, so a rollback ends this as well.
+def _has_pending_changes():
+    return connection.in_atomic_block and any(func is _bump_version for _, func, _ in connection.run_on_commit)
+
+
+# Existing type for the name or a new row, called only once the plant itself is being saved
+def get_or_create(name):
+    name = ' '.join(name.split())
+    found = index.resolve(name)
+    if found is not None:
+        return PlantType(pk=found[0], name=found[1])
+    try:
+        with transaction.atomic():
+            return PlantType.objects.create(name=name)
+    except IntegrityError:
+        # Created concurrently under exactly this name
+        return PlantType.objects.get(name=name)
@@ -0,0 +1,177 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from gardening.models import AIRecommendation, Note
+
+# Poskytovatelé AI doporučení. Konkrétní třída se vybírá nastavením
+# AI_RECOMMENDATION_PROVIDER, takže skutečné volání modelu lze vyměnit
+# bez zásahu do views nebo workeru.
+
+# How many of the newest notes go into the plant fingerprint
+FINGERPRINT_NOTES = 20
+
+
+class RecommendationProvider:
+    def generate(self, plant):
+        raise NotImplementedError
+
+
+# Local offline backend, returns the placeholder text without any network call
+class StubProvider(RecommendationProvider):
+    def generate(self, plant):
+        return f"AI Suggestion for {plant.name}: Water regularly and check for pests. (This is a placeholder recommendation. I don't have a paid API key for AI services. And I don't think that sharing it in this repo is a good idea.)"
+
+
+_provider = None
+
+
+def get_provider():
+    global _provider
+    if _provider is None:
+        _provider = import_string(settings.AI_RECOMMENDATION_PROVIDER)()
+    return _provider
+
+
+# Hash of everything the provider sees: name, type, planting date and the newest notes
+def plant_fingerprint(plant):
+    digest = hashlib.sha256()
+    parts = [
+        plant.name,
+        plant.plant_type.name if plant.plant_type_id else '',
+        plant.planted_date.isoformat() if plant.planted_date else '',
+    ]
+    notes = Note.objects.filter(plant=plant).order_by('-date', '-id').values_list('id', 'content')
+    for note_id, content in notes[:FINGERPRINT_NOTES]:
+        parts.append(f'{note_id}:{hashlib.sha256(content.encode()).hexdigest()}')
+    for part in parts:
+        digest.update(part.encode())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+# In-process LRU of recommendations keyed by plant fingerprint. Misses fall back to
+# the indexed AIRecommendation.fingerprint column, so web processes and workers
+# share results younger than the TTL.
+class RecommendationCache:
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._by_plant = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def _drop(self, fingerprint):
+        entry = self._entries.pop(fingerprint, None)
+        if entry is not None:
+            plant_ids = self._by_plant[entry[0].plant_id]
+            plant_ids.discard(fingerprint)
+            if not plant_ids:
+                del self._by_plant[entry[0].plant_id]
+
+    def _get_local(self, fingerprint):
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            if entry is None:
+                return None
+            recommendation, stored_at = entry
+            if time.monotonic() - stored_at > self.ttl:
+                self._drop(fingerprint)
+                return None
+            self._entries.move_to_end(fingerprint)
+            return recommendation
+
+    def put(self, recommendation):
+        if not recommendation.fingerprint:
+            return
+        with self._lock:
+            self._drop(recommendation.fingerprint)
+            self._entries[recommendation.fingerprint] = (recommendation, time.monotonic())
+            self._by_plant[recommendation.plant_id].add(recommendation.fingerprint)
+            while len(self._entries) > self.max_size:
+                self._drop(next(iter(self._entries)))
+
+    def get(self, fingerprint):
+        recommendation = self._get_local(fingerprint)
+        if recommendation is None:
+            recommendation = AIRecommendation.objects.filter(
+                fingerprint=fingerprint,
+                created_at__gte=timezone.now() - timedelta(seconds=self.ttl),
+            ).order_by('-created_at', '-id').first()
+            if recommendation is not None:
+                self.put(recommendation)
+        with self._lock:
+            if recommendation is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return recommendation
+
+    # Called when a note is attached to the plant or its state changes otherwise
+    def invalidate_plant(self, plant_id):
+        with self._lock:
+            for fingerprint in list(self._by_plant.get(plant_id, ())):
+                self._drop(fingerprint)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_plant.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+recommendation_cache = RecommendationCache(
+    max_size=settings.AI_RECOMMENDATION_CACHE_SIZE,
+    ttl=settings.AI_RECOMMENDATION_CACHE_TTL,
+)
+
+
+def _latest_recommendation_pk(plant):
+    if hasattr(plant, 'latest_recommendation_pk'):
+        return plant.latest_recommendation_pk
+    return plant.recommendations.order_by('-created_at', '-id').values_list('pk', flat=True).first()
+
+
+# Recommendation for the current plant state without calling the provider, or None on a miss.
+# A hit that is not already the plant's latest recommendation is stored again as the newest row.
+def cached_recommendation(plant, fingerprint=None):
+    fingerprint = fingerprint or plant_fingerprint(plant)
+    cached = recommendation_cache.get(fingerprint)
+    if cached is None:
+        return None
+    if cached.plant_id == plant.pk and cached.pk == _latest_recommendation_pk(plant):
+        return cached
+    recommendation = AIRecommendation.objects.create(
+        plant=plant,
+        recommendation=cached.recommendation,
+        fingerprint=fingerprint,
+    )
+    recommendation_cache.put(recommendation)
+    return recommendation
+
+
+# Cache first, provider only on a miss
+def generate_recommendation(plant):
+    fingerprint = plant_fingerprint(plant)
+    recommendation = cached_recommendation(plant, fingerprint)
+    if recommendation is None:
+        recommendation = AIRecommendation.objects.create(
+            plant=plant,
+            recommendation=get_provider().generate(plant),
+            fingerprint=fingerprint,
+        )
+        recommendation_cache.put(recommendation)
+    return recommendation
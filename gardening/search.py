@@ -0,0 +1,253 @@
+import re
+
+from django.db import connection, transaction
+from django.db.models.expressions import RawSQL
+
+from gardening.models import Garden, Note, Plant
+
+# Fulltextové vyhledávání nad poznámkami, rostlinami a zahrádkami.
+# Index jsou SQLite tabulky gardening_search (FTS5) a gardening_search_doc, synchronizované signály
+# (gardening/signals.py) a příkazem rebuild_search_index. Každý řádek nese
+# garden_id, takže kontrola přístupu je součástí jediného SQL dotazu.
+
+TABLE = 'gardening_search'
+DOC_TABLE = 'gardening_search_doc'
+
+KIND_GARDEN = 'garden'
+KIND_PLANT = 'plant'
+KIND_NOTE = 'note'
+
+# FTS5 holds only the searchable text, the document table maps its rowid to the
+# indexed object so updates and deletes never scan the fulltext index
+CREATE_SQL = [
+    f"""
+    CREATE TABLE IF NOT EXISTS {DOC_TABLE} (
+        id INTEGER PRIMARY KEY,
+        kind TEXT NOT NULL,
+        object_id INTEGER NOT NULL,
+        garden_id INTEGER NOT NULL,
+        plant_id INTEGER
+    )
+    """,
+    f'CREATE INDEX IF NOT EXISTS {DOC_TABLE}_object_idx ON {DOC_TABLE} (kind, object_id)',
+    f'CREATE INDEX IF NOT EXISTS {DOC_TABLE}_garden_idx ON {DOC_TABLE} (garden_id)',
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5(
+        title,
+        body,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+]
+
+DROP_SQL = [
+    f'DROP TABLE IF EXISTS {TABLE}',
+    f'DROP TABLE IF EXISTS {DOC_TABLE}',
+]
+
+# Control characters around matched terms in snippets, see the highlight template filter
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_END = '\x03'
+
+# Title matches weigh more than body matches
+RANK = f'bm25({TABLE}, 10.0, 1.0)'
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def is_available():
+    return connection.vendor == 'sqlite'
+
+
+# User input is never passed to MATCH as is: every word becomes a quoted prefix term
+def build_match_query(text):
+    tokens = _TOKEN_RE.findall(text or '')
+    return ' '.join(f'"{token}"*' for token in tokens[:20])
+
+
+def _delete_where(cursor, where, params):
+    cursor.execute(f'DELETE FROM {TABLE} WHERE rowid IN (SELECT id FROM {DOC_TABLE} WHERE {where})', params)
+    cursor.execute(f'DELETE FROM {DOC_TABLE} WHERE {where}', params)
+
+
+def _delete(cursor, kind, object_ids):
+    object_ids = list(object_ids)
+    if object_ids:
+        placeholders = ', '.join(['%s'] * len(object_ids))
+        _delete_where(cursor, f'kind = %s AND object_id IN ({placeholders})', [kind, *object_ids])
+
+
+# rows are (kind, object_id, garden_id, plant_id, title, body), ids are allocated inside the transaction
+def _insert(cursor, rows):
+    if not rows:
+        return
+    cursor.execute(f'SELECT COALESCE(MAX(id), 0) FROM {DOC_TABLE}')
+    next_id = cursor.fetchone()[0] + 1
+    ids = range(next_id, next_id + len(rows))
+    cursor.executemany(
+        f'INSERT INTO {DOC_TABLE} (id, kind, object_id, garden_id, plant_id) VALUES (%s, %s, %s, %s, %s)',
+        [(doc_id, *row[:4]) for doc_id, row in zip(ids, rows)],
+    )
+    cursor.executemany(
+        f'INSERT INTO {TABLE} (rowid, title, body) VALUES (%s, %s, %s)',
+        [(doc_id, *row[4:]) for doc_id, row in zip(ids, rows)],
+    )
+
+
+def _garden_rows(gardens):
+    return [(KIND_GARDEN, g.pk, g.pk, None, g.name, g.description or '') for g in gardens]
+
+
+def _plant_rows(plants):
+    return [
+        (KIND_PLANT, p.pk, p.garden_id, p.pk, p.name, p.plant_type.name if p.plant_type_id else '')
+        for p in plants
+    ]
+
+
+# One row per garden the note reaches through its plants, soft-deleted ones excluded. The
+# title holds the names of all its plants in that garden, the first one is linked.
+def _note_rows(note_ids):
+    links = Note.plant.through.objects.filter(note_id__in=note_ids, plant__deleted_at=None).values_list(
+        'note_id', 'note__content', 'plant_id', 'plant__garden_id', 'plant__name',
+    ).order_by('note_id', 'plant_id')
+    rows = {}
+    for note_id, content, plant_id, garden_id, plant_name in links:
+        rows.setdefault((note_id, garden_id), (note_id, garden_id, plant_id, [], content))[3].append(plant_name)
+    return [
+        (KIND_NOTE, note_id, garden_id, plant_id, ', '.join(names), content)
+        for note_id, garden_id, plant_id, names, content in rows.values()
+    ]
+
+
+def _reindex(kind, object_ids, rows):
+    if not is_available():
+        return
+    with transaction.atomic(), connection.cursor() as cursor:
+        _delete(cursor, kind, object_ids)
+        _insert(cursor, rows)
+
+
+def index_gardens(gardens):
+    _reindex(KIND_GARDEN, [g.pk for g in gardens], _garden_rows(gardens))
+
+
+def index_plants(plants):
+    _reindex(KIND_PLANT, [p.pk for p in plants], _plant_rows(plants))
+
+
+def index_notes(note_ids):
+    note_ids = list(note_ids)
+    _reindex(KIND_NOTE, note_ids, _note_rows(note_ids))
+
+
+# Notes of the plants, e.g. after a rename. Read and written in batches, so a plant with
+# thousands of notes never holds them all in memory.
+def index_plant_notes(plant_ids, batch_size=500):
+    note_ids = Note.plant.through.objects.filter(plant_id__in=plant_ids).values_list('note_id', flat=True)
+    for batch in _batched(note_ids.distinct().order_by('note_id').iterator(chunk_size=batch_size), batch_size):
+        index_notes(batch)
+
+
+def index_type_plants(plant_type_id, batch_size=500):
+    plants = Plant.objects.filter(plant_type_id=plant_type_id).select_related('plant_type').only(
+        'id', 'name', 'garden_id', 'plant_type__name',
+    )
+    for batch in _batched(plants.order_by('pk').iterator(chunk_size=batch_size), batch_size):
+        index_plants(batch)
+
+
+def remove(kind, object_ids):
+    _reindex(kind, object_ids, [])
+
+
+def remove_garden(garden_id):
+    if not is_available():
+        return
+    with transaction.atomic(), connection.cursor() as cursor:
+        _delete_where(cursor, 'garden_id = %s', [garden_id])
+
+
+def _batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def rebuild(batch_size=2000):
+    with transaction.atomic(), connection.cursor() as cursor:
+        for statement in DROP_SQL + CREATE_SQL:
+            cursor.execute(statement)
+        gardens = Garden.objects.only('id', 'name', 'description').iterator(chunk_size=batch_size)
+        for batch in _batched(gardens, batch_size):
+            _insert(cursor, _garden_rows(batch))
+        plants = Plant.objects.select_related('plant_type').only(
+            'id', 'name', 'garden_id', 'plant_type__name',
+        ).iterator(chunk_size=batch_size)
+        for batch in _batched(plants, batch_size):
+            _insert(cursor, _plant_rows(batch))
+        note_ids = Note.objects.order_by('id').values_list('id', flat=True).iterator(chunk_size=batch_size)
+        for batch in _batched(note_ids, batch_size):
+            _insert(cursor, _note_rows(batch))
+        cursor.execute(f"INSERT INTO {TABLE}({TABLE}) VALUES ('optimize')")
+
+
+class SearchResult:
+    __slots__ = ('kind', 'object_id', 'garden_id', 'plant_id', 'title', 'snippet', 'garden_name')
+
+    def __init__(self, kind, object_id, garden_id, plant_id, title, snippet, garden_name):
+        self.kind = kind
+        self.object_id = object_id
+        self.garden_id = garden_id
+        self.plant_id = plant_id
+        self.title = title
+        self.snippet = snippet
+        self.garden_name = garden_name
+
+
+# Ranked results visible to the user, page is 1-based. Returns (results, has_next).
+def search(user, text, page=1, page_size=20):
+    match = build_match_query(text)
+    if not match or not is_available():
+        return [], False
+    page = max(1, page)
+    garden = Garden._meta.db_table
+    guests = Garden.users_with_access.through._meta.db_table
+    sql = f"""
+        SELECT d.kind, d.object_id, d.garden_id, d.plant_id, {TABLE}.title,
+               snippet({TABLE}, 1, %s, %s, '…', 16), g.name
+        FROM {TABLE}
+        JOIN {DOC_TABLE} AS d ON d.id = {TABLE}.rowid
+        JOIN {garden} AS g ON g.id = d.garden_id
+        WHERE {TABLE} MATCH %s
+          AND (g.owner_id = %s OR EXISTS (
+              SELECT 1 FROM {guests} AS a WHERE a.garden_id = g.id AND a.user_id = %s
+          ))
+        ORDER BY {RANK}
+        LIMIT %s OFFSET %s
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [
+            HIGHLIGHT_START, HIGHLIGHT_END, match, user.pk, user.pk, page_size + 1, (page - 1) * page_size,
+        ])
+        rows = cursor.fetchall()
+    results = [SearchResult(*row) for row in rows[:page_size]]
+    return results, len(rows) > page_size
+
+
+# Subquery of the ids of objects of one kind matching the text, for pk__in filters of the
+# admin instead of icontains scans. Not materialised, so every match is found.
+def matching_ids(kind, text):
+    match = build_match_query(text)
+    if not match or not is_available():
+        return None
+    return RawSQL(
+        f'SELECT d.object_id FROM {TABLE} JOIN {DOC_TABLE} AS d ON d.id = {TABLE}.rowid '
+        f'WHERE {TABLE} MATCH %s AND d.kind = %s',
+        (match, kind),
+    )
@@ -0,0 +1,416 @@
+from django.contrib.auth.models import Group, User
+from django.db import transaction
+from django.db.models import Max
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from gardening.images import schedule_variants_on_commit, variant_sources
+from gardening import caching, conditional, counters, plant_types, search
+from gardening.models import AIRecommendation, Garden, Note, Plant, PlantType, RecommendationJob
+from gardening.recommendations import recommendation_cache
+
+
+# Nová nebo upravená poznámka mění stav rostliny, cache doporučení pro ni neplatí
+@receiver(m2m_changed, sender=Note.plant.through)
+def invalidate_recommendations_on_note_link(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if reverse:
+        # instance is a Plant
+        recommendation_cache.invalidate_plant(instance.pk)
+    elif action == 'pre_clear':
+        for plant_id in instance.plant.values_list('pk', flat=True):
+            recommendation_cache.invalidate_plant(plant_id)
+    else:
+        for plant_id in pk_set or ():
+            recommendation_cache.invalidate_plant(plant_id)
+
+
+@receiver(post_save, sender=Note)
+def invalidate_recommendations_on_note_edit(sender, instance, created, **kwargs):
+    if not created:
+        for plant_id in instance.plant.values_list('pk', flat=True):
+            recommendation_cache.invalidate_plant(plant_id)
+
+
+@receiver(post_save, sender=Plant)
+def invalidate_recommendations_on_plant_edit(sender, instance, created, **kwargs):
+    if not created:
+        recommendation_cache.invalidate_plant(instance.pk)
+
+
+# Po nahrání obrázku se na pozadí vygenerují jeho zmenšené varianty
+@receiver(post_save, sender=Garden)
+@receiver(post_save, sender=Plant)
+@receiver(post_save, sender=Note)
+def schedule_image_variants(sender, instance, **kwargs):
+    if instance.image and not variant_sources(instance.image.name):
+        if sender is Garden:
+            garden_ids = [instance.pk]
+        elif sender is Plant:
+            garden_ids = [instance.garden_id]
+        else:
+            # Read after commit, the plants of a new note are linked after it is saved
+            garden_ids = _note_garden_ids([instance.pk])
+        schedule_variants_on_commit(instance.image.name, garden_ids)
+
+
+
+# Udržování fulltextového indexu (gardening/search.py)
+@receiver(post_save, sender=Garden)
+def index_garden(sender, instance, **kwargs):
+    search.index_gardens([instance])
+
+
+@receiver(post_delete, sender=Garden)
+def unindex_garden(sender, instance, **kwargs):
+    search.remove_garden(instance.pk)
+
+
+@receiver(post_save, sender=Plant)
+def index_plant(sender, instance, created, **kwargs):
+    search.index_plants([instance])
+    # Note rows carry the plant name and garden, a plain edit leaves them as they are.
+    # count_saved_plant, connected later, updates _loaded_garden_id.
+    renamed = getattr(instance, '_loaded_name', None) != instance.name
+    moved = getattr(instance, '_loaded_garden_id', instance.garden_id) != instance.garden_id
+    instance._loaded_name = instance.name
+    if not created and (renamed or moved):
+        plant_id = instance.pk
+        transaction.on_commit(lambda: search.index_plant_notes([plant_id]))
+
+
+@receiver(pre_delete, sender=Plant)
+def remember_plant_notes(sender, instance, **kwargs):
+    instance._search_note_ids = list(instance.notes.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Plant)
+def unindex_plant(sender, instance, **kwargs):
+    search.remove(search.KIND_PLANT, [instance.pk])
+    search.index_notes(getattr(instance, '_search_note_ids', ()))
+
+
+@receiver(post_save, sender=PlantType)
+def index_plant_type(sender, instance, created, **kwargs):
+    renamed = getattr(instance, '_loaded_name', None) != instance.name
+    instance._loaded_name = instance.name
+    if not created and renamed:
+        plant_type_id = instance.pk
+        transaction.on_commit(lambda: search.index_type_plants(plant_type_id))
+
+
+@receiver(pre_delete, sender=PlantType)
+def remember_plant_type_plants(sender, instance, **kwargs):
+    instance._search_plant_ids = list(instance.plants.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=PlantType)
+def unindex_plant_type(sender, instance, **kwargs):
+    plant_ids = getattr(instance, '_search_plant_ids', ())
+    search.index_plants(Plant.objects.filter(pk__in=plant_ids).select_related('plant_type'))
+
+
+@receiver(post_save, sender=Note)
+def index_note(sender, instance, created, **kwargs):
+    # A new note has no plants yet, it is indexed once they are linked
+    if not created:
+        search.index_notes([instance.pk])
+
+
+@receiver(post_delete, sender=Note)
+def unindex_note(sender, instance, **kwargs):
+    search.remove(search.KIND_NOTE, [instance.pk])
+
+
+@receiver(m2m_changed, sender=Note.plant.through)
+def index_note_links(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            search.index_notes([instance.pk])
+    elif action == 'pre_clear':
+        instance._search_note_ids = list(instance.notes.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        search.index_notes(getattr(instance, '_search_note_ids', ()))
+    elif action in ('post_add', 'post_remove'):
+        search.index_notes(pk_set or ())
+
+
+# Verze pro cache stránek (gardening/caching.py). Obsah zahrádky mění verzi
+# zahrádky, seznam zahrádek uživatele mění verzi uživatele.
+@receiver(post_save, sender=Garden)
+def bump_garden_version(sender, instance, created, **kwargs):
+    caching.bump_gardens([instance.pk])
+    if created:
+        caching.bump_users([instance.owner_id])
+
+
+@receiver(pre_delete, sender=Garden)
+def remember_garden_members(sender, instance, **kwargs):
+    # Guest rows are removed by the cascade without an m2m_changed signal
+    guests = Garden.users_with_access.through.objects.filter(garden_id=instance.pk)
+    instance._cache_member_ids = [instance.owner_id, *guests.values_list('user_id', flat=True)]
+
+
+@receiver(post_delete, sender=Garden)
+def bump_deleted_garden_version(sender, instance, **kwargs):
+    caching.bump_gardens([instance.pk])
+    caching.bump_users(getattr(instance, '_cache_member_ids', [instance.owner_id]))
+
+
+@receiver(m2m_changed, sender=Garden.users_with_access.through)
+def bump_guest_versions(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # instance is a User, pk_set are gardens
+        if action in ('post_add', 'post_remove'):
+            caching.bump_gardens(pk_set or ())
+            caching.bump_users([instance.pk])
+        elif action == 'pre_clear':
+            instance._cache_garden_ids = list(instance.accessible_gardens.values_list('pk', flat=True))
+        elif action == 'post_clear':
+            caching.bump_gardens(getattr(instance, '_cache_garden_ids', ()))
+            caching.bump_users([instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        caching.bump_gardens([instance.pk])
+        caching.bump_users(pk_set or ())
+    elif action == 'pre_clear':
+        instance._cache_guest_ids = list(instance.users_with_access.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        caching.bump_gardens([instance.pk])
+        caching.bump_users(getattr(instance, '_cache_guest_ids', ()))
+
+
+@receiver(post_save, sender=Plant)
+@receiver(post_delete, sender=Plant)
+def bump_plant_garden_version(sender, instance, **kwargs):
+    caching.bump_gardens([instance.garden_id])
+
+
+# No post_delete receiver on purpose: recommendations are deleted with their plant, which
+# bumps the garden, and a receiver would turn the cascade fast delete into a row-by-row one
+@receiver(post_save, sender=AIRecommendation)
+@receiver(post_save, sender=RecommendationJob)
+def bump_recommendation_garden_version(sender, instance, **kwargs):
+    # The plant is usually loaded already (view, worker), otherwise one query
+    if sender.plant.is_cached(instance):
+        caching.bump_gardens([instance.plant.garden_id])
+    else:
+        caching.bump_gardens(Plant.objects.filter(pk=instance.plant_id).values_list('garden_id', flat=True))
+
+
+def _note_garden_ids(note_ids):
+    return Plant.objects.filter(notes__in=note_ids).values_list('garden_id', flat=True).distinct()
+
+
+@receiver(post_save, sender=Note)
+def bump_note_garden_version(sender, instance, created, **kwargs):
+    # A new note has no plants yet, the gardens are bumped once they are linked
+    if not created:
+        caching.bump_gardens(_note_garden_ids([instance.pk]))
+
+
+@receiver(pre_delete, sender=Note)
+def remember_note_gardens(sender, instance, **kwargs):
+    instance._cache_garden_ids = list(_note_garden_ids([instance.pk]))
+
+
+@receiver(post_delete, sender=Note)
+def bump_deleted_note_garden_version(sender, instance, **kwargs):
+    caching.bump_gardens(getattr(instance, '_cache_garden_ids', ()))
+
+
+@receiver(m2m_changed, sender=Note.plant.through)
+def bump_note_link_versions(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # instance is a Plant
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            caching.bump_gardens([instance.garden_id])
+    elif action in ('post_add', 'post_remove'):
+        caching.bump_gardens(Plant.objects.filter(pk__in=pk_set or ()).values_list('garden_id', flat=True).distinct())
+    elif action == 'pre_clear':
+        instance._cache_garden_ids = list(_note_garden_ids([instance.pk]))
+    elif action == 'post_clear':
+        caching.bump_gardens(getattr(instance, '_cache_garden_ids', ()))
+
+
+# Časy poslední změny pro podmíněné GET (gardening/conditional.py). Změna
+# obsahu posune updated_at rostliny i zahrádky, do které patří.
+@receiver(post_save, sender=Plant)
+@receiver(post_delete, sender=Plant)
+def touch_plant_garden(sender, instance, origin=None, **kwargs):
+    # Plants deleted together with their garden have nothing left to touch
+    if not isinstance(origin, Garden):
+        conditional.touch_gardens([instance.garden_id])
+
+
+@receiver(post_save, sender=AIRecommendation)
+@receiver(post_save, sender=RecommendationJob)
+def touch_recommendation_plant(sender, instance, **kwargs):
+    conditional.touch_plants([instance.plant_id])
+
+
+@receiver(post_save, sender=Note)
+def touch_note_plants(sender, instance, created, **kwargs):
+    # A new note has no plants yet, they are touched once it is linked
+    if not created:
+        conditional.touch_plants(Plant.objects.filter(notes=instance.pk).values('pk'))
+
+
+# Touched before the links are removed, still within the delete transaction
+@receiver(pre_delete, sender=Note)
+def touch_deleted_note_plants(sender, instance, **kwargs):
+    conditional.touch_plants(Plant.objects.filter(notes=instance.pk).values('pk'))
+
+
+@receiver(m2m_changed, sender=Note.plant.through)
+def touch_note_link_plants(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # instance is a Plant
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            conditional.touch_plants([instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        conditional.touch_plants(pk_set or ())
+    elif action == 'pre_clear':
+        conditional.touch_plants(Plant.objects.filter(notes=instance.pk).values('pk'))
+
+
+@receiver(m2m_changed, sender=Garden.users_with_access.through)
+def touch_guest_gardens(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # instance is a User, pk_set are gardens
+        if action in ('post_add', 'post_remove'):
+            conditional.touch_gardens(pk_set or ())
+        elif action == 'pre_clear':
+            conditional.touch_gardens(instance.accessible_gardens.values('pk'))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        conditional.touch_gardens([instance.pk])
+
+
+# Počty rostlin a poznámek a časy poslední aktivity (gardening/counters.py)
+@receiver(post_save, sender=Plant)
+def count_saved_plant(sender, instance, created, **kwargs):
+    if created:
+        counters.plant_added(instance.garden_id)
+    elif getattr(instance, '_loaded_garden_id', instance.garden_id) != instance.garden_id:
+        # Moving a plant is rare (admin), both gardens are recounted
+        counters.recount_gardens([instance._loaded_garden_id, instance.garden_id])
+    instance._loaded_garden_id = instance.garden_id
+
+
+@receiver(pre_delete, sender=Plant)
+def remember_plant_counters(sender, instance, origin=None, **kwargs):
+    if not isinstance(origin, Garden):
+        instance._counter_removal = counters.plant_removal(instance)
+
+
+@receiver(post_delete, sender=Plant)
+def count_deleted_plant(sender, instance, **kwargs):
+    # Plants deleted together with their garden have no garden left to count in
+    if getattr(instance, '_counter_removal', None):
+        counters.plant_removed(instance._counter_removal)
+
+
+def _latest_note(note_ids):
+    return Note.objects.filter(pk__in=note_ids).aggregate(latest=Max('created_at'))['latest']
+
+
+@receiver(m2m_changed, sender=Note.plant.through)
+def count_note_links(sender, instance, action, reverse, pk_set, **kwargs):
+    own, other = ('plant_id', 'note_id') if reverse else ('note_id', 'plant_id')
+    if action in ('pre_remove', 'pre_clear'):
+        links = Note.plant.through.objects.filter(**{own: instance.pk})
+        if action == 'pre_remove':
+            # remove() reports every requested id, only existing links are counted
+            links = links.filter(**{f'{other}__in': pk_set or ()})
+        instance._counter_removed = set(links.values_list(other, flat=True))
+    elif action == 'post_add' and pk_set:
+        if reverse:
+            counters.notes_linked(pk_set, [instance.pk], _latest_note(pk_set))
+        else:
+            counters.notes_linked([instance.pk], pk_set, instance.created_at)
+    elif action in ('post_remove', 'post_clear'):
+        removed = getattr(instance, '_counter_removed', ())
+        if not removed:
+            return
+        if reverse:
+            counters.notes_unlinked(removed, [instance.pk], _latest_note(removed))
+        else:
+            counters.notes_unlinked([instance.pk], removed, instance.created_at)
+
+
+# Link rows are removed by the cascade without an m2m_changed signal
+@receiver(pre_delete, sender=Note)
+def remember_note_plants(sender, instance, **kwargs):
+    instance._counter_plant_ids = list(Note.plant.through.objects.filter(
+        note_id=instance.pk,
+    ).values_list('plant_id', flat=True))
+
+
+@receiver(post_delete, sender=Note)
+def count_deleted_note(sender, instance, **kwargs):
+    plant_ids = getattr(instance, '_counter_plant_ids', ())
+    if plant_ids:
+        counters.notes_unlinked([instance.pk], plant_ids, instance.created_at)
+
+
+# Deleted recommendations are not tracked, like the cache versions above. They go
+# with their plant, otherwise repair_counters fixes the timestamps.
+@receiver(post_save, sender=AIRecommendation)
+def count_recommendation(sender, instance, created, **kwargs):
+    if created:
+        counters.recommendation_added(instance.plant_id, instance.created_at)
+
+
+# Index typů rostlin pro našeptávač (gardening/plant_types.py)
+@receiver(post_save, sender=PlantType)
+@receiver(post_delete, sender=PlantType)
+def invalidate_plant_type_index(sender, instance, **kwargs):
+    plant_types.invalidate()
+
+
+# Verze přihlášeného uživatele v paměti procesů (gardening/auth.py). Heslo,
+# aktivita, skupiny i oprávnění se musí projevit hned, ne až po vypršení.
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def bump_auth_user(sender, instance, **kwargs):
+    caching.bump_auth([instance.pk])
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def bump_auth_user_grants(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            caching.bump_auth([instance.pk])
+    # instance is a Group or Permission, pk_set are users
+    elif action in ('post_add', 'post_remove'):
+        caching.bump_auth(pk_set or ())
+    elif action == 'pre_clear':
+        instance._auth_user_ids = list(instance.user_set.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        caching.bump_auth(getattr(instance, '_auth_user_ids', ()))
+
+
+def _group_member_ids(group_ids):
+    return User.groups.through.objects.filter(group_id__in=group_ids).values_list('user_id', flat=True)
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def bump_auth_group_permissions(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    # With reverse, instance is a Permission and pk_set are groups. A cleared
+    # permission is looked up before its rows are gone.
+    if not reverse:
+        group_ids = [instance.pk]
+    elif action == 'pre_clear':
+        group_ids = list(instance.group_set.values_list('pk', flat=True))
+    else:
+        group_ids = pk_set or ()
+    caching.bump_auth(_group_member_ids(group_ids))
+
+
+# Membership rows are removed by the cascade without an m2m_changed signal
+@receiver(pre_delete, sender=Group)
+def bump_auth_group_members(sender, instance, **kwargs):
+    caching.bump_auth(_group_member_ids([instance.pk]))
@@ -0,0 +1,41 @@
+import re
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+# Ladění SQLite pro provoz s více vlákny a procesy. PRAGMA ze settings.SQLITE_PRAGMAS
+# se nastaví na každém novém spojení, zápisové transakce začínají BEGIN IMMEDIATE
+# (DATABASES OPTIONS transaction_mode) a v rámci procesu je řadí backend
+# gardening.sqlite (base.py). Spojení se drží CONN_MAX_AGE sekund.
+
+_NAME = re.compile(r'^[a-z_]+$')
+_VALUE = re.compile(r'^-?\w+$')
+
+
+def _pragma_statements(pragmas):
+    for name, value in pragmas.items():
+        if not _NAME.match(name) or not _VALUE.match(str(value)):
+            raise ImproperlyConfigured(f'Invalid SQLITE_PRAGMAS entry {name!r}: {value!r}')
+        yield f'PRAGMA {name} = {value}'
+
+
+@receiver(connection_created)
+def apply_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for statement in _pragma_statements(settings.SQLITE_PRAGMAS):
+            cursor.execute(statement)
+
+
+# Current values of the configured pragmas on the connection, for reports and checks
+def pragma_values(connection):
+    values = {}
+    with connection.cursor() as cursor:
+        for name in settings.SQLITE_PRAGMAS:
+            cursor.execute(f'PRAGMA {name}')
+            row = cursor.fetchone()
+            values[name] = row[0] if row else None
+    return values
@@ -0,0 +1,63 @@
+import threading
+
+from django.conf import settings
+from django.db import OperationalError
+from django.db.backends.sqlite3 import base
+
+# SQLite backend, který v rámci procesu řadí zápisové transakce za sebe.
+# SQLite pouští jednoho zapisovatele, ostatní bez zámku v procesu čekají
+# v busy handleru, který se dotazuje s rostoucí pauzou a je nespravedlivý,
+# takže při více vláknech některá vyčerpají busy_timeout. Mezi procesy
+# dál platí busy_timeout.
+
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def _write_lock(name):
+    with _locks_guard:
+        return _locks.setdefault(str(name), threading.Lock())
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.held_write_lock = None
+
+    # Outermost atomic() on a connection in autocommit mode, i.e. BEGIN IMMEDIATE
+    def _start_transaction_under_autocommit(self):
+        if self.is_in_memory_db():
+            return super()._start_transaction_under_autocommit()
+        lock = _write_lock(self.settings_dict['NAME'])
+        timeout = settings.SQLITE_PRAGMAS.get('busy_timeout', 5000) / 1000
+        if not lock.acquire(timeout=timeout):
+            raise OperationalError('database is locked (waiting for another thread of this process)')
+        try:
+            super()._start_transaction_under_autocommit()
+        except BaseException:
+            lock.release()
+            raise
+        self.held_write_lock = lock
+
+    def _release_write_lock(self):
+        lock, self.held_write_lock = self.held_write_lock, None
+        if lock is not None:
+            lock.release()
+
+    # A failed commit leaves the transaction open, the lock is released by the rollback
+    def _commit(self):
+        result = super()._commit()
+        self._release_write_lock()
+        return result
+
+    def _rollback(self):
+        try:
+            return super()._rollback()
+        finally:
+            self._release_write_lock()
+
+    def _close(self):
+        try:
+            return super()._close()
+        finally:
+            self._release_write_lock()
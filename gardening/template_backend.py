@@ -0,0 +1,31 @@
+import time
+
+from django.template.backends.django import DjangoTemplates
+
+from gardening.metrics import add_template_time
+
+
+# Wraps the backend template so the render time is added to the request metrics.
+# Includes render inside the top-level template, so nothing is counted twice.
+class TimedTemplate:
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            if request is not None:
+                add_template_time(request, time.perf_counter() - started)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
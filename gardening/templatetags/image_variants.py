@@ -0,0 +1,31 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from gardening.images import VARIANT_FORMATS, variant_sources
+
+register = template.Library()
+
+
+# {% responsive_image plant.image alt=plant.name sizes="200px" style="max-width:200px;" %}
+# Falls back to the original file until the variants have been generated.
+@register.simple_tag
+def responsive_image(image, alt='', sizes='100vw', **attrs):
+    if not image:
+        return ''
+    extra = format_html_join('', ' {}="{}"', attrs.items())
+    sources = variant_sources(image.name)
+    if not sources:
+        return format_html('<img src="{}" alt="{}" loading="lazy"{}>', image.url, alt, extra)
+    # The last format (JPEG) is the <img> fallback every browser can show
+    fallback_mime = VARIANT_FORMATS[-1][2]
+    preferred = [(srcset, mime) for srcset, mime in sources if mime != fallback_mime]
+    fallback = [srcset for srcset, mime in sources if mime == fallback_mime]
+    img_srcset = format_html(' srcset="{}" sizes="{}"', fallback[0], sizes) if fallback else ''
+    return format_html(
+        '<picture>{}<img src="{}"{} alt="{}" loading="lazy" decoding="async"{}></picture>',
+        format_html_join('', '<source type="{}" srcset="{}" sizes="{}">', ((mime, srcset, sizes) for srcset, mime in preferred)),
+        image.url,
+        img_srcset,
+        alt,
+        extra,
+    )
@@ -0,0 +1,14 @@
+from django import template
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from gardening.search import HIGHLIGHT_END, HIGHLIGHT_START
+
+register = template.Library()
+
+
+# Escapes the FTS snippet and turns its match markers into <mark> tags
+@register.filter
+def highlight(snippet):
+    html = escape(snippet or '')
+    return mark_safe(html.replace(HIGHLIGHT_START, '<mark>').replace(HIGHLIGHT_END, '</mark>'))
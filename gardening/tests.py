@@ -1,3 +1,1772 @@
-from django.test import TestCase
+import base64
+import gzip
+import io
+import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.admin import site as admin_site
+from django.contrib.auth.models import Group, Permission, User
+from django.contrib.sessions.models import Session
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.conf import settings
+from django.core.management import call_command
+from django.db import OperationalError, connection, transaction
+from django.template import Context, Template
+from django.template.defaultfilters import filesizeformat
+from django.test import AsyncClient, Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from gardening import assets, caching, counters, deletion, guests, media, metrics, plant_types, search
+from gardening.activity import garden_activity
+from gardening.api import INCLUDED_PLANTS_LIMIT
+from gardening.admin import NoteAdmin, PlantAdmin
+from gardening.assets import VENDOR_ASSETS
+from gardening.auth import CachedModelBackend
+from gardening.images import schedule_variants, variant_name
+from gardening.jobs import claim_jobs, enqueue_recommendation, run_job
+from gardening.models import AIRecommendation, Garden, Note, Plant, PlantType, RecommendationJob
+from gardening.pagination import encode_cursor
+from gardening.recommendations import (
+    RecommendationCache, StubProvider, cached_recommendation, generate_recommendation, plant_fingerprint,
+    recommendation_cache,
+)
+from gardening.sqlite import pragma_values
+from gardening.sqlite.base import DatabaseWrapper
+from gardening.views import GARDENS_PAGE_SIZE, NOTES_PAGE_SIZE, PLANTS_PAGE_SIZE
+
+# Regresní testy počtu SQL dotazů na stránku a plánů nejčastějších dotazů.
+# Data jsou větší než jedna stránka všech stránkovaných výpisů, takže počet
+# dotazů nesmí záviset na tom, kolik má uživatel zahrádek, rostlin a poznámek.
+
+# Query budgets measure the uncached path, caching has its own tests below
+NO_CACHE = override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+
+
+def seed_gardens(owner, guest, stranger):
+    plant_type = PlantType.objects.create(name='Rajčata')
+    PlantType.objects.create(name='Mrkev')
+    Garden.objects.bulk_create([
+        Garden(name=f'Zahrádka {i:02}', owner=owner) for i in range(GARDENS_PAGE_SIZE + 5)
+    ])
+    garden = Garden.objects.create(name='A hlavní', owner=owner, description='Záhony za domem')
+    garden.users_with_access.add(guest)
+    shared = Garden.objects.create(name='Sdílená', owner=stranger)
+    shared.users_with_access.add(owner)
+    Garden.objects.create(name='Cizí', owner=stranger)
+
+    plants = Plant.objects.bulk_create([
+        Plant(name=f'Rostlina {i:03}', garden=garden, plant_type=plant_type) for i in range(PLANTS_PAGE_SIZE + 10)
+    ])
+    Plant.objects.bulk_create([Plant(name=f'Sdílená {i}', garden=shared) for i in range(3)])
+    notes = Note.objects.bulk_create([Note(content=f'Zalito {i}') for i in range(NOTES_PAGE_SIZE + 10)])
+    Link = Note.plant.through
+    # Every note belongs to the first plant, every third one also to a second plant
+    Link.objects.bulk_create(
+        [Link(note_id=note.pk, plant_id=plants[0].pk) for note in notes]
+        + [Link(note_id=note.pk, plant_id=plants[1].pk) for note in notes[::3]]
+    )
+    AIRecommendation.objects.bulk_create([
+        AIRecommendation(plant=plant, recommendation=f'Doporučení {i}') for plant in plants for i in range(3)
+    ])
+    # bulk_create sends no signals
+    counters.recount_plants(Plant.objects.values('pk'))
+    counters.recount_gardens(Garden.objects.values('pk'))
+    return garden, shared, plants
+
+
+@NO_CACHE
+class QueryBudgetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='heslo12345')
+        cls.guest = User.objects.create_user('guest', password='heslo12345')
+        cls.stranger = User.objects.create_user('stranger', password='heslo12345')
+        cls.garden, cls.shared, cls.plants = seed_gardens(cls.owner, cls.guest, cls.stranger)
+        cls.plant = cls.plants[0]
+        cls.plant_type = PlantType.objects.get(name='Mrkev')
+
+    def setUp(self):
+        recommendation_cache.clear()
+        self.client.force_login(self.owner)
+
+    def assertQueries(self, num, url, method='get', data=None, status=200):
+        with self.assertNumQueries(num):
+            response = getattr(self.client, method)(url, data or {})
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, status)
+        return response
+
+    # Anonymous pages
+
+    def test_index(self):
+        self.client.logout()
+        self.assertQueries(0, reverse('index'))
+
+    def test_register(self):
+        self.client.logout()
+        self.assertQueries(0, reverse('register'))
+        self.assertQueries(11, reverse('register'), 'post', {
+            'username': 'novy', 'email': 'novy@example.com', 'password1': 'Tajne.heslo.42', 'password2': 'Tajne.heslo.42',
+        }, status=302)
+
+    def test_login(self):
+        self.client.logout()
+        self.assertQueries(0, reverse('login'))
+        self.assertQueries(9, reverse('login'), 'post', {'username': 'owner', 'password': 'heslo12345'}, status=302)
+
+    def test_logout(self):
+        self.assertQueries(4, reverse('logout'), status=302)
+
+    # Garden listings
+
+    def test_dashboard(self):
+        response = self.assertQueries(4, reverse('dashboard'))
+        self.assertIsNotNone(response.context['my_next_url'])
+
+    def test_gardens(self):
+        response = self.assertQueries(6, reverse('gardens'))
+        self.assertEqual(len(response.context['my_gardens']), GARDENS_PAGE_SIZE)
+        self.assertQueries(6, response.context['my_next_url'])
+
+    def test_garden_add(self):
+        # No user is loaded for the empty guest picker
+        self.assertQueries(2, reverse('garden_add'))
+        self.assertQueries(11, reverse('garden_add'), 'post', {'name': 'Nová'}, status=302)
+
+    def test_user_autocomplete(self):
+        response = self.assertQueries(3, reverse('user_autocomplete'), data={'q': 'gue'})
+        self.assertEqual(response.json()['results'], [{'id': self.guest.pk, 'username': 'guest'}])
+        # A whole e-mail address is looked up in one more query
+        self.assertQueries(4, reverse('user_autocomplete'), data={'q': 'guest@example.com'})
+        self.assertQueries(2, reverse('user_autocomplete'), data={'q': 'g'})
+
+    # Garden detail
+
+    def test_garden_detail(self):
+        url = reverse('garden_detail', args=[self.garden.pk])
+        response = self.assertQueries(7, url)
+        self.assertIsNotNone(response.context['plants_next_url'])
+        self.assertIsNotNone(response.context['notes_next_url'])
+        self.assertQueries(7, response.context['notes_next_url'])
+        self.assertQueries(7, f'{url}?plant={self.plants[-1].pk}')
+        self.assertQueries(7, f"{url}?plants_after={encode_cursor([self.plants[10].name, self.plants[10].pk])}")
+
+    # Cursors are user input, values of the wrong type start from the first page
+    def test_malformed_cursors(self):
+        def cursor(values):
+            return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+        detail = reverse('garden_detail', args=[self.garden.pk])
+        for url in (
+            f"{reverse('gardens')}?my_after={cursor(['x', 'y'])}",
+            f"{detail}?plants_after={cursor([{'a': 1}, 2])}",
+            f"{detail}?notes_after={cursor(['notadate', 3])}",
+            f"{reverse('garden_activity', args=[self.garden.pk])}?after={cursor(['notadate', 'x', 'note'])}",
+            f"{reverse('api_garden_plants', args=[self.garden.pk])}?after={cursor(['x', 'y'])}",
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_garden_detail_as_guest(self):
+        self.client.force_login(self.guest)
+        self.assertQueries(7, reverse('garden_detail', args=[self.garden.pk]))
+
+    def test_garden_detail_without_access(self):
+        self.client.force_login(self.stranger)
+        self.assertQueries(3, reverse('garden_detail', args=[self.garden.pk]), status=302)
+
+    def test_garden_detail_does_not_grow_with_data(self):
+        url = f'{reverse("garden_detail", args=[self.garden.pk])}?plant={self.plant.pk}'
+        self.assertQueries(7, url)
+        more = Plant.objects.bulk_create([Plant(name=f'Další {i}', garden=self.garden) for i in range(100)])
+        notes = Note.objects.bulk_create([Note(content=f'Další {i}') for i in range(100)])
+        Note.plant.through.objects.bulk_create([
+            Note.plant.through(note_id=note.pk, plant_id=plant.pk) for note, plant in zip(notes, more)
+        ] + [Note.plant.through(note_id=note.pk, plant_id=self.plant.pk) for note in notes])
+        self.assertQueries(7, url)
+
+    def test_garden_detail_add_note(self):
+        url = reverse('garden_detail', args=[self.garden.pk])
+        self.assertQueries(25, f'{url}?plant={self.plant.pk}', 'post', {
+            'add_note': '1', 'content': 'Pohnojeno', 'plant': [self.plant.pk, self.plants[1].pk],
+        }, status=302)
+
+    def test_garden_detail_generate_ai(self):
+        url = reverse('garden_detail', args=[self.garden.pk])
+        self.assertQueries(13, f'{url}?plant={self.plant.pk}', 'post', {'generate_ai': '1'}, status=302)
+
+    def test_garden_edit(self):
+        url = reverse('garden_edit', args=[self.garden.pk])
+        self.assertQueries(5, url)
+        self.assertQueries(14, url, 'post', {'name': 'A hlavní', 'users_with_access': [self.guest.pk]}, status=302)
+
+    def test_garden_delete(self):
+        garden = Garden.objects.create(name='Na smazání', owner=self.owner)
+        Plant.objects.create(name='Jediná', garden=garden)
+        url = reverse('garden_delete', args=[garden.pk])
+        self.assertQueries(3, url)
+        # Marked as deleted, the plants are purged after the commit
+        self.assertQueries(12, url, 'post', status=302)
+
+    def test_garden_export(self):
+        url = reverse('garden_export', args=[self.garden.pk])
+        for export_format in ('jsonl', 'csv'):
+            with self.subTest(export_format=export_format):
+                self.assertQueries(8, f'{url}?format={export_format}')
+
+    def test_garden_activity(self):
+        response = self.assertQueries(6, reverse('garden_activity', args=[self.garden.pk]))
+        self.assertIsNotNone(response.context['next_url'])
+        self.assertQueries(6, response.context['next_url'])
+
+    # Plants
+
+    def test_plant_add(self):
+        url = reverse('plant_add', args=[self.garden.pk])
+        self.assertQueries(3, url)
+        self.assertQueries(14, url, 'post', {'name': 'Bazalka', 'plant_type_name': 'Mrkev', 'planted_date': '2024-04-01'}, status=302)
+
+    def test_plant_edit(self):
+        url = reverse('plant_edit', args=[self.garden.pk, self.plant.pk])
+        self.assertQueries(4, url)
+        self.assertQueries(14, url, 'post', {'name': 'Rostlina 000', 'plant_type_name': 'Mrkev', 'planted_date': '2024-04-01'}, status=302)
+
+    def test_plant_delete(self):
+        url = reverse('plant_delete', args=[self.garden.pk, self.plants[-1].pk])
+        self.assertQueries(4, url)
+        self.assertQueries(14, url, 'post', status=302)
+
+    def test_plant_recommendations(self):
+        self.assertQueries(5, reverse('plant_recommendations', args=[self.plant.pk]))
+
+    # Plant types
+
+    def test_plant_type_list(self):
+        self.assertQueries(3, reverse('plant_type_list'))
+
+    def test_plant_type_autocomplete(self):
+        # Without a cache the version is new on every request, the index is loaded each time
+        response = self.assertQueries(3, reverse('plant_type_autocomplete'), data={'q': 'mrk'})
+        self.assertEqual(response.json()['results'], [{'id': self.plant_type.pk, 'name': 'Mrkev'}])
+        self.assertQueries(2, reverse('plant_type_autocomplete'))
+
+    def test_plant_type_add(self):
+        url = reverse('plant_type_add')
+        self.assertQueries(2, url)
+        self.assertQueries(6, url, 'post', {'name': 'Bazalka'}, status=302)
+
+    def test_plant_type_delete(self):
+        url = reverse('plant_type_delete', args=[self.plant_type.pk])
+        self.assertQueries(3, url)
+        self.assertQueries(8, url, 'post', status=302)
+
+    def test_search(self):
+        self.assertQueries(3, reverse('search'), data={'q': 'zalito'})
+        self.assertQueries(2, reverse('search'))
+
+
+class QueryPlanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner')
+        cls.garden, cls.shared, plants = seed_gardens(cls.owner, User.objects.create_user('guest'), User.objects.create_user('stranger'))
+        cls.plant = plants[0]
+
+    def query_plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assertNoScan(self, plan):
+        scans = [step for step in plan if step.startswith('SCAN ')]
+        self.assertEqual(scans, [], plan)
+
+    def assertUsesIndex(self, plan, index):
+        self.assertTrue(any(index in step for step in plan), plan)
+
+    def test_notes_for_plant(self):
+        plan = self.query_plan(Note.objects.filter(plant=self.plant).order_by('-date', '-id')[:NOTES_PAGE_SIZE + 1])
+        self.assertNoScan(plan)
+        # Covering, the link rows themselves are not read
+        self.assertUsesIndex(plan, 'COVERING INDEX gardening_note_plant_plant_note_idx')
+
+    def test_activity_feed(self):
+        page = garden_activity(self.garden.pk, None, 20)
+        with CaptureQueriesContext(connection) as queries:
+            garden_activity(self.garden.pk, page.next_cursor, 20)
+        union = next(query['sql'] for query in queries if 'UNION ALL' in query['sql'])
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {union}')
+            plan = [row[-1] for row in cursor.fetchall()]
+        self.assertIn('MERGE (UNION ALL)', plan)
+
+    def test_user_suggestions(self):
+        with CaptureQueriesContext(connection) as queries:
+            guests.suggest('Gue', self.owner)
+            guests.suggest('Guest@example.com', self.owner)
+        # One index range per column, read in index order without sorting the matches
+        indexes = ['gardening_user_username_nocase_idx'] * 2 + ['gardening_user_email_nocase_idx']
+        self.assertEqual(len(queries), len(indexes))
+        for query, index in zip(queries, indexes):
+            with connection.cursor() as cursor:
+                cursor.execute(f"EXPLAIN QUERY PLAN {query['sql']}")
+                plan = [row[-1] for row in cursor.fetchall()]
+            self.assertNoScan(plan)
+            self.assertUsesIndex(plan, index)
+            self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', plan)
+
+    def test_media_access(self):
+        for name, index in (
+            ('gardens/a.jpg', 'gardening_garden_image_idx'),
+            ('plants/a.jpg', 'gardening_plant_image_idx'),
+            ('notes/a.jpg', 'gardening_note_image_idx'),
+            ('variants/notes/a-200.webp', 'gardening_note_image_idx'),
+        ):
+            with self.subTest(name=name), CaptureQueriesContext(connection) as queries:
+                media._image_garden_ids(self.owner, name)
+            with connection.cursor() as cursor:
+                cursor.execute(f"EXPLAIN QUERY PLAN {queries[0]['sql']}")
+                plan = [row[-1] for row in cursor.fetchall()]
+            self.assertUsesIndex(plan, index)
+
+    def test_purge_lookup(self):
+        # The purge finds its rows through partial indexes that hold only deleted ones
+        for model, index in ((Plant, 'gardening_plant_deleted_idx'), (Garden, 'gardening_garden_deleted_idx')):
+            with self.subTest(model=model):
+                plan = self.query_plan(model.all_objects.filter(deleted_at__isnull=False).values('pk')[:500])
+                self.assertUsesIndex(plan, index)
+            self.assertFalse(any(step.startswith(('SCAN gardening_garden', 'SCAN gardening_plant', 'SCAN gardening_note'))
+                                 for step in plan), plan)
+
+    def test_latest_recommendation(self):
+        plan = self.query_plan(
+            AIRecommendation.objects.filter(plant=self.plant).order_by('-created_at', '-id')[:1]
+        )
+        self.assertUsesIndex(plan, 'gardening_rec_plant_idx')
+        self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', plan)
+
+    def test_plants_with_latest_recommendation(self):
+        plan = self.query_plan(
+            Plant.objects.filter(garden=self.garden).with_latest_recommendation().order_by('name', 'id')[:1]
+        )
+        self.assertNoScan(plan)
+        self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', plan)
+        self.assertUsesIndex(plan, 'gardening_rec_plant_idx')
+
+    def test_owned_gardens(self):
+        plan = self.query_plan(Garden.objects.owned_by(self.owner).order_by('name', 'id')[:GARDENS_PAGE_SIZE + 1])
+        self.assertUsesIndex(plan, 'gardening_garden_owner_idx')
+        self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', plan)
+
+    def test_shared_gardens(self):
+        plan = self.query_plan(Garden.objects.shared_with(self.owner).order_by('name', 'id'))
+        self.assertNoScan(plan)
+        self.assertUsesIndex(plan, 'gardening_garden_users_with_access_user_id')
+
+    def test_accessible_gardens(self):
+        plan = self.query_plan(Garden.objects.accessible_to(self.owner))
+        self.assertNoScan(plan)
+        self.assertIn('MULTI-INDEX OR', plan)
+
+    def test_garden_plants(self):
+        plan = self.query_plan(Plant.objects.filter(garden=self.garden).order_by('name', 'id')[:PLANTS_PAGE_SIZE + 1])
+        self.assertUsesIndex(plan, 'gardening_plant_garden_idx')
+        self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', plan)
+
+
+@NO_CACHE
+class MetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner')
+        cls.garden, cls.shared, plants = seed_gardens(cls.owner, User.objects.create_user('guest'), User.objects.create_user('stranger'))
+
+    def setUp(self):
+        metrics.registry.clear()
+        self.client.force_login(self.owner)
+
+    def test_request_is_measured_per_url_name(self):
+        self.client.get(reverse('garden_detail', args=[self.garden.pk]))
+        body = self.client.get('/metrics', REMOTE_ADDR='127.0.0.1').content.decode()
+        self.assertIn('zahradka_requests_total{view="garden_detail",method="GET",status="200"} 1', body)
+        self.assertIn('zahradka_request_sql_queries_bucket{view="garden_detail",le="5"} 0', body)
+        self.assertIn('zahradka_request_sql_queries_bucket{view="garden_detail",le="10"} 1', body)
+        self.assertIn('zahradka_request_template_seconds_count{view="garden_detail"} 1', body)
+        self.assertIn('zahradka_response_size_bytes_count{view="garden_detail"} 1', body)
+
+    def test_metrics_are_restricted_by_address(self):
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.1').status_code, 403)
+
+    @override_settings(METRICS_SLOW_REQUEST_SECONDS=0)
+    def test_slow_request_log_includes_sql(self):
+        with self.assertLogs('gardening.slow_requests', 'WARNING') as logs:
+            self.client.get(reverse('gardens'))
+        self.assertIn('(gardens)', logs.output[0])
+        self.assertIn('FROM "gardening_garden"', logs.output[0])
+
+
+class RecommendationCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        garden = Garden.objects.create(name='Zahrada', owner=User.objects.create_user('owner'))
+        cls.plant = Plant.objects.create(name='Rajče', garden=garden)
+        cls.twin = Plant.objects.create(name='Rajče', garden=Garden.objects.create(name='Jiná', owner=garden.owner))
+
+    def setUp(self):
+        recommendation_cache.clear()
+
+    def test_lru_and_ttl(self):
+        cache_ = RecommendationCache(max_size=2, ttl=60)
+        entries = {name: AIRecommendation(plant_id=self.plant.pk, fingerprint=name) for name in 'abc'}
+        with mock.patch('gardening.recommendations.time.monotonic', return_value=1000):
+            cache_.put(entries['a'])
+            cache_.put(entries['b'])
+            self.assertIs(cache_.get('a'), entries['a'])
+            # b is the least recently used now
+            cache_.put(entries['c'])
+            self.assertIsNone(cache_.get('b'))
+            self.assertIs(cache_.get('c'), entries['c'])
+        with mock.patch('gardening.recommendations.time.monotonic', return_value=1061):
+            self.assertIsNone(cache_.get('a'))
+        self.assertEqual(cache_.stats(), {'size': 1, 'hits': 2, 'misses': 2})
+
+    def test_database_fallback(self):
+        stored = AIRecommendation.objects.create(plant=self.plant, recommendation='Zalévat', fingerprint='f' * 64)
+        # Another process wrote the row, this one has never seen it
+        self.assertEqual(recommendation_cache.get('f' * 64), stored)
+        self.assertEqual(recommendation_cache.stats()['size'], 1)
+        recommendation_cache.clear()
+        AIRecommendation.objects.filter(pk=stored.pk).update(
+            created_at=timezone.now() - timedelta(seconds=settings.AI_RECOMMENDATION_CACHE_TTL + 1),
+        )
+        self.assertIsNone(recommendation_cache.get('f' * 64))
+
+    def test_fingerprint_follows_plant_state(self):
+        plant = Plant.objects.get(pk=self.plant.pk)
+        fingerprints = {plant_fingerprint(plant)}
+        self.assertIn(plant_fingerprint(Plant.objects.get(pk=plant.pk)), fingerprints)
+        Note.objects.create(content='Vyklíčilo').plant.add(plant)
+        fingerprints.add(plant_fingerprint(plant))
+        plant.name = 'Rajče keříčkové'
+        fingerprints.add(plant_fingerprint(plant))
+        plant.plant_type = PlantType.objects.create(name='Rajčata')
+        fingerprints.add(plant_fingerprint(plant))
+        self.assertEqual(len(fingerprints), 4)
+
+    def test_cached_recommendation(self):
+        with mock.patch.object(StubProvider, 'generate', return_value='Zalévat') as generate:
+            first = generate_recommendation(self.plant)
+            self.assertEqual(cached_recommendation(self.plant), first)
+            self.assertIn(self.plant.pk, recommendation_cache._by_plant)
+
+            # Signals drop the plant's entries, the new state misses
+            note = Note.objects.create(content='Mšice')
+            note.plant.add(self.plant)
+            self.assertNotIn(self.plant.pk, recommendation_cache._by_plant)
+            self.assertIsNone(cached_recommendation(self.plant))
+            generate_recommendation(self.plant)
+            plant = Plant.objects.get(pk=self.plant.pk)
+            plant.name = 'Rajče keříčkové'
+            plant.save()
+            self.assertNotIn(self.plant.pk, recommendation_cache._by_plant)
+            self.assertIsNone(cached_recommendation(plant))
+            self.assertEqual(generate.call_count, 2)
+
+            # Same state elsewhere: the answer is reused as a new row of that plant
+            note.plant.remove(self.plant)
+            twin = cached_recommendation(self.twin)
+            self.assertEqual((twin.plant, twin.recommendation), (self.twin, 'Zalévat'))
+            self.assertNotEqual(twin.pk, first.pk)
+            self.assertEqual(generate.call_count, 2)
+
+
+# Transactional: run_job closes old connections, which would end a TestCase transaction,
+# and the worker's threads open connections of their own
+class RecommendationJobTests(TransactionTestCase):
+    def setUp(self):
+        recommendation_cache.clear()
+        owner = User.objects.create_user('owner')
+        self.plant = Plant.objects.create(name='Rajče', garden=Garden.objects.create(name='Zahrada', owner=owner))
+        self.owner = owner
+
+    def test_enqueue(self):
+        job = enqueue_recommendation(self.plant, self.owner)
+        self.assertEqual((job.status, job.requested_by), (RecommendationJob.PENDING, self.owner))
+        # A pending job for the plant is reused
+        self.assertEqual(enqueue_recommendation(self.plant, self.owner), job)
+        self.assertEqual(run_job(job.pk), RecommendationJob.DONE)
+        # The plant has not changed, the cached answer needs no job
+        self.assertIsNone(enqueue_recommendation(self.plant, self.owner))
+        self.assertEqual(RecommendationJob.objects.count(), 1)
+
+    def test_claim_jobs(self):
+        jobs = [RecommendationJob.objects.create(plant=self.plant) for _ in range(3)]
+        self.assertEqual(claim_jobs(2), [jobs[0].pk, jobs[1].pk])
+        self.assertEqual(
+            list(RecommendationJob.objects.order_by('pk').values_list('status', flat=True)),
+            [RecommendationJob.RUNNING, RecommendationJob.RUNNING, RecommendationJob.PENDING],
+        )
+        self.assertIsNotNone(RecommendationJob.objects.get(pk=jobs[0].pk).started_at)
+        # Another worker claims the job between the SELECT and the conditional UPDATE
+        now = timezone.now
+
+        def other_worker_first():
+            RecommendationJob.objects.filter(pk=jobs[2].pk).update(status=RecommendationJob.RUNNING)
+            return now()
+
+        with mock.patch('gardening.jobs.timezone.now', side_effect=other_worker_first):
+            self.assertEqual(claim_jobs(2), [])
+
+    def test_run_job(self):
+        job = RecommendationJob.objects.create(plant=self.plant)
+        claim_jobs(1)
+        self.assertEqual(run_job(job.pk), RecommendationJob.DONE)
+        job.refresh_from_db()
+        self.assertIn('AI Suggestion for Rajče', job.recommendation.recommendation)
+        self.assertIsNotNone(job.finished_at)
+        # A job of a plant deleted in the meantime
+        self.assertIsNone(run_job(job.pk + 1))
+
+    def test_failures_end_the_job(self):
+        for name, target in (
+            ('provider', 'gardening.recommendations.StubProvider.generate'),
+            ('status save', 'gardening.models.RecommendationJob.save'),
+        ):
+            with self.subTest(failure=name):
+                recommendation_cache.clear()
+                Note.objects.create(content=name).plant.add(self.plant)
+                job = RecommendationJob.objects.create(plant=self.plant)
+                claim_jobs(1)
+                with mock.patch(target, side_effect=OperationalError('database is locked')):
+                    self.assertEqual(run_job(job.pk), RecommendationJob.FAILED)
+                job.refresh_from_db()
+                self.assertEqual((job.status, job.error), (RecommendationJob.FAILED, 'OperationalError: database is locked'))
+
+    def test_worker_once(self):
+        RecommendationJob.objects.bulk_create([RecommendationJob(plant=self.plant) for _ in range(2)])
+        # Left RUNNING by a worker that died an hour ago
+        stale = RecommendationJob.objects.create(
+            plant=self.plant, status=RecommendationJob.RUNNING, started_at=timezone.now() - timedelta(hours=1),
+        )
+        out = io.StringIO()
+        call_command('recommendation_worker', '--once', '--workers', '2', stdout=out)
+        self.assertIn('Requeued 1 stale job(s).', out.getvalue())
+        self.assertIn('Processed 3 job(s).', out.getvalue())
+        self.assertEqual(set(RecommendationJob.objects.values_list('status', flat=True)), {RecommendationJob.DONE})
+        self.assertEqual(RecommendationJob.objects.get(pk=stale.pk).status, RecommendationJob.DONE)
+
+
+class CachingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner')
+        cls.guest = User.objects.create_user('guest')
+        cls.stranger = User.objects.create_user('stranger')
+        cls.garden, cls.shared, cls.plants = seed_gardens(cls.owner, cls.guest, cls.stranger)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.owner)
+
+    def assertCachedRepeat(self, url, num=0):
+        self.client.get(url)
+        # The session and the user come from the cache too, a repeated view only
+        # loads the garden's updated_at for conditional GET on the detail page
+        with self.assertNumQueries(num):
+            return self.client.get(url)
+
+    def test_garden_detail_repeat(self):
+        self.assertCachedRepeat(reverse('garden_detail', args=[self.garden.pk]), 1)
+
+    def test_gardens_and_dashboard_repeat(self):
+        self.assertCachedRepeat(reverse('gardens'))
+        self.assertCachedRepeat(reverse('dashboard'))
+
+    def test_plant_change_invalidates_detail_and_listing(self):
+        detail = reverse('garden_detail', args=[self.garden.pk])
+        self.assertCachedRepeat(detail, 1)
+        self.assertCachedRepeat(reverse('gardens'))
+        with self.captureOnCommitCallbacks(execute=True):
+            Plant.objects.create(name='AAA Bazalka', garden=self.garden)
+        self.assertContains(self.client.get(detail), 'AAA Bazalka')
+        self.assertContains(self.client.get(reverse('gardens')), 'AAA Bazalka')
+
+    def test_note_invalidates_detail(self):
+        url = f"{reverse('garden_detail', args=[self.garden.pk])}?plant={self.plants[0].pk}"
+        self.assertCachedRepeat(url, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            Note.objects.create(content='Nová poznámka').plant.add(self.plants[0])
+        self.assertContains(self.client.get(url), 'Nová poznámka')
+
+    def test_guest_changes_invalidate_listing_and_access(self):
+        self.client.force_login(self.stranger)
+        detail = reverse('garden_detail', args=[self.garden.pk])
+        self.assertEqual(self.client.get(detail).status_code, 302)
+        self.assertNotContains(self.assertCachedRepeat(reverse('dashboard')), 'A hlavní')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.garden.users_with_access.add(self.stranger)
+        self.assertContains(self.client.get(reverse('dashboard')), 'A hlavní')
+        self.assertEqual(self.client.get(detail).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.garden.users_with_access.remove(self.stranger)
+        self.assertEqual(self.client.get(detail).status_code, 302)
+
+    def test_file_backend(self):
+        with tempfile.TemporaryDirectory() as location, override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location,
+        }}):
+            url = reverse('garden_detail', args=[self.garden.pk])
+            self.assertCachedRepeat(url, 1)
+            with self.captureOnCommitCallbacks(execute=True):
+                Plant.objects.filter(pk=self.plants[0].pk).first().save()
+            with self.assertNumQueries(5):
+                self.client.get(url)
+
+
+def image_file(name, size=(40, 20), image_format='PNG', noise=False, **options):
+    image = Image.frombytes('RGB', size, os.urandom(size[0] * size[1] * 3)) if noise else Image.new('RGB', size, 'green')
+    data = io.BytesIO()
+    image.save(data, image_format, **options)
+    return SimpleUploadedFile(name, data.getvalue())
+
+
+class UploadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner')
+        cls.garden = Garden.objects.create(name='Zahrada', owner=cls.owner)
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        overrides = override_settings(MEDIA_ROOT=media_root.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.client.force_login(self.owner)
+
+    def upload(self, image):
+        return self.client.post(reverse('plant_add', args=[self.garden.pk]), {
+            'name': 'Rajče', 'plant_type_name': 'Rajčata', 'planted_date': '2024-04-01', 'image': image,
+        })
+
+    def assertRejected(self, image, message):
+        response = self.upload(image)
+        self.assertEqual(response.status_code, 200)
+        self.assertFormError(response.context['form'], 'image', message)
+        self.assertFalse(Plant.objects.exists())
+
+    @override_settings(IMAGE_UPLOAD_MAX_BYTES=1000)
+    def test_oversized_file(self):
+        self.assertRejected(image_file('velky.png', noise=True), f'Soubor je větší než {filesizeformat(1000)}.')
+
+    @override_settings(IMAGE_UPLOAD_MAX_PIXELS=100)
+    def test_too_many_pixels(self):
+        self.assertRejected(image_file('obri.png'), 'Obrázek má příliš mnoho pixelů.')
+        # The limit belongs to uploads, Pillow's own stays for the rest of the process
+        self.assertNotEqual(Image.MAX_IMAGE_PIXELS, 100)
+
+    def test_not_an_image(self):
+        self.assertRejected(SimpleUploadedFile('skript.png', b'#!/bin/sh\n' * 10), 'Soubor není podporovaný obrázek.')
+        self.assertRejected(image_file('obrazek.bmp', image_format='BMP'), 'Podporované formáty jsou JPEG, PNG, GIF a WebP.')
+
+    def test_exif_rotation(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: rotate 90° clockwise
+        self.assertEqual(self.upload(image_file('foto.jpg', image_format='JPEG', exif=exif)).status_code, 302)
+        with Image.open(Plant.objects.get().image.path) as stored:
+            self.assertEqual(stored.size, (20, 40))
+            self.assertFalse(stored.getexif())
+
+    def test_multi_picture_jpeg(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        second = Image.new('RGB', (40, 20), 'red')
+        upload = image_file('foto.jpg', image_format='MPO', save_all=True, append_images=[second], exif=exif)
+        with Image.open(io.BytesIO(upload.read())) as image:
+            self.assertEqual((image.format, image.n_frames), ('MPO', 2))
+        upload.seek(0)
+        self.assertEqual(self.upload(upload).status_code, 302)
+        with Image.open(Plant.objects.get().image.path) as stored:
+            self.assertEqual((stored.format, stored.size), ('JPEG', (20, 40)))
+            self.assertFalse(stored.getexif())
+
+    def test_csrf_still_checked(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.owner)
+        response = client.post(reverse('plant_add', args=[self.garden.pk]), {'name': 'Rajče'})
+        self.assertEqual(response.status_code, 403)
+
+
+@override_settings(IMAGE_VARIANT_WIDTHS=(10, 20), IMAGE_VARIANTS_ASYNC=False)
+class ImageVariantTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner')
+        cls.garden = Garden.objects.create(name='Zahrada', owner=cls.owner)
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        overrides = override_settings(MEDIA_ROOT=media_root.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.client.force_login(self.owner)
+
+    def render(self, image):
+        return Template('{% load image_variants %}{% responsive_image image alt="Rajče" %}').render(
+            Context({'image': image}),
+        )
+
+    def test_upload_renders_variants(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('plant_add', args=[self.garden.pk]), {
+                'name': 'Rajče', 'plant_type_name': 'Rajčata', 'planted_date': '2024-04-01',
+                'image': image_file('rajce.png', size=(40, 20)),
+            })
+        self.assertEqual(response.status_code, 302)
+        name = Plant.objects.get().image.name
+        base = os.path.splitext(name)[0]
+        for width in (10, 20):
+            for ext in ('webp', 'jpg'):
+                variant = f'variants/{base}-{width}.{ext}'
+                self.assertEqual(variant_name(name, width, ext), variant)
+                with Image.open(default_storage.path(variant)) as stored:
+                    self.assertEqual(stored.width, width)
+
+    def test_tag_falls_back_to_original(self):
+        plant = Plant(name='Rajče', garden=self.garden, image='plants/rajce.png')
+        self.assertEqual(self.render(plant.image), '<img src="/media/plants/rajce.png" alt="Rajče" loading="lazy">')
+        # Only variants that exist are listed, the <img> gets a srcset once a JPEG exists
+        default_storage.save('variants/plants/rajce-10.webp', io.BytesIO(b'webp'))
+        self.assertEqual(self.render(plant.image), (
+            '<picture><source type="image/webp" srcset="/media/variants/plants/rajce-10.webp 10w" sizes="100vw">'
+            '<img src="/media/plants/rajce.png" alt="Rajče" loading="lazy" decoding="async"></picture>'
+        ))
+        for width in (10, 20):
+            for ext in ('webp', 'jpg'):
+                if not default_storage.exists(f'variants/plants/rajce-{width}.{ext}'):
+                    default_storage.save(f'variants/plants/rajce-{width}.{ext}', io.BytesIO(b'image'))
+        html = self.render(plant.image)
+        self.assertIn('<source type="image/webp" srcset="/media/variants/plants/rajce-10.webp 10w, '
+                      '/media/variants/plants/rajce-20.webp 20w"', html)
+        self.assertIn('src="/media/plants/rajce.png" srcset="/media/variants/plants/rajce-10.jpg 10w, '
+                      '/media/variants/plants/rajce-20.jpg 20w"', html)
+        self.assertEqual(self.render(None), '')
+
+    def test_finished_variants_refresh_cached_pages(self):
+        name = default_storage.save('gardens/zahrada.png', image_file('zahrada.png'))
+        # Rendering waits for the commit, so the variants do not exist yet
+        self.garden.image = name
+        self.garden.save()
+        response = self.client.get(reverse('gardens'))
+        self.assertContains(response, f'src="/media/{name}"')
+        self.assertNotContains(response, 'srcset')
+        version = caching.garden_version(self.garden.pk)
+        schedule_variants(name, garden_ids=[self.garden.pk])
+        self.assertNotEqual(caching.garden_version(self.garden.pk), version)
+        base = os.path.splitext(name)[0]
+        response = self.client.get(reverse('gardens'))
+        self.assertContains(response, f'/media/variants/{base}-10.jpg 10w')
+
+    def test_pool_bumps_gardens_when_done(self):
+        name = default_storage.save('gardens/zahrada.png', image_file('zahrada.png'))
+        version = caching.garden_version(self.garden.pk)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = schedule_variants(name, executor=executor, garden_ids=[self.garden.pk])
+        self.assertEqual(future.result(), 4)
+        self.assertNotEqual(caching.garden_version(self.garden.pk), version)
+
+    def test_activity_is_not_cached_with_the_page(self):
+        Garden.objects.filter(pk=self.garden.pk).update(last_note_at=timezone.now() - timedelta(days=3))
+        caching.bump_gardens([self.garden.pk])
+        self.assertContains(self.client.get(reverse('gardens')), 'last activity 3\xa0days ago')
+        # The relative time is rendered on every request, not stored with the cached fragments
+        with mock.patch('django.template.defaultfilters.timesince', return_value='1\xa0week'):
+            self.assertContains(self.client.get(reverse('gardens')), 'last activity 1\xa0week ago')
+
+
+class PlantTypeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner')
+        cls.garden = Garden.objects.create(name='Zahrádka', owner=cls.owner)
+        cls.tomato = PlantType.objects.create(name='Rajčata')
+        PlantType.objects.create(name='Cherry rajčata')
+        PlantType.objects.create(name='Ředkvičky')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.owner)
+
+    def test_normalize(self):
+        self.assertEqual(plant_types.normalize('  RAJČATA  cherry '), 'rajcata cherry')
+
+    def test_autocomplete(self):
+        response = self.client.get(reverse('plant_type_autocomplete'), {'q': 'raj'})
+        self.assertEqual([r['name'] for r in response.json()['results']], ['Rajčata', 'Cherry rajčata'])
+        response = self.client.get(reverse('plant_type_autocomplete'), {'q': 'redk'})
+        self.assertEqual([r['name'] for r in response.json()['results']], ['Ředkvičky'])
+
+    def test_index_is_refreshed_on_change(self):
+        self.assertEqual(plant_types.index.suggest('mrk'), [])
+        carrot = PlantType.objects.create(name='Mrkev')
+        self.assertEqual(plant_types.index.suggest('mrk'), [(carrot.pk, 'Mrkev')])
+        carrot.delete()
+        self.assertEqual(plant_types.index.suggest('mrk'), [])
+
+    def test_rolled_back_types_are_not_indexed(self):
+        self.assertIsNone(plant_types.index.resolve('mrkev'))
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            carrot = plant_types.get_or_create('Mrkev')
+            # Its own transaction sees the new type
+            self.assertEqual(plant_types.index.resolve('mrkev'), (carrot.pk, 'Mrkev'))
+            raise RuntimeError
+        self.assertIsNone(plant_types.index.resolve('mrkev'))
+        self.assertEqual(plant_types.get_or_create('Mrkev').name, 'Mrkev')
+        self.assertTrue(PlantType.objects.filter(name='Mrkev').exists())
+
+    def test_plant_form_reuses_normalised_type(self):
+        url = reverse('plant_add', args=[self.garden.pk])
+        self.client.post(url, {'name': 'Rajče', 'plant_type_name': ' rajcata ', 'planted_date': '2024-04-01'})
+        self.assertEqual(Plant.objects.get(name='Rajče').plant_type, self.tomato)
+        self.assertEqual(PlantType.objects.count(), 3)
+
+    def test_invalid_plant_form_creates_no_type(self):
+        url = reverse('plant_add', args=[self.garden.pk])
+        self.client.post(url, {'name': 'Bazalka', 'plant_type_name': 'Bazalka', 'planted_date': '2999-01-01'})
+        self.assertFalse(PlantType.objects.filter(name='Bazalka').exists())
+        self.client.post(url, {'name': 'Bazalka', 'plant_type_name': 'Bazalka', 'planted_date': '2024-04-01'})
+        self.assertTrue(PlantType.objects.filter(name='Bazalka').exists())
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner')
+        cls.guest = User.objects.create_user('guest')
+        cls.stranger = User.objects.create_user('stranger')
+        cls.garden, cls.shared, cls.plants = seed_gardens(cls.owner, cls.guest, cls.stranger)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.owner)
+        self.detail = f"{reverse('garden_detail', args=[self.garden.pk])}?plant={self.plants[0].pk}"
+        self.recommendations = reverse('plant_recommendations', args=[self.plants[0].pk])
+
+    def assertNotModified(self, url, etag):
+        # Only the updated_at lookup, the page data is not loaded and the session
+        # and the user come from the cache
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_revisit_is_not_modified(self):
+        for url in (self.detail, self.recommendations):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('Last-Modified', response)
+                self.assertIn('private', response['Cache-Control'])
+                self.assertNotModified(url, response['ETag'])
+
+    def test_note_changes_garden_and_plant(self):
+        detail_etag = self.client.get(self.detail)['ETag']
+        plant_etag = self.client.get(self.recommendations)['ETag']
+        note = Note.objects.create(content='Přihnojeno')
+        note.plant.add(self.plants[0])
+        self.assertEqual(self.client.get(self.detail, HTTP_IF_NONE_MATCH=detail_etag).status_code, 200)
+        self.assertEqual(self.client.get(self.recommendations, HTTP_IF_NONE_MATCH=plant_etag).status_code, 200)
+
+    def test_recommendation_changes_plant(self):
+        etag = self.client.get(self.recommendations)['ETag']
+        AIRecommendation.objects.create(plant=self.plants[0], recommendation='Zalévat ráno')
+        response = self.client.get(self.recommendations, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Zalévat ráno')
+
+    def test_etag_differs_per_user(self):
+        etag = self.client.get(self.detail)['ETag']
+        self.client.force_login(self.guest)
+        self.assertEqual(self.client.get(self.detail, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_stranger_is_redirected(self):
+        etag = self.client.get(self.recommendations)['ETag']
+        self.client.force_login(self.stranger)
+        self.assertEqual(self.client.get(self.recommendations, HTTP_IF_NONE_MATCH=etag).status_code, 302)
+        self.assertEqual(self.client.get(self.detail, HTTP_IF_NONE_MATCH=etag).status_code, 302)
+
+
+class SQLiteProfileTests(TestCase):
+    def test_pragmas_are_applied(self):
+        values = pragma_values(connection)
+        self.assertEqual(values['busy_timeout'], 5000)
+        self.assertEqual(values['synchronous'], 1)
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+
+    def test_write_transactions_are_serialised(self):
+        with tempfile.TemporaryDirectory() as directory:
+            settings_dict = {**connection.settings_dict, 'NAME': os.path.join(directory, 'db.sqlite3')}
+            first, second = DatabaseWrapper(settings_dict), DatabaseWrapper(settings_dict)
+            try:
+                # atomic() connects before it begins the transaction
+                first.ensure_connection()
+                second.ensure_connection()
+                first._start_transaction_under_autocommit()
+                self.assertEqual(pragma_values(first)['journal_mode'], 'wal')
+                with override_settings(SQLITE_PRAGMAS={**settings.SQLITE_PRAGMAS, 'busy_timeout': 50}):
+                    with self.assertRaises(OperationalError):
+                        second._start_transaction_under_autocommit()
+                first.rollback()
+                second._start_transaction_under_autocommit()
+                second.commit()
+                self.assertIsNone(second.held_write_lock)
+            finally:
+                first.close()
+                second.close()
+
+
+@override_settings(ROOT_URLCONF='ZahradkaWeb.asgi_urls')
+class AsyncViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner')
+        cls.guest = User.objects.create_user('guest')
+        cls.stranger = User.objects.create_user('stranger')
+        cls.garden, cls.shared, cls.plants = seed_gardens(cls.owner, cls.guest, cls.stranger)
+
+    def setUp(self):
+        cache.clear()
+        metrics.registry.clear()
+
+    async def test_pages_match_sync_views(self):
+        await self.async_client.aforce_login(self.owner)
+        detail = reverse('garden_detail', args=[self.garden.pk])
+        for url in (
+            reverse('dashboard'), reverse('gardens'), detail, f'{detail}?plant={self.plants[1].pk}',
+            reverse('plant_recommendations', args=[self.plants[0].pk]),
+        ):
+            with self.subTest(url=url):
+                response = await self.async_client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.resolver_match.func.__module__, 'gardening.async_views')
+        response = await self.async_client.get(f'{detail}?plant={self.plants[0].pk}')
+        self.assertContains(response, 'Zalito 29')
+        self.assertContains(response, 'Doporučení 2')
+        self.assertIsNotNone(response.context['notes_next_url'])
+        self.assertEqual(response.context['selected_plant'], self.plants[0])
+        response = await self.async_client.get(reverse('gardens'))
+        self.assertContains(response, 'Sdílená')
+        self.assertIsNotNone(response.context['my_next_url'])
+
+    async def test_foreign_plant_is_not_shown(self):
+        await self.async_client.aforce_login(self.owner)
+        foreign = await Plant.objects.filter(garden=self.shared).afirst()
+        response = await self.async_client.get(f"{reverse('garden_detail', args=[self.garden.pk])}?plant={foreign.pk}")
+        self.assertIsNone(response.context['selected_plant'])
+        self.assertEqual(response.context['notes'], [])
+
+    async def test_access_is_checked(self):
+        await self.async_client.aforce_login(self.stranger)
+        response = await self.async_client.get(reverse('garden_detail', args=[self.garden.pk]))
+        self.assertEqual(response.status_code, 302)
+        response = await self.async_client.get(reverse('plant_recommendations', args=[self.plants[0].pk]))
+        self.assertEqual(response.status_code, 302)
+        response = await self.async_client.get(reverse('plant_recommendations', args=[999999]))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_post_and_conditional_get(self):
+        await self.async_client.aforce_login(self.owner)
+        url = f"{reverse('garden_detail', args=[self.garden.pk])}?plant={self.plants[0].pk}"
+        etag = (await self.async_client.get(url))['ETag']
+        self.assertEqual((await self.async_client.get(url, headers={'If-None-Match': etag})).status_code, 304)
+        response = await self.async_client.post(url, {'add_note': '1', 'content': 'Asynchronně', 'plant': [self.plants[0].pk]})
+        self.assertEqual(response.status_code, 302)
+        self.assertContains(await self.async_client.get(url, headers={'If-None-Match': etag}), 'Asynchronně')
+
+    async def test_post_checks_csrf(self):
+        client = AsyncClient(enforce_csrf_checks=True)
+        await client.aforce_login(self.owner)
+        url = f"{reverse('garden_detail', args=[self.garden.pk])}?plant={self.plants[0].pk}"
+        token = (await client.get(url)).cookies[settings.CSRF_COOKIE_NAME].value
+        data = {'add_note': '1', 'content': 'S tokenem', 'plant': [self.plants[0].pk]}
+        self.assertEqual((await client.post(url, data)).status_code, 403)
+        response = await client.post(url, {**data, 'csrfmiddlewaretoken': token})
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(await Note.objects.filter(content='S tokenem').aexists())
+
+    async def test_queries_are_measured(self):
+        await self.async_client.aforce_login(self.owner)
+        await self.async_client.get(reverse('garden_detail', args=[self.garden.pk]))
+        body = metrics.registry.render()
+        self.assertIn('zahradka_requests_total{view="garden_detail",method="GET",status="200"} 1', body)
+        self.assertIn('zahradka_request_sql_queries_bucket{view="garden_detail",le="2"} 0', body)
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner')
+        cls.guest = User.objects.create_user('guest')
+        cls.stranger = User.objects.create_user('stranger')
+        cls.garden = Garden.objects.create(name='Zahrada', owner=cls.owner)
+        cls.garden.users_with_access.add(cls.guest)
+
+    def found(self, user, text):
+        return {(result.kind, result.object_id) for result in search.search(user, text, page_size=100)[0]}
+
+    def test_build_match_query(self):
+        # Every word is a quoted prefix term, FTS5 operators and quotes in the input are plain text
+        self.assertEqual(search.build_match_query('rajče "OR" NEAR(x* -y'), '"rajče"* "OR"* "NEAR"* "x"* "y"*')
+        self.assertEqual(search.build_match_query('" * ('), '')
+        self.assertEqual(search.build_match_query(' '.join(['slovo'] * 30)).count('"slovo"*'), 20)
+
+    def test_index_follows_changes(self):
+        plant = Plant.objects.create(name='Rajče', garden=self.garden)
+        note = Note.objects.create(content='Mšice na listech')
+        note.plant.add(plant)
+        self.assertEqual(self.found(self.owner, 'rajce'), {(search.KIND_PLANT, plant.pk), (search.KIND_NOTE, note.pk)})
+        plant.name = 'Paprika'
+        with self.captureOnCommitCallbacks(execute=True):
+            plant.save()
+        self.assertEqual(self.found(self.owner, 'rajce'), set())
+        self.assertEqual(self.found(self.owner, 'paprika'), {(search.KIND_PLANT, plant.pk), (search.KIND_NOTE, note.pk)})
+        note.delete()
+        self.assertEqual(self.found(self.owner, 'msice'), set())
+        self.garden.delete()
+        self.assertEqual(self.found(self.owner, 'paprika zahrada'), set())
+
+    def test_notes_are_reindexed_only_on_rename(self):
+        plant_type = PlantType.objects.create(name='Rajčata')
+        plant = Plant.objects.create(name='Rajče', garden=self.garden, plant_type=plant_type)
+        note = Note.objects.create(content='Mšice na listech')
+        note.plant.add(plant)
+        plant = Plant.objects.get(pk=plant.pk)
+        with mock.patch.object(search, 'index_plant_notes') as index_notes, \
+                mock.patch.object(search, 'index_type_plants') as index_plants, \
+                self.captureOnCommitCallbacks(execute=True):
+            plant.save()
+            PlantType.objects.get(pk=plant_type.pk).save()
+        index_notes.assert_not_called()
+        index_plants.assert_not_called()
+        plant_type.name = 'Papriky'
+        with self.captureOnCommitCallbacks(execute=True):
+            plant_type.save()
+        self.assertEqual(self.found(self.owner, 'papriky'), {(search.KIND_PLANT, plant.pk)})
+
+    def test_note_title_has_all_plants(self):
+        plants = [Plant.objects.create(name=name, garden=self.garden) for name in ('Rajče', 'Paprika')]
+        note = Note.objects.create(content='Zalito')
+        note.plant.add(*plants)
+        self.assertEqual(self.found(self.owner, 'paprika'), {(search.KIND_PLANT, plants[1].pk), (search.KIND_NOTE, note.pk)})
+        notes, _ = NoteAdmin(Note, admin_site).get_search_results(RequestFactory().get('/'), Note.objects.all(), 'paprika')
+        self.assertEqual(list(notes), [note])
+
+    def test_access(self):
+        Plant.objects.create(name='Rajče', garden=self.garden)
+        self.assertEqual(len(self.found(self.owner, 'rajče')), 1)
+        self.assertEqual(len(self.found(self.guest, 'rajče')), 1)
+        self.assertEqual(self.found(self.stranger, 'rajče'), set())
+        self.garden.users_with_access.remove(self.guest)
+        self.assertEqual(self.found(self.guest, 'rajče'), set())
+
+    def test_admin_search(self):
+        other = Garden.objects.create(name='Skleník', owner=self.owner)
+        Plant.objects.bulk_create([Plant(name='Rajče', garden=self.garden) for _ in range(1001)])
+        Plant.objects.create(name='Paprika', garden=other)
+        search.rebuild()
+        request = RequestFactory().get('/')
+        plant_admin = PlantAdmin(Plant, admin_site)
+        # All matches, not the first 1000
+        plants, _ = plant_admin.get_search_results(request, Plant.objects.all(), 'rajče')
+        self.assertEqual(plants.count(), 1001)
+        # The garden name is not in the index, it is still searched in the database
+        plants, _ = plant_admin.get_search_results(request, Plant.objects.all(), 'sklen')
+        self.assertEqual(list(plants.values_list('name', flat=True)), ['Paprika'])
+
+
+class TransferTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner')
+        cls.guest = User.objects.create_user('guest')
+        cls.stranger = User.objects.create_user('stranger')
+        cls.garden, cls.shared, cls.plants = seed_gardens(cls.owner, cls.guest, cls.stranger)
+        cls.garden.users_with_access.add(cls.stranger)
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        overrides = override_settings(MEDIA_ROOT=media_root.name, IMAGE_VARIANTS_ASYNC=False)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.export_dir = media_root.name
+        Plant.objects.filter(pk=self.plants[0].pk).update(image=default_storage.save('plants/rajce.png', io.BytesIO(b'png')))
+
+    def snapshot(self):
+        return (
+            sorted(Garden.objects.values_list('name', 'owner__username', 'plant_count', 'note_count')),
+            sorted(Plant.objects.values_list('garden__name', 'name', 'plant_type__name', 'note_count')),
+            Note.objects.count(),
+            Note.plant.through.objects.count(),
+            AIRecommendation.objects.count(),
+            sorted(Garden.users_with_access.through.objects.values_list('garden__name', 'user__username')),
+        )
+
+    def test_round_trip(self):
+        expected = self.snapshot()
+        for export_format in ('jsonl', 'csv', 'tar'):
+            with self.subTest(export_format=export_format):
+                path = os.path.join(self.export_dir, f'export.{export_format}')
+                call_command('export_gardens', path)
+                Garden.all_objects.all().delete()
+                Note.objects.all().delete()
+                self.assertEqual(Plant.all_objects.count(), 0)
+                call_command('import_gardens', path, stdout=io.StringIO())
+                self.assertEqual(self.snapshot(), expected)
+                plant = Plant.objects.exclude(image='').get()
+                with plant.image.open() as image:
+                    self.assertEqual(image.read(), b'png')
+                self.assertEqual([(model, fixed) for model, _, fixed in counters.repair(dry_run=True) if fixed], [])
+
+    def test_guest_export_hides_other_guests(self):
+        url = reverse('garden_export', args=[self.garden.pk])
+        for user, guests in ((self.owner, ['guest', 'stranger']), (self.guest, [])):
+            with self.subTest(user=user.username):
+                self.client.force_login(user)
+                lines = b''.join(self.client.get(url).streaming_content).decode().splitlines()
+                self.assertEqual(sorted(json.loads(lines[0])['guests']), guests)
+
+
+class ApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner')
+        cls.guest = User.objects.create_user('guest')
+        cls.stranger = User.objects.create_user('stranger')
+        cls.garden, cls.shared, cls.plants = seed_gardens(cls.owner, cls.guest, cls.stranger)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.owner)
+
+    def test_sparse_fields_select_only_their_columns(self):
+        url = reverse('api_garden_plants', args=[self.garden.pk])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'fields': 'name'})
+        self.assertEqual(response.json()['data'][0], {'id': self.plants[0].pk, 'name': 'Rostlina 000'})
+        plant_query = next(query['sql'] for query in queries if 'FROM "gardening_plant"' in query['sql'])
+        self.assertNotIn('planted_date', plant_query)
+        self.assertEqual(self.client.get(url, {'fields': 'name,secret'}).status_code, 400)
+
+    def test_cursor_pagination(self):
+        url = reverse('api_garden_plants', args=[self.garden.pk])
+        first = self.client.get(url, {'fields': 'name', 'limit': 40}).json()
+        second = self.client.get(first['next']).json()
+        names = [plant['name'] for plant in first['data'] + second['data']]
+        self.assertEqual(names, [plant.name for plant in self.plants])
+        self.assertIsNone(second['next'])
+        self.assertEqual(self.client.get(url, {'limit': 1000}).status_code, 400)
+
+    def test_include_batches_related_objects(self):
+        url = reverse('api_plant_notes', args=[self.plants[0].pk])
+        # User, plant access, notes and all their plants at once. The session comes
+        # from the cache, the user is loaded once after login.
+        with self.assertNumQueries(4):
+            document = self.client.get(url, {'include': 'plants', 'fields[plants]': 'name'}).json()
+        self.assertEqual(document['data'][0]['content'], 'Zalito 29')
+        self.assertEqual(document['data'][1]['plants'], [self.plants[0].pk])
+        # Zalito 27 is one of the notes linked to both plants
+        self.assertEqual(document['data'][2]['plants'], [self.plants[0].pk, self.plants[1].pk])
+        self.assertEqual(
+            document['included']['plants'],
+            [{'id': self.plants[0].pk, 'name': 'Rostlina 000'}, {'id': self.plants[1].pk, 'name': 'Rostlina 001'}],
+        )
+        # The gardens and the plants of all of them
+        with self.assertNumQueries(2):
+            document = self.client.get(reverse('api_gardens'), {'include': 'plants', 'fields[plants]': 'id'}).json()
+        included = {garden['name']: garden['plants'] for garden in document['data']}
+        # Capped per garden, the first plants by name
+        self.assertEqual(included['A hlavní'], [plant.pk for plant in self.plants[:INCLUDED_PLANTS_LIMIT]])
+        self.assertEqual(len(included['Sdílená']), 3)
+        self.assertEqual(len(document['included']['plants']), INCLUDED_PLANTS_LIMIT + 3)
+        self.assertNotIn('Cizí', included)
+        self.assertEqual(self.client.get(reverse('api_gardens'), {'include': 'owner'}).status_code, 400)
+
+    def test_etag_and_gzip(self):
+        url = reverse('api_plant', args=[self.plants[0].pk])
+        response = self.client.get(url, {'include': 'plant_type,latest_recommendation'}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('private', response['Cache-Control'])
+        # Only the plant access, the document itself is cached
+        with self.assertNumQueries(1):
+            not_modified = self.client.get(
+                url, {'include': 'plant_type,latest_recommendation'}, HTTP_IF_NONE_MATCH=response['ETag'],
+            )
+        self.assertEqual(not_modified.status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            AIRecommendation.objects.create(plant=self.plants[0], recommendation='Zalévat ráno')
+        document = self.client.get(url, {'include': 'plant_type,latest_recommendation'}, HTTP_IF_NONE_MATCH=response['ETag']).json()
+        self.assertEqual(document['included']['recommendations'][0]['recommendation'], 'Zalévat ráno')
+        self.assertEqual(document['included']['plant_types'], [{'id': self.plants[0].plant_type_id, 'name': 'Rajčata'}])
+
+    def test_access_rules(self):
+        self.client.force_login(self.stranger)
+        for url in (
+            reverse('api_garden', args=[self.garden.pk]),
+            reverse('api_plant', args=[self.plants[0].pk]),
+            reverse('api_plant_recommendations', args=[self.plants[0].pk]),
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+        self.client.force_login(self.guest)
+        self.assertEqual(self.client.get(reverse('api_garden', args=[self.garden.pk])).json()['data']['name'], 'A hlavní')
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('api_plant_types')).status_code, 401)
+        self.client.force_login(self.owner)
+        self.assertEqual(self.client.post(reverse('api_plant_types')).status_code, 405)
+
+
+class ActivityTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner')
+        cls.guest = User.objects.create_user('guest')
+        cls.stranger = User.objects.create_user('stranger')
+        cls.garden, cls.shared, cls.plants = seed_gardens(cls.owner, cls.guest, cls.stranger)
+        # Linked to a plant of each garden, only this garden's plant is listed here
+        cls.foreign_plant = Plant.objects.filter(garden=cls.shared).first()
+        cls.both = Note.objects.create(content='Oba záhony')
+        cls.both.plant.add(cls.plants[2], cls.foreign_plant)
+        Note.objects.create(content='Jen cizí').plant.add(cls.foreign_plant)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.owner)
+
+    def read_all(self):
+        entries, cursor = [], None
+        while True:
+            page = garden_activity(self.garden.pk, cursor, 25)
+            entries.extend(page)
+            if not page.has_next:
+                return entries
+            cursor = page.next_cursor
+
+    def assertFeed(self, entries):
+        keys = [(entry['timestamp'], entry['entry_id'], entry['kind']) for entry in entries]
+        self.assertEqual(keys, sorted(keys, reverse=True))
+        notes = [entry for entry in entries if entry['kind'] == 'note']
+        # Every note once, also those linked to two plants of the garden
+        self.assertEqual(len(notes), NOTES_PAGE_SIZE + 10 + 1)
+        self.assertEqual(len({entry['entry_id'] for entry in notes}), len(notes))
+        self.assertEqual(len(entries) - len(notes), 3 * len(self.plants))
+        both = next(entry for entry in notes if entry['entry_id'] == self.both.pk)
+        self.assertEqual(both['plants'], [(self.plants[2].pk, 'Rostlina 002')])
+        shared = next(entry for entry in notes if entry['text'] == 'Zalito 27')
+        self.assertEqual([name for _, name in shared['plants']], ['Rostlina 000', 'Rostlina 001'])
+
+    def test_pages_merge_notes_and_recommendations(self):
+        self.assertFeed(self.read_all())
+
+    def test_large_garden_plan_returns_the_same_feed(self):
+        with mock.patch('gardening.activity.LARGE_GARDEN_LINKS', 10):
+            self.assertFeed(self.read_all())
+
+    def test_page(self):
+        url = reverse('garden_activity', args=[self.garden.pk])
+        # User, garden, updated_at, garden size, the union and the note plants
+        with self.assertNumQueries(6):
+            response = self.client.get(url)
+        self.assertContains(response, 'Oba záhony')
+        self.assertNotContains(response, 'Jen cizí')
+        self.assertContains(self.client.get(response.context['next_url']), 'Doporučení')
+        self.client.force_login(self.stranger)
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+
+class CounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner')
+        cls.guest = User.objects.create_user('guest')
+        cls.stranger = User.objects.create_user('stranger')
+        cls.garden, cls.shared, cls.plants = seed_gardens(cls.owner, cls.guest, cls.stranger)
+        cls.foreign_plant = Plant.objects.filter(garden=cls.shared).first()
+
+    def assertNoDrift(self):
+        drifted = [(model, repaired) for model, _, repaired in counters.repair(batch_size=20, dry_run=True) if repaired]
+        self.assertEqual(drifted, [])
+
+    def garden_counts(self, garden=None):
+        garden = Garden.objects.get(pk=(garden or self.garden).pk)
+        return garden.plant_count, garden.note_count
+
+    def test_seeded_counts(self):
+        self.assertEqual(self.garden_counts(), (len(self.plants), NOTES_PAGE_SIZE + 10))
+        self.plants[1].refresh_from_db()
+        self.assertEqual(self.plants[1].note_count, 10)
+        self.assertIsNotNone(self.plants[1].last_recommendation_at)
+        self.assertNoDrift()
+
+    def test_note_links(self):
+        _, notes = self.garden_counts()
+        note = Note.objects.create(content='Okopáno')
+        note.plant.add(self.plants[2], self.plants[3], self.foreign_plant)
+        self.assertEqual(self.garden_counts()[1], notes + 1)
+        self.assertNoDrift()
+        # Remaining links keep the note counted once, a link that does not exist changes nothing
+        note.plant.remove(self.plants[2], self.plants[4])
+        self.plants[5].notes.add(note, Note.objects.get(content='Zalito 1'))
+        self.assertEqual(self.garden_counts()[1], notes + 1)
+        self.assertNoDrift()
+        self.plants[3].notes.clear()
+        self.plants[5].notes.remove(note)
+        self.assertEqual(self.garden_counts()[1], notes)
+        self.assertNoDrift()
+        note.plant.set([self.plants[6]])
+        note.delete()
+        self.assertEqual(self.garden_counts(), (len(self.plants), notes))
+        self.assertNoDrift()
+
+    def test_last_activity(self):
+        plant = self.plants[7]
+        newest = Note.objects.create(content='Nejnovější')
+        newest.plant.add(plant)
+        self.garden.refresh_from_db()
+        self.assertEqual(self.garden.last_note_at, newest.created_at)
+        recommendation = AIRecommendation.objects.create(plant=plant, recommendation='Zalévat')
+        self.garden.refresh_from_db()
+        self.assertEqual(self.garden.last_activity_at, recommendation.created_at)
+        # Removing the newest note goes back to the one before it
+        newest.delete()
+        self.garden.refresh_from_db()
+        self.assertEqual(self.garden.last_note_at, Note.objects.latest('created_at').created_at)
+        self.assertNoDrift()
+
+    def test_plant_delete_and_move(self):
+        self.plants[0].delete()
+        # Every third note is also linked to the second plant
+        self.assertEqual(self.garden_counts(), (len(self.plants) - 1, 10))
+        self.assertNoDrift()
+        plant = Plant.objects.get(pk=self.plants[1].pk)
+        plant.garden = self.shared
+        plant.save()
+        self.assertEqual(self.garden_counts(), (len(self.plants) - 2, 0))
+        self.assertEqual(self.garden_counts(self.shared), (4, 10))
+        self.assertNoDrift()
+
+    def test_save_keeps_counters(self):
+        stale = Plant.objects.get(pk=self.plants[8].pk)
+        Note.objects.create(content='Mezitím').plant.add(self.plants[8])
+        stale.name = 'Přejmenovaná'
+        stale.save()
+        self.assertEqual(Plant.objects.get(pk=stale.pk).note_count, 1)
+        self.assertNoDrift()
+
+    def test_repair_command(self):
+        Garden.objects.filter(pk=self.garden.pk).update(note_count=0, last_recommendation_at=None)
+        Plant.objects.filter(pk=self.plants[0].pk).update(note_count=5)
+        out = io.StringIO()
+        call_command('repair_counters', '--dry-run', stdout=out)
+        self.assertIn('Zahrádky: 1 of', out.getvalue())
+        call_command('repair_counters', '--batch-size', '7', stdout=out)
+        self.assertNoDrift()
+
+    @NO_CACHE
+    def test_listing_shows_counters(self):
+        self.client.force_login(self.owner)
+        response = self.client.get(reverse('gardens'))
+        self.assertContains(response, f'{len(self.plants)} plants · {NOTES_PAGE_SIZE + 10} notes · last activity')
+
+
+class GuestPickerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', email='owner@zahrada.cz')
+        cls.guest = User.objects.create_user('guest', email='host@zahrada.cz')
+        User.objects.bulk_create([
+            User(username=f'zahradnik{i:02}', email=f'z{i:02}@zahrada.cz') for i in range(40)
+        ] + [User(username='zahradnik-pryc', is_active=False)])
+        cls.garden = Garden.objects.create(name='Zahrada', owner=cls.owner)
+        cls.garden.users_with_access.add(cls.guest)
+
+    def setUp(self):
+        self.client.force_login(self.owner)
+
+    def suggestions(self, query):
+        response = self.client.get(reverse('user_autocomplete'), {'q': query})
+        return [result['username'] for result in response.json()['results']]
+
+    def test_form_renders_selected_users_only(self):
+        response = self.client.get(reverse('garden_edit', args=[self.garden.pk]))
+        self.assertContains(response, f'value="{self.guest.pk}" id="id_users_with_access_0" checked')
+        self.assertNotContains(response, 'zahradnik')
+
+    def test_suggestions(self):
+        self.assertEqual(self.suggestions('ZAHRADNIK1'), [f'zahradnik{i}' for i in range(10, 20)])
+        self.assertEqual(self.suggestions('HOST@zahrada.cz'), ['guest'])
+        # E-mail addresses are not found by their prefix
+        self.assertEqual(self.suggestions('host@'), [])
+        self.assertEqual(self.suggestions('host@zahrada'), [])
+        # Not the owner, inactive users and too short queries
+        self.assertEqual(self.suggestions('owner'), [])
+        self.assertEqual(self.suggestions('zahradnik-'), [])
+        self.assertEqual(self.suggestions('z'), [])
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('user_autocomplete'), {'q': 'zahradnik'}).status_code, 302)
+
+    def test_submits_selected_ids(self):
+        url = reverse('garden_edit', args=[self.garden.pk])
+        added = User.objects.get(username='zahradnik07')
+        response = self.client.post(url, {'name': 'Zahrada', 'users_with_access': [self.guest.pk, added.pk]})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(set(self.garden.users_with_access.all()), {self.guest, added})
+        response = self.client.post(url, {'name': 'Zahrada', 'users_with_access': [self.owner.pk, 999999]})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['form'].errors['users_with_access'])
+
+
+class AuthCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('zahradnik', password='heslo-1')
+        cls.group = Group.objects.create(name='Správci')
+        cls.user.groups.add(cls.group)
+        cls.permission = Permission.objects.get(codename='change_garden')
+
+    def setUp(self):
+        cache.clear()
+        self.backend = CachedModelBackend()
+
+    def assertReloaded(self, reloaded=True):
+        with self.assertNumQueries(1 if reloaded else 0):
+            return self.backend.get_user(self.user.pk)
+
+    def test_user_is_cached_until_changed(self):
+        self.assertReloaded()
+        user = self.assertReloaded(False)
+        self.assertEqual(user, self.user)
+        # A copy, changes made by one request stay in it
+        user.first_name = 'Jan'
+        self.assertEqual(self.assertReloaded(False).first_name, '')
+        User.objects.get(pk=self.user.pk).save()
+        self.assertReloaded()
+
+    def test_permission_changes_reload_the_user(self):
+        self.assertFalse(self.assertReloaded().has_perm('gardening.change_garden'))
+        self.group.permissions.add(self.permission)
+        self.assertTrue(self.assertReloaded().has_perm('gardening.change_garden'))
+        self.assertReloaded(False)
+        self.permission.group_set.clear()
+        self.assertFalse(self.assertReloaded().has_perm('gardening.change_garden'))
+        self.user.user_permissions.add(self.permission)
+        self.assertReloaded()
+        self.group.user_set.remove(self.user)
+        self.assertReloaded()
+
+    def test_deactivated_user_is_logged_out(self):
+        self.assertIsNotNone(self.assertReloaded())
+        user = User.objects.get(pk=self.user.pk)
+        user.is_active = False
+        user.save()
+        self.assertIsNone(self.assertReloaded())
+
+    def test_password_change_ends_other_sessions(self):
+        self.client.login(username='zahradnik', password='heslo-1')
+        self.client.get(reverse('dashboard'))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(reverse('dashboard')).status_code, 200)
+        user = User.objects.get(pk=self.user.pk)
+        user.set_password('heslo-2')
+        user.save()
+        self.assertEqual(self.client.get(reverse('dashboard')).status_code, 302)
+
+    def test_signed_cookie_sessions_run_no_session_query(self):
+        with override_settings(SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies'):
+            self.client.force_login(self.user)
+            self.client.get(reverse('dashboard'))
+            with self.assertNumQueries(0):
+                self.assertEqual(self.client.get(reverse('dashboard')).status_code, 200)
+        self.assertFalse(Session.objects.exists())
+
+    def test_purge_sessions(self):
+        now = timezone.now()
+        Session.objects.bulk_create([
+            Session(session_key=f'expired{i}', session_data='', expire_date=now - timedelta(days=1))
+            for i in range(5)
+        ] + [Session(session_key='current', session_data='', expire_date=now + timedelta(days=1))])
+        output = io.StringIO()
+        call_command('purge_sessions', batch_size=2, verbosity=2, stdout=output)
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ['current'])
+        self.assertEqual(output.getvalue().count('session(s) deleted\n'), 3)
+        self.assertIn('5 expired session(s) deleted.', output.getvalue())
+
+
+class StaticAssetTests(TestCase):
+    def setUp(self):
+        source = tempfile.TemporaryDirectory()
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(source.cleanup)
+        self.addCleanup(root.cleanup)
+        os.makedirs(os.path.join(source.name, 'fonts'))
+        with open(os.path.join(source.name, 'app.css'), 'w') as css:
+            css.write('@font-face { src: url("fonts/icons.woff2"); }\n' + '.green { color: #0f0; }\n' * 100)
+        with open(os.path.join(source.name, 'fonts', 'icons.woff2'), 'wb') as font:
+            font.write(os.urandom(2048))
+        overrides = override_settings(
+            STATIC_ROOT=root.name, STATICFILES_DIRS=[source.name],
+            STATICFILES_FINDERS=['django.contrib.staticfiles.finders.FileSystemFinder'],
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.root = root.name
+
+    def collect(self):
+        call_command('collectstatic', interactive=False, verbosity=0)
+
+    def test_collectstatic_hashes_and_compresses(self):
+        self.collect()
+        css = staticfiles_storage.stored_name('app.css')
+        font = staticfiles_storage.stored_name('fonts/icons.woff2')
+        self.assertRegex(css, r'^app\.[0-9a-f]{12}\.css$')
+        with gzip.open(os.path.join(self.root, css + '.gz'), 'rt') as compressed:
+            self.assertIn(font.split('/')[-1], compressed.read())
+        # Fonts are compressed already
+        self.assertFalse(os.path.exists(os.path.join(self.root, font + '.gz')))
+
+    def test_middleware_serves_compressed_immutable_files(self):
+        self.collect()
+        url = staticfiles_storage.url('app.css')
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='br;q=0, gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertIn(b'.green', gzip.decompress(b''.join(response.streaming_content)))
+
+        plain = self.client.get(url)
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        self.assertIn(b'.green', b''.join(plain.streaming_content))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=plain['ETag']).status_code, 304)
+
+        # Unhashed names may change, they are cached briefly
+        self.assertEqual(self.client.get('/static/app.css')['Cache-Control'], 'public, max-age=60')
+        self.assertEqual(self.client.get('/static/missing.css').status_code, 404)
+
+    # Before collectstatic there is no manifest and the names stay unhashed
+    def test_pages_use_local_assets(self):
+        user = User.objects.create_user('zahradnik')
+        self.client.force_login(user)
+        response = self.client.get(reverse('dashboard'))
+        self.assertNotContains(response, 'cdn.jsdelivr.net')
+        self.assertContains(response, '/static/vendor/bootstrap/css/bootstrap.min.css')
+
+    def test_missing_vendor_assets_are_an_error(self):
+        with mock.patch.object(assets, 'VENDOR_ROOT', Path(self.root)):
+            errors = assets.check_vendor_assets(None)
+        self.assertEqual([error.id for error in errors], ['gardening.E001'])
+        self.assertIn(VENDOR_ASSETS[0][1], errors[0].msg)
+
+
+class MediaTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner')
+        cls.guest = User.objects.create_user('guest')
+        cls.stranger = User.objects.create_user('stranger')
+        cls.garden = Garden.objects.create(name='Zahrada', owner=cls.owner)
+        cls.garden.users_with_access.add(cls.guest)
+        cls.plant = Plant.objects.create(name='Rajče', garden=cls.garden)
+        cls.note = Note.objects.create(content='Vyklíčilo')
+        cls.note.plant.add(cls.plant)
+        # Set directly, the upload pipeline is not what is tested here
+        Plant.objects.filter(pk=cls.plant.pk).update(image='plants/rajce.jpg')
+        Note.objects.filter(pk=cls.note.pk).update(image='notes/klicky.png')
+
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        overrides = override_settings(MEDIA_ROOT=media_root.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        for name in ('plants/rajce.jpg', 'notes/klicky.png', 'variants/plants/rajce-200.webp', 'plants/cizi.jpg'):
+            os.makedirs(os.path.join(media_root.name, os.path.dirname(name)), exist_ok=True)
+            with open(os.path.join(media_root.name, name), 'wb') as file:
+                file.write(bytes(range(100)))
+        self.client.force_login(self.owner)
+
+    def get(self, name, **headers):
+        return self.client.get(f'/media/{name}', **headers)
+
+    def test_access(self):
+        for name in ('plants/rajce.jpg', 'notes/klicky.png', 'variants/plants/rajce-200.webp'):
+            with self.subTest(name=name):
+                self.assertEqual(self.get(name).status_code, 200)
+                self.client.force_login(self.guest)
+                self.assertEqual(self.get(name).status_code, 200)
+                self.client.force_login(self.stranger)
+                self.assertEqual(self.get(name).status_code, 404)
+                self.client.logout()
+                self.assertEqual(self.get(name).status_code, 404)
+                self.client.force_login(self.owner)
+        # Files no image refers to and names outside MEDIA_ROOT
+        self.assertEqual(self.get('plants/cizi.jpg').status_code, 404)
+        self.assertEqual(self.get('plants/../../etc/passwd').status_code, 404)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.garden.users_with_access.remove(self.guest)
+        self.client.force_login(self.guest)
+        self.assertEqual(self.get('plants/rajce.jpg').status_code, 404)
+
+    def test_denials_are_not_cached(self):
+        other = Garden.objects.create(name='Sdílená', owner=self.stranger)
+        self.client.force_login(self.guest)
+        self.assertEqual(self.get('plants/cizi.jpg').status_code, 404)
+        # The image appears in a garden the guest can see, nothing bumps the guest's version
+        with self.captureOnCommitCallbacks(execute=True):
+            other.users_with_access.add(self.guest)
+        self.assertEqual(self.get('plants/cizi.jpg').status_code, 404)
+        plant = Plant.objects.create(name='Cizí', garden=other)
+        Plant.objects.filter(pk=plant.pk).update(image='plants/cizi.jpg')
+        self.assertEqual(self.get('plants/cizi.jpg').status_code, 200)
+
+    def test_full_file_and_revalidation(self):
+        response = self.get('plants/rajce.jpg')
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Cache-Control'], f'private, max-age={settings.MEDIA_CACHE_MAX_AGE}')
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(100)))
+        # The access check is cached, the session and the user are too
+        with self.assertNumQueries(0):
+            not_modified = self.get('plants/rajce.jpg', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_ranges(self):
+        etag = self.get('plants/rajce.jpg')['ETag']
+        for header, content_range, content in (
+            ('bytes=10-19', 'bytes 10-19/100', bytes(range(10, 20))),
+            ('bytes=90-', 'bytes 90-99/100', bytes(range(90, 100))),
+            ('bytes=-5', 'bytes 95-99/100', bytes(range(95, 100))),
+            ('bytes=95-500', 'bytes 95-99/100', bytes(range(95, 100))),
+        ):
+            with self.subTest(header=header):
+                response = self.get('plants/rajce.jpg', HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(response['Content-Range'], content_range)
+                self.assertEqual(response['Content-Length'], str(len(content)))
+                self.assertEqual(b''.join(response.streaming_content), content)
+        unsatisfiable = self.get('plants/rajce.jpg', HTTP_RANGE='bytes=100-')
+        self.assertEqual(unsatisfiable.status_code, 416)
+        self.assertEqual(unsatisfiable['Content-Range'], 'bytes */100')
+        # Several ranges and a range of another version get the whole file
+        self.assertEqual(self.get('plants/rajce.jpg', HTTP_RANGE='bytes=0-1,5-6').status_code, 200)
+        self.assertEqual(self.get('plants/rajce.jpg', HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE='"old"').status_code, 200)
+        self.assertEqual(self.get('plants/rajce.jpg', HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE=etag).status_code, 206)
+
+    def test_proxy_handoff(self):
+        with override_settings(MEDIA_ACCEL='x-accel-redirect'):
+            response = self.get('notes/klicky.png')
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/notes/klicky.png')
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(response.content, b'')
+        with override_settings(MEDIA_ACCEL='x-sendfile'):
+            response = self.get('notes/klicky.png')
+        self.assertEqual(response['X-Sendfile'], os.path.join(settings.MEDIA_ROOT, 'notes', 'klicky.png'))
+
+
+@override_settings(DELETION_ASYNC=False)
+class DeletionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner')
+        cls.guest = User.objects.create_user('guest')
+        cls.stranger = User.objects.create_user('stranger')
+        cls.garden, cls.shared, cls.plants = seed_gardens(cls.owner, cls.guest, cls.stranger)
+        RecommendationJob.objects.create(plant=cls.plants[0], requested_by=cls.owner)
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        overrides = override_settings(MEDIA_ROOT=media_root.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.files = {}
+        for model, obj, name in (
+            (Garden, self.garden, 'gardens/zahrada.jpg'),
+            (Plant, self.plants[0], 'plants/rajce.jpg'),
+            (Plant, self.plants[1], 'plants/mrkev.jpg'),
+        ):
+            model.all_objects.filter(pk=obj.pk).update(image=name)
+            self.files[name] = os.path.join(media_root.name, name)
+            os.makedirs(os.path.dirname(self.files[name]), exist_ok=True)
+            open(self.files[name], 'wb').close()
+
+    def test_garden_is_hidden_at_once(self):
+        self.client.force_login(self.owner)
+        url = reverse('garden_delete', args=[self.garden.pk])
+        # The purge would run on commit, which never comes in a TestCase
+        self.client.post(url)
+        self.assertFalse(Garden.objects.filter(pk=self.garden.pk).exists())
+        self.assertTrue(Garden.all_objects.filter(pk=self.garden.pk).exists())
+        self.assertFalse(Plant.objects.filter(garden_id=self.garden.pk).exists())
+        self.assertNotContains(self.client.get(reverse('gardens')), 'A hlavní')
+        self.assertEqual(self.client.get(reverse('garden_detail', args=[self.garden.pk])).status_code, 404)
+        self.assertEqual(search.search(self.owner, 'zalito')[0], [])
+
+    def test_plant_purge(self):
+        shared_note = Note.objects.filter(plant=self.plants[1]).first()
+        only_note = Note.objects.create(content='Jen u rajčete', image='notes/rajce.png')
+        only_note.plant.add(self.plants[0])
+        with self.captureOnCommitCallbacks(execute=True):
+            deletion.delete_plant(self.plants[0])
+        self.assertFalse(Plant.all_objects.filter(pk=self.plants[0].pk).exists())
+        self.assertFalse(AIRecommendation.objects.filter(plant=self.plants[0]).exists())
+        self.assertFalse(RecommendationJob.objects.filter(plant=self.plants[0]).exists())
+        # Notes of no other plant go with their plant, shared ones stay
+        self.assertEqual(Note.objects.filter(plant__isnull=True).count(), 0)
+        self.assertFalse(Note.objects.filter(pk=only_note.pk).exists())
+        self.assertTrue(Note.objects.filter(pk=shared_note.pk).exists())
+        self.assertFalse(os.path.exists(self.files['plants/rajce.jpg']))
+        self.assertTrue(os.path.exists(self.files['plants/mrkev.jpg']))
+        garden = Garden.objects.get(pk=self.garden.pk)
+        # Every third note is also linked to the second plant
+        self.assertEqual((garden.plant_count, garden.note_count), (len(self.plants) - 1, 10))
+        self.assertEqual([(model, fixed) for model, _, fixed in counters.repair(dry_run=True) if fixed], [])
+        self.assertEqual({r.object_id for r in search.search(self.owner, 'zalito', page_size=100)[0]},
+                         set(Note.objects.filter(plant=self.plants[1]).values_list('pk', flat=True)))
+
+    def test_garden_purge_in_batches(self):
+        deletion.delete_garden(self.garden)
+        with self.captureOnCommitCallbacks(execute=True):
+            purged = list(deletion.purge(batch_size=7))
+        self.assertEqual(purged[-1], (Garden, 1))
+        self.assertEqual(sum(rows for model, rows in purged if model is Plant), len(self.plants))
+        self.assertFalse(Garden.all_objects.filter(pk=self.garden.pk).exists())
+        self.assertFalse(Plant.all_objects.filter(garden_id=self.garden.pk).exists())
+        self.assertFalse(Garden.users_with_access.through.objects.filter(garden_id=self.garden.pk).exists())
+        self.assertFalse(Note.objects.exists())
+        self.assertEqual(AIRecommendation.objects.count(), 0)
+        self.assertFalse(any(os.path.exists(path) for path in self.files.values()))
+        # Other gardens are untouched
+        self.assertEqual(Plant.objects.filter(garden=self.shared).count(), 3)
+
+    def test_purge_command(self):
+        Note.objects.create(content='Bez rostliny')
+        Plant.objects.filter(pk=self.plants[2].pk).update(deleted_at=timezone.now())
+        out = io.StringIO()
+        call_command('purge_deleted', '--orphans', '--batch-size', '5', stdout=out)
+        self.assertIn('Rostliny: 1 row(s) purged.', out.getvalue())
+        self.assertIn('1 orphaned note(s) deleted.', out.getvalue())
+        self.assertFalse(Note.objects.filter(plant__isnull=True).exists())
@@ -0,0 +1,352 @@
+import csv
+import io
+import json
+import os
+import tarfile
+import tempfile
+from itertools import groupby
+
+from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from gardening import counters, plant_types, search
+from gardening.models import AIRecommendation, Garden, Note, Plant, PlantType
+
+# Export a import zahrádek mezi instancemi. Export je generátor záznamů
+# (zahrádky, rostliny, poznámky, doporučení - v tomto pořadí), čtený po
+# dávkách přes .iterator(), takže paměť nezávisí na velikosti dat. Import
+# ukládá záznamy dávkově přes bulk_create.
+
+CHUNK_SIZE = 2000
+
+CSV_FIELDS = [
+    'type', 'id', 'garden', 'owner', 'guests', 'name', 'description', 'plant_type',
+    'planted_date', 'date', 'content', 'plants', 'plant', 'recommendation', 'created_at', 'image',
+]
+
+MEDIA_PREFIX = 'media/'
+DATA_NAME = 'data.jsonl'
+
+
+def _batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# With guests=False the guests of the gardens are left out, e.g. for an export
+# requested by a guest, who must not learn who else the garden is shared with
+def iter_records(gardens, guests=True):
+    garden_ids = gardens.values('pk')
+    Guest = Garden.users_with_access.through
+    ordered = gardens.select_related('owner').order_by('id').iterator(chunk_size=CHUNK_SIZE)
+    for batch in _batched(ordered, CHUNK_SIZE):
+        guest_names = {}
+        if guests:
+            rows = Guest.objects.filter(garden_id__in=[g.pk for g in batch]).values_list('garden_id', 'user__username')
+            for garden_id, username in rows:
+                guest_names.setdefault(garden_id, []).append(username)
+        for garden in batch:
+            yield {
+                'type': 'garden',
+                'id': garden.pk,
+                'owner': garden.owner.username,
+                'guests': guest_names.get(garden.pk, []),
+                'name': garden.name,
+                'description': garden.description,
+                'image': garden.image.name or None,
+            }
+
+    plants = Plant.objects.filter(garden_id__in=garden_ids).select_related('plant_type').order_by('id')
+    for plant in plants.iterator(chunk_size=CHUNK_SIZE):
+        yield {
+            'type': 'plant',
+            'id': plant.pk,
+            'garden': plant.garden_id,
+            'name': plant.name,
+            'plant_type': plant.plant_type.name if plant.plant_type_id else None,
+            'planted_date': plant.planted_date.isoformat() if plant.planted_date else None,
+            'image': plant.image.name or None,
+        }
+
+    # Notes are read through the link table, consecutive rows of one note are grouped
+    links = Note.plant.through.objects.filter(plant__garden_id__in=garden_ids).order_by('note_id', 'plant_id').values_list(
+        'note_id', 'plant_id', 'note__date', 'note__created_at', 'note__content', 'note__image',
+    )
+    for note_id, rows in groupby(links.iterator(chunk_size=CHUNK_SIZE), key=lambda r: r[0]):
+        rows = list(rows)
+        _, _, date, created_at, content, image = rows[0]
+        yield {
+            'type': 'note',
+            'id': note_id,
+            'plants': [row[1] for row in rows],
+            'date': date.isoformat(),
+            'created_at': created_at.isoformat(),
+            'content': content,
+            'image': image or None,
+        }
+
+    recommendations = AIRecommendation.objects.filter(plant__garden_id__in=garden_ids).order_by('id')
+    for rec in recommendations.iterator(chunk_size=CHUNK_SIZE):
+        yield {
+            'type': 'recommendation',
+            'id': rec.pk,
+            'plant': rec.plant_id,
+            'recommendation': rec.recommendation,
+            'created_at': rec.created_at.isoformat(),
+        }
+
+
+def iter_jsonl(records):
+    for record in records:
+        yield json.dumps(record, ensure_ascii=False) + '\n'
+
+
+def iter_csv(records):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=CSV_FIELDS, extrasaction='ignore')
+    writer.writeheader()
+    for record in records:
+        row = dict(record)
+        for key in ('guests', 'plants'):
+            if key in row:
+                row[key] = ' '.join(str(value) for value in row[key])
+        writer.writerow(row)
+        if buffer.tell() > 64 * 1024:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def read_csv(lines):
+    for row in csv.DictReader(lines):
+        record = {key: (value if value != '' else None) for key, value in row.items()}
+        record['guests'] = (record.get('guests') or '').split()
+        record['plants'] = [int(value) for value in (record.get('plants') or '').split()]
+        for key in ('id', 'garden', 'plant'):
+            if record.get(key) is not None:
+                record[key] = int(record[key])
+        yield record
+
+
+def read_jsonl(lines):
+    for line in lines:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def _image_names(gardens):
+    garden_ids = gardens.values('pk')
+    querysets = (
+        gardens.exclude(image='').exclude(image__isnull=True),
+        Plant.objects.filter(garden_id__in=garden_ids).exclude(image='').exclude(image__isnull=True),
+        Note.objects.filter(plant__garden_id__in=garden_ids).exclude(image='').exclude(image__isnull=True).distinct(),
+    )
+    for queryset in querysets:
+        yield from queryset.values_list('image', flat=True).iterator(chunk_size=CHUNK_SIZE)
+
+
+class _ChunkWriter:
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        chunks, self.chunks = self.chunks, []
+        return b''.join(chunks)
+
+
+# Tar stream: media files first so import can rename them before the records refer to them
+def iter_tar(gardens, guests=True):
+    out = _ChunkWriter()
+    with tarfile.open(fileobj=out, mode='w|') as archive:
+        for name in _image_names(gardens):
+            if not default_storage.exists(name):
+                continue
+            info = tarfile.TarInfo(MEDIA_PREFIX + name)
+            info.size = default_storage.size(name)
+            with default_storage.open(name, 'rb') as media:
+                archive.addfile(info, media)
+            yield out.drain()
+        with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as data:
+            for line in iter_jsonl(iter_records(gardens, guests)):
+                data.write(line.encode())
+            info = tarfile.TarInfo(DATA_NAME)
+            info.size = data.tell()
+            data.seek(0)
+            archive.addfile(info, data)
+    yield out.drain()
+
+
+class Importer:
+    def __init__(self, owner=None, create_users=False, batch_size=CHUNK_SIZE):
+        self.owner = owner
+        self.create_users = create_users
+        self.batch_size = batch_size
+        self.garden_ids = {}
+        self.plant_ids = {}
+        self.media_names = {}
+        self.users = {}
+        self.counts = {'garden': 0, 'plant': 0, 'note': 0, 'recommendation': 0}
+
+    def run(self, records):
+        batch, batch_type = [], None
+        for record in records:
+            if record['type'] != batch_type or len(batch) >= self.batch_size:
+                self._flush(batch_type, batch)
+                batch, batch_type = [], record['type']
+            batch.append(record)
+        self._flush(batch_type, batch)
+        self._recount()
+        return self.counts
+
+    def run_tar(self, fileobj):
+        with tarfile.open(fileobj=fileobj, mode='r|*') as archive:
+            for member in archive:
+                if not member.isfile():
+                    continue
+                if member.name.startswith(MEDIA_PREFIX):
+                    name = member.name[len(MEDIA_PREFIX):]
+                    self.media_names[name] = default_storage.save(name, archive.extractfile(member))
+                elif member.name == DATA_NAME:
+                    data = archive.extractfile(member)
+                    self.run(read_jsonl(line.decode('utf-8') for line in iter(data.readline, b'')))
+        return self.counts
+
+    def _flush(self, record_type, batch):
+        if batch:
+            with transaction.atomic():
+                getattr(self, f'_import_{record_type}')(batch)
+            self.counts[record_type] += len(batch)
+
+    # bulk_create sends no signals, the counters of everything imported are computed at the end
+    def _recount(self):
+        for plant_ids in _batched(self.plant_ids.values(), self.batch_size):
+            with transaction.atomic():
+                counters.recount_plants(plant_ids)
+        for garden_ids in _batched(self.garden_ids.values(), self.batch_size):
+            with transaction.atomic():
+                counters.recount_gardens(garden_ids)
+
+    def _image(self, record):
+        name = record.get('image')
+        return self.media_names.get(name, name) if name else None
+
+    def _resolve_users(self, usernames):
+        missing = set(usernames) - set(self.users)
+        if missing:
+            for user in User.objects.filter(username__in=missing):
+                self.users[user.username] = user
+            if self.create_users:
+                new = [User(username=name) for name in missing if name not in self.users]
+                for user in new:
+                    user.set_unusable_password()
+                for user in User.objects.bulk_create(new):
+                    self.users[user.username] = user
+
+    def _import_garden(self, batch):
+        self._resolve_users({name for r in batch for name in [r.get('owner'), *r.get('guests', [])] if name})
+        gardens = []
+        for record in batch:
+            owner = self.owner or self.users.get(record.get('owner'))
+            if owner is None:
+                raise ValueError(f"Unknown owner {record.get('owner')!r}, use --owner or --create-users")
+            gardens.append(Garden(
+                owner=owner, name=record['name'], description=record.get('description'), image=self._image(record),
+            ))
+        Garden.objects.bulk_create(gardens)
+        Guest = Garden.users_with_access.through
+        guests = []
+        for record, garden in zip(batch, gardens):
+            self.garden_ids[record['id']] = garden.pk
+            for name in record.get('guests', []):
+                user = self.users.get(name)
+                if user is not None and user.pk != garden.owner_id:
+                    guests.append(Guest(garden_id=garden.pk, user_id=user.pk))
+        Guest.objects.bulk_create(guests, ignore_conflicts=True)
+        search.index_gardens(gardens)
+
+    # Plant type names of the whole batch are matched against the normalised index,
+    # the missing ones are created with two queries, one row per normalised name
+    def _plant_types(self, names):
+        types, missing = {}, {}
+        for name in {name for name in names if name}:
+            found = plant_types.index.resolve(name)
+            if found is not None:
+                types[name] = PlantType(pk=found[0], name=found[1])
+            else:
+                missing.setdefault(plant_types.normalize(name), []).append(name)
+        if missing:
+            spelling = {normalized: sorted(variants)[0] for normalized, variants in missing.items()}
+            PlantType.objects.bulk_create([PlantType(name=name) for name in spelling.values()], ignore_conflicts=True)
+            plant_types.invalidate()
+            created = {plant_type.name: plant_type for plant_type in PlantType.objects.filter(name__in=spelling.values())}
+            for normalized, variants in missing.items():
+                for name in variants:
+                    types[name] = created.get(spelling[normalized])
+        return types
+
+    def _import_plant(self, batch):
+        types = self._plant_types(r.get('plant_type') for r in batch)
+        plants = [
+            Plant(
+                garden_id=self.garden_ids[record['garden']],
+                name=record['name'],
+                plant_type=types.get(record.get('plant_type')),
+                planted_date=record.get('planted_date'),
+                image=self._image(record),
+            )
+            for record in batch
+        ]
+        Plant.objects.bulk_create(plants)
+        for record, plant in zip(batch, plants):
+            self.plant_ids[record['id']] = plant.pk
+        search.index_plants(plants)
+
+    def _import_note(self, batch):
+        notes = [Note(content=record['content'], image=self._image(record)) for record in batch]
+        Note.objects.bulk_create(notes)
+        # bulk_create fills auto_now_add fields with the current date, restore the original ones.
+        # Exports from before created_at existed place the note at midnight of its date.
+        for record, note in zip(batch, notes):
+            note.date = record['date']
+            note.created_at = record.get('created_at') or f"{record['date']}T00:00:00+00:00"
+        Note.objects.bulk_update(notes, ['date', 'created_at'])
+        Link = Note.plant.through
+        Link.objects.bulk_create([
+            Link(note_id=note.pk, plant_id=self.plant_ids[plant_id])
+            for record, note in zip(batch, notes)
+            for plant_id in record['plants']
+            if plant_id in self.plant_ids
+        ])
+        search.index_notes([note.pk for note in notes])
+
+    def _import_recommendation(self, batch):
+        recommendations = [
+            AIRecommendation(plant_id=self.plant_ids[record['plant']], recommendation=record['recommendation'])
+            for record in batch
+        ]
+        AIRecommendation.objects.bulk_create(recommendations)
+        for record, recommendation in zip(batch, recommendations):
+            recommendation.created_at = record['created_at']
+        AIRecommendation.objects.bulk_update(recommendations, ['created_at'])
+
+
+def export_filename(garden, extension):
+    return f'garden-{garden.pk}.{extension}'
+
+
+def detect_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    return {'.csv': 'csv', '.tar': 'tar', '.jsonl': 'jsonl'}.get(extension, 'jsonl')
@@ -0,0 +1,150 @@
+import io
+import os
+import warnings
+from functools import wraps
+
+from django.conf import settings
+from django.core.files.uploadhandler import SkipFile, TemporaryFileUploadHandler
+from django.template.defaultfilters import filesizeformat
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# Nahrávání obrázků: soubor se průběžně zapisuje do dočasného souboru,
+# hlídá se limit velikosti a hlavička obrázku se ověřuje už z prvních
+# chunků, takže obří nebo podvržený soubor se zahodí dřív, než ho
+# Pillow začne dekódovat. Handler používají jen formuláře zahrádek,
+# rostlin a poznámek (dekorátor image_uploads), které chyby zobrazí u pole.
+
+# MPO are the multi-picture JPEGs of many phone cameras
+ALLOWED_FORMATS = {'JPEG', 'MPO', 'PNG', 'GIF', 'WEBP'}
+
+# Header must be recognised within this many bytes
+HEADER_PROBE_BYTES = 64 * 1024
+
+_ERRORS_ATTR = 'upload_errors'
+
+
+def get_upload_errors(request):
+    # Make sure the body has been parsed so the handler had a chance to run
+    request.FILES
+    return getattr(request, _ERRORS_ATTR, {})
+
+
+def max_bytes_for(field_name):
+    return settings.IMAGE_UPLOAD_FIELD_MAX_BYTES.get(field_name, settings.IMAGE_UPLOAD_MAX_BYTES)
+
+
+# All file fields of the gardening forms are images, so every uploaded file is treated as one
+class BoundedImageUploadHandler(TemporaryFileUploadHandler):
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        self.max_bytes = max_bytes_for(field_name)
+        self.received = 0
+        self.header = bytearray()
+        self.header_ok = False
+        if self.content_length and self.content_length > self.max_bytes:
+            self._reject(f'Soubor je větší než {filesizeformat(self.max_bytes)}.')
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > self.max_bytes:
+            self._reject(f'Soubor je větší než {filesizeformat(self.max_bytes)}.')
+        if not self.header_ok:
+            self._check_header(raw_data)
+        self.file.write(raw_data)
+
+    # Called outside the parser's SkipFile handling, so errors are recorded and the file dropped
+    def file_complete(self, file_size):
+        if not self.header_ok:
+            self._discard('Soubor není podporovaný obrázek.')
+            return None
+        uploaded = super().file_complete(file_size)
+        uploaded.flush()
+        try:
+            uploaded.size = normalize_image(uploaded.temporary_file_path())
+        except (OSError, SyntaxError, ValueError, Image.DecompressionBombError):
+            self._discard('Obrázek je poškozený.')
+            return None
+        uploaded.seek(0)
+        return uploaded
+
+    def _check_header(self, raw_data):
+        self.header += raw_data[:HEADER_PROBE_BYTES - len(self.header)]
+        try:
+            image_format, size = read_header(bytes(self.header))
+        except Image.DecompressionBombError:
+            self._reject('Obrázek má příliš mnoho pixelů.')
+        if image_format is None:
+            if self.received >= HEADER_PROBE_BYTES:
+                self._reject('Soubor není podporovaný obrázek.')
+            return
+        if image_format not in ALLOWED_FORMATS:
+            self._reject('Podporované formáty jsou JPEG, PNG, GIF a WebP.')
+        width, height = size
+        if width * height > settings.IMAGE_UPLOAD_MAX_PIXELS:
+            self._reject('Obrázek má příliš mnoho pixelů.')
+        self.header_ok = True
+        self.header = None
+
+    def _discard(self, message):
+        errors = getattr(self.request, _ERRORS_ATTR, None)
+        if errors is None:
+            errors = {}
+            setattr(self.request, _ERRORS_ATTR, errors)
+        errors[self.field_name] = message
+        self.file.close()
+
+    def _reject(self, message):
+        self._discard(message)
+        raise SkipFile(message)
+
+
+# (format, (width, height)) from the start of a file, (None, None) until the header is
+# complete. Image.open() only parses the header, no pixel buffer is allocated. Images
+# over Pillow's own limit raise DecompressionBombError.
+def read_header(data):
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+            with Image.open(io.BytesIO(data)) as image:
+                return image.format, image.size
+    except (UnidentifiedImageError, OSError, SyntaxError, ValueError, EOFError):
+        return None, None
+
+
+# Django views that accept image uploads. The upload handlers must be replaced before
+# anything reads request.POST, CsrfViewMiddleware included, so the CSRF check moves
+# into the view as Django's documentation recommends.
+def image_uploads(view_func):
+    protected = csrf_protect(view_func)
+
+    @csrf_exempt
+    @wraps(view_func)
+    def _wrapped(request, *args, **kwargs):
+        request.upload_handlers = [BoundedImageUploadHandler(request)]
+        return protected(request, *args, **kwargs)
+    return _wrapped
+
+
+# Rotates by EXIF orientation, drops EXIF (GPS included) and downscales oversized originals.
+# Runs once at ingest so nothing reading the stored file has to repeat it. Returns the new size.
+def normalize_image(path):
+    with Image.open(path) as original:
+        # The upload limit, Pillow's process-wide MAX_IMAGE_PIXELS stays as it is
+        if original.width * original.height > settings.IMAGE_UPLOAD_MAX_PIXELS:
+            raise Image.DecompressionBombError('Image has too many pixels')
+        # An MPO is stored as a plain JPEG of its first picture
+        is_mpo = original.format == 'MPO'
+        if getattr(original, 'is_animated', False) and not is_mpo:
+            return os.path.getsize(path)
+        limit = settings.IMAGE_UPLOAD_MAX_DIMENSION
+        has_exif = bool(original.getexif())
+        if not has_exif and max(original.size) <= limit and not is_mpo:
+            return os.path.getsize(path)
+        image_format = 'JPEG' if is_mpo else original.format
+        original.load()
+        image = ImageOps.exif_transpose(original)
+        image.thumbnail((limit, limit), Image.Resampling.LANCZOS)
+        options = {'quality': 90, 'optimize': True} if image_format in ('JPEG', 'WEBP') else {}
+        image.save(path, image_format, **options)
+    return os.path.getsize(path)
@@ -1,9 +1,19 @@
 from django.contrib.auth import login, authenticate, logout
 from django.shortcuts import render, redirect, get_object_or_404
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_safe
 from gardening.forms import RegisterForm, GardenForm, PlantForm, PlantType, NoteForm
-from gardening.models import Garden, Plant, Note, AIRecommendation
+from gardening.models import Garden, Plant, Note, PLANT_PREVIEW_SIZE
+from gardening.access import garden_access_required, get_garden_access, get_plant_access
+from gardening.conditional import conditional_page, garden_last_modified, plant_last_modified
+from gardening.pagination import keyset_page, page_url
+from gardening.jobs import enqueue_recommendation
+from gardening.uploads import get_upload_errors, image_uploads
+from gardening.search import search
+from gardening import caching, deletion, guests, media, metrics, plant_types, transfer
+from gardening.activity import garden_activity
 from django.contrib.auth.decorators import login_required
-from django.utils import timezone
 
 def index(request):
     return render(request, 'index.html')
@@ -36,97 +46,152 @@ def logout_view(request):
     logout(request)
     return redirect('login')
 
+GARDENS_PAGE_SIZE = 20
+
+# Owned and shared gardens are two separate SQL queries, each paginated on (name, id).
+# Pages are cached per user version and stay valid while none of their gardens changes.
+def _garden_listing(request, preview_size=PLANT_PREVIEW_SIZE):
+    user = request.user
+    version = caching.user_version(user.pk)
+    listings = {}
+    garden_ids = []
+    for key, queryset in (
+        ('my', Garden.objects.owned_by(user)),
+        ('shared', Garden.objects.shared_with(user)),
+    ):
+        param = f'{key}_after'
+        cursor = request.GET.get(param)
+        page = caching.cached(
+            f'{key}_gardens', version, (user.pk, preview_size, cursor),
+            lambda: keyset_page(queryset.for_listing(preview_size), ('name', 'id'), cursor, GARDENS_PAGE_SIZE),
+            depends_on=lambda page: [garden.pk for garden in page],
+        )
+        garden_ids.extend(garden.pk for garden in page)
+        listings[f'{key}_gardens'] = page
+        listings[f'{key}_next_url'] = page_url(request, param, page.next_cursor) if page.has_next else None
+    garden_versions = caching.get_versions(caching.GARDEN, garden_ids)
+    listings.update(caching.fragment_context(caching.versions_token(version, sorted(garden_versions.items()))))
+    return listings
+
 @login_required
 def dashboard_view(request):
-    my_gardens = Garden.objects.filter(owner=request.user)
-    shared_gardens = Garden.objects.filter(users_with_access=request.user).exclude(owner=request.user)
-    return render(
-        request,
-        'auth/dashboard.html',
-        {
-            'my_gardens': my_gardens,
-            'shared_gardens': shared_gardens,
-        }
-    )
+    return render(request, 'auth/dashboard.html', _garden_listing(request, preview_size=0))
 
 @login_required
 def gardens_view(request):
-    gardens = Garden.objects.filter(owner=request.user) | Garden.objects.filter(users_with_access=request.user)
-    gardens = gardens.distinct()
-    return render(request, 'gardens/gardens.html', {'gardens': gardens})
+    return render(request, 'gardens/gardens.html', _garden_listing(request))
 
-@login_required
+PLANTS_PAGE_SIZE = 50
+NOTES_PAGE_SIZE = 20
+
+@garden_access_required
+@conditional_page(garden_last_modified)
+@image_uploads
 def garden_detail_view(request, garden_id):
-    garden = get_object_or_404(Garden, id=garden_id)
-    if not (garden.owner == request.user or request.user in garden.users_with_access.all()):
-        return redirect('dashboard')
+    access = get_garden_access(request, garden_id)
+    garden = access.garden
     plants = Plant.objects.filter(garden=garden)
-    can_edit = garden.owner == request.user or request.user in garden.users_with_access.all()
-    can_edit_users = garden.owner == request.user
+    can_edit = access.can_edit
+    can_edit_users = access.is_owner
+    # Everything read below is cached under the garden version, any change in the garden bumps it
+    version = caching.garden_version(garden.pk)
 
-    # Get selected plant
+    # Plant sidebar is paginated on (name, id)
+    plants_after = request.GET.get('plants_after')
+    plant_page = caching.cached('plants', version, (garden.pk, plants_after), lambda: keyset_page(
+        plants.only('id', 'name', 'garden_id'), ('name', 'id'), plants_after, PLANTS_PAGE_SIZE,
+    ))
+
+    # Get selected plant, the first plant of the garden when none is requested
     selected_plant_id = request.GET.get('plant')
-    selected_plant = None
+
+    def load_selected_plant():
+        selected = plants.with_latest_recommendation()
+        if selected_plant_id:
+            return selected.filter(id=selected_plant_id).first()
+        return selected.order_by('name', 'id').first()
+
+    selected_plant = caching.cached('selected_plant', version, (garden.pk, selected_plant_id), load_selected_plant)
+
     notes = []
+    notes_next_url = None
     ai_recommendation = None
-    if selected_plant_id:
-        selected_plant = plants.filter(id=selected_plant_id).first()
-        if selected_plant:
-            notes = Note.objects.filter(plant=selected_plant).order_by('-date')
-            ai_recommendation = AIRecommendation.objects.filter(plant=selected_plant).order_by('-created_at').first()
-    else:
-        selected_plant = plants.first()
-        if selected_plant:
-            notes = Note.objects.filter(plant=selected_plant).order_by('-date')
-            ai_recommendation = AIRecommendation.objects.filter(plant=selected_plant).order_by('-created_at').first()
+    if selected_plant:
+        # Newest notes first, "load older notes" continues after the last (date, id)
+        notes_after = request.GET.get('notes_after')
+        notes = caching.cached('notes', version, (selected_plant.pk, notes_after), lambda: keyset_page(
+            Note.objects.filter(plant=selected_plant), ('date', 'id'), notes_after, NOTES_PAGE_SIZE, descending=True,
+        ))
+        if notes.has_next:
+            notes_next_url = page_url(request, 'notes_after', notes.next_cursor)
+        ai_recommendation = selected_plant.latest_recommendation
 
-    # Handle AI recommendation generation
+    # Handle AI recommendation generation, the worker picks the job up from the queue
     if request.method == 'POST' and 'generate_ai' in request.POST and selected_plant:
-        # Replace this with your real AI logic
-        recommendation_text = f"AI Suggestion for {selected_plant.name}: Water regularly and check for pests. (This is a placeholder recommendation. I don't have a paid API key for AI services. And I don't think that sharing it in this repo is a good idea.)"
-        ai_recommendation = AIRecommendation.objects.create(
-            plant=selected_plant,
-            recommendation=recommendation_text,
-            created_at=timezone.now()
-        )
+        enqueue_recommendation(selected_plant, request.user)
+        return redirect(f"{request.path}?plant={selected_plant.id}")
 
     # Handle note form
     if request.method == 'POST' and 'add_note' in request.POST:
-        note_form = NoteForm(request.POST, request.FILES)
+        note_form = NoteForm(request.POST, request.FILES, upload_errors=get_upload_errors(request))
+        # Validation only looks up the submitted ids within this garden
         note_form.fields['plant'].queryset = plants
         if note_form.is_valid():
             note = note_form.save()
             return redirect(f"{request.path}?plant={selected_plant.id}")
     else:
         note_form = NoteForm()
-        note_form.fields['plant'].queryset = plants
+    # Checkboxes are rendered for the current sidebar page only, not the whole garden
+    note_form.fields['plant'].widget.choices = [(plant.pk, plant.name) for plant in plant_page]
 
     return render(request, 'gardens/garden_detail.html', {
         'garden': garden,
-        'plants': plants,
+        'plants': plant_page,
+        'plants_next_url': page_url(request, 'plants_after', plant_page.next_cursor) if plant_page.has_next else None,
+        'notes_next_url': notes_next_url,
         'can_edit': can_edit,
         'can_edit_users': can_edit_users,
         'notes': notes,
         'note_form': note_form,
         'selected_plant': selected_plant,
         'ai_recommendation': ai_recommendation,
+        'recommendation_pending': selected_plant is not None and selected_plant.has_pending_job,
+        **caching.fragment_context(version),
     })
     
-@login_required
+ACTIVITY_PAGE_SIZE = 30
+
+# Notes and recommendations of all plants in the garden, newest first
+@garden_access_required
+@conditional_page(garden_last_modified)
+def garden_activity_view(request, garden_id):
+    garden = get_garden_access(request, garden_id).garden
+    after = request.GET.get('after')
+    entries = caching.cached('activity', caching.garden_version(garden.pk), (garden.pk, after), lambda: garden_activity(
+        garden.pk, after, ACTIVITY_PAGE_SIZE,
+    ))
+    return render(request, 'gardens/garden_activity.html', {
+        'garden': garden,
+        'entries': entries,
+        'next_url': page_url(request, 'after', entries.next_cursor) if entries.has_next else None,
+    })
+
+@garden_access_required
 def garden_delete_view(request, garden_id):
-    garden = get_object_or_404(Garden, id=garden_id)
-    if not (garden.owner == request.user or request.user in garden.users_with_access.all()):
-        return redirect('dashboard')
+    access = get_garden_access(request, garden_id)
+    garden = access.garden
     # Only owner can delete
-    if request.method == 'POST' and garden.owner == request.user:
-        garden.delete()
+    if request.method == 'POST' and access.is_owner:
+        # Hidden at once, its plants and notes are purged in the background
+        deletion.delete_garden(garden)
         return redirect('dashboard')
     return render(request, 'gardens/garden_confirm_delete.html', {'garden': garden})
 
 @login_required
+@image_uploads
 def garden_add_view(request):
     if request.method == 'POST':
-        form = GardenForm(request.POST, request.FILES, user=request.user)
+        form = GardenForm(request.POST, request.FILES, user=request.user, upload_errors=get_upload_errors(request))
         if form.is_valid():
             garden = form.save(commit=False)
             garden.owner = request.user
@@ -137,12 +202,38 @@ def garden_add_view(request):
         form = GardenForm(user=request.user)
     return render(request, 'gardens/garden_form.html', {'form': form, 'garden': None, 'can_edit_users': True})
 
-@login_required
+EXPORT_FORMATS = {
+    'jsonl': (transfer.iter_jsonl, 'application/x-ndjson; charset=utf-8'),
+    'csv': (transfer.iter_csv, 'text/csv; charset=utf-8'),
+}
+
+# Streamed download, memory stays flat regardless of the garden size
+@garden_access_required
+def garden_export_view(request, garden_id):
+    access = get_garden_access(request, garden_id)
+    garden = access.garden
+    gardens = Garden.objects.filter(pk=garden.pk)
+    # Only the owner gets the guest list
+    guests = access.is_owner
+    export_format = request.GET.get('format', 'jsonl')
+    if export_format == 'tar':
+        response = StreamingHttpResponse(transfer.iter_tar(gardens, guests), content_type='application/x-tar')
+    else:
+        if export_format not in EXPORT_FORMATS:
+            export_format = 'jsonl'
+        chunks, content_type = EXPORT_FORMATS[export_format]
+        response = StreamingHttpResponse(chunks(transfer.iter_records(gardens, guests)), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{transfer.export_filename(garden, export_format)}"'
+    return response
+
+@garden_access_required
+@image_uploads
 def garden_edit_view(request, garden_id):
-    garden = get_object_or_404(Garden, id=garden_id)
-    can_edit_users = garden.owner == request.user
+    access = get_garden_access(request, garden_id)
+    garden = access.garden
+    can_edit_users = access.is_owner
     if request.method == 'POST':
-        form = GardenForm(request.POST, request.FILES, instance=garden, user=request.user)
+        form = GardenForm(request.POST, request.FILES, instance=garden, user=request.user, upload_errors=get_upload_errors(request))
         if not can_edit_users:
             form.fields.pop('users_with_access')
         if form.is_valid():
@@ -154,13 +245,12 @@ def garden_edit_view(request, garden_id):
             form.fields['users_with_access'].disabled = True
     return render(request, 'gardens/garden_form.html', {'form': form, 'garden': garden, 'can_edit_users': can_edit_users})
 
-@login_required
+@garden_access_required
+@image_uploads
 def plant_add_view(request, garden_id):
-    garden = get_object_or_404(Garden, id=garden_id)
-    if not (garden.owner == request.user or request.user in garden.users_with_access.all()):
-        return redirect('dashboard')
+    garden = get_garden_access(request, garden_id).garden
     if request.method == 'POST':
-        form = PlantForm(request.POST, request.FILES)
+        form = PlantForm(request.POST, request.FILES, upload_errors=get_upload_errors(request))
         if form.is_valid():
             plant = form.save(commit=False)
             plant.garden = garden
@@ -170,14 +260,13 @@ def plant_add_view(request, garden_id):
         form = PlantForm()
     return render(request, 'plants/plant_form.html', {'form': form, 'garden': garden, 'plant': None})
 
-@login_required
+@garden_access_required
+@image_uploads
 def plant_edit_view(request, garden_id, plant_id):
-    garden = get_object_or_404(Garden, id=garden_id)
-    if not (garden.owner == request.user or request.user in garden.users_with_access.all()):
-        return redirect('dashboard')
+    garden = get_garden_access(request, garden_id).garden
     plant = get_object_or_404(Plant, id=plant_id, garden=garden)
     if request.method == 'POST':
-        form = PlantForm(request.POST, request.FILES, instance=plant)
+        form = PlantForm(request.POST, request.FILES, instance=plant, upload_errors=get_upload_errors(request))
         if form.is_valid():
             form.save()
             return redirect('garden_detail', garden_id=garden.id)
@@ -185,14 +274,12 @@ def plant_edit_view(request, garden_id, plant_id):
         form = PlantForm(instance=plant)
     return render(request, 'plants/plant_form.html', {'form': form, 'garden': garden, 'plant': plant})
 
-@login_required
+@garden_access_required
 def plant_delete_view(request, garden_id, plant_id):
-    garden = get_object_or_404(Garden, id=garden_id)
-    if not (garden.owner == request.user or request.user in garden.users_with_access.all()):
-        return redirect('dashboard')
+    garden = get_garden_access(request, garden_id).garden
     plant = get_object_or_404(Plant, id=plant_id, garden=garden)
     if request.method == 'POST':
-        plant.delete()
+        deletion.delete_plant(plant)
         return redirect('garden_detail', garden_id=garden.id)
     return render(request, 'plants/plant_confirm_delete.html', {'plant': plant, 'garden': garden})
 
@@ -201,9 +288,25 @@ def plant_type_add_view(request):
     if request.method == 'POST':
         name = request.POST.get('name', '').strip()
         if name:
-            PlantType.objects.get_or_create(name=name)
+            # "rajcata" does not create a second "Rajčata"
+            plant_types.get_or_create(name)
             return redirect('plant_type_list')
-    return render(request, 'plants/plant_type_form.html')
+    return render(request, 'plants/plants_type_form.html')
+
+@login_required
+def plant_type_autocomplete_view(request):
+    suggestions = plant_types.index.suggest(request.GET.get('q', ''))
+    response = JsonResponse({'results': [{'id': pk, 'name': name} for pk, name in suggestions]})
+    response['Cache-Control'] = 'private, max-age=60'
+    return response
+
+# Guest picker of the garden form, prefix of username or a whole e-mail
+@login_required
+def user_autocomplete_view(request):
+    suggestions = guests.suggest(request.GET.get('q', ''), request.user)
+    response = JsonResponse({'results': [{'id': pk, 'username': username} for pk, username in suggestions]})
+    response['Cache-Control'] = 'private, max-age=60'
+    return response
 
 @login_required
 def plant_type_list_view(request):
@@ -219,13 +322,47 @@ def plant_type_delete_view(request, type_id):
     return render(request, 'plants/plant_type_confirm_delete.html', {'plant_type': plant_type})
 
 @login_required
+@conditional_page(plant_last_modified)
 def plant_recommendations_view(request, plant_id):
-    plant = get_object_or_404(Plant, id=plant_id)
+    plant, access = get_plant_access(request, plant_id)
     # Permission check: user must have access to the garden
-    if not (plant.garden.owner == request.user or request.user in plant.garden.users_with_access.all()):
+    if not access.can_view:
         return redirect('dashboard')
     recommendations = plant.recommendations.all().order_by('-created_at')
     return render(request, 'plants/plant_recommendations.html', {
         'plant': plant,
         'recommendations': recommendations,
-    })
\ No newline at end of file
+    })
+
+SEARCH_PAGE_SIZE = 20
+
+@login_required
+def search_view(request):
+    query = request.GET.get('q', '').strip()
+    try:
+        page = max(1, int(request.GET.get('page', 1)))
+    except ValueError:
+        page = 1
+    results, has_next = search(request.user, query, page, SEARCH_PAGE_SIZE)
+    return render(request, 'search/search.html', {
+        'query': query,
+        'results': results,
+        'page': page,
+        'has_next': has_next,
+    })
+
+# Prometheus scrape endpoint, numbers are per process
+def metrics_view(request):
+    allowed = settings.METRICS_ALLOWED_IPS
+    if allowed is not None and request.META.get('REMOTE_ADDR') not in allowed:
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# Uploaded images for users who can view a garden the image belongs to, everyone
+# else gets 404 like for a missing file
+@require_safe
+def media_view(request, name):
+    if not media.can_view(request.user, name):
+        raise Http404('No image matches the given query.')
+    return media.serve(request, name)